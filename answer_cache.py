@@ -0,0 +1,203 @@
+"""Semantic answer cache keyed on query embeddings.
+
+Previously answered queries are kept in a small FAISS index. A new query
+whose embedding is at least `threshold` cosine-similar to a cached one
+gets the stored answer and sources instead of a fresh LLM generation.
+Entries expire after `ttl` seconds, the least recently used entry is
+evicted once `max_size` is reached, and the whole cache is dropped when
+the main index it was built against changes. With `meta_path`, each lookup
+checks whether the index spec file was rewritten (by 06_build_faiss_index.py
+or 09_incremental_update.py) with a new build time, so a running server
+stops serving answers from before an index update.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL
+from chunk_store import fetch_chunks
+from metrics import ANSWER_CACHE
+from vector_index import load_index_meta
+
+
+class AnswerCache:
+    def __init__(self, dimension, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_size=ANSWER_CACHE_SIZE, index_version=None, meta_path=None):
+        self.dimension = dimension
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.index_version = index_version
+        self.meta_path = meta_path
+        self._meta_mtime = None
+
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self._entries = OrderedDict()  # id -> entry, least recently used first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, embedding):
+        """Return the cached entry for a similar enough query, or None"""
+        query = np.asarray(embedding, dtype='float32').reshape(1, -1)
+        self.refresh_index_version()
+
+        with self._lock:
+            if self._entries:
+                similarities, ids = self._index.search(query, 1)
+                entry_id = int(ids[0][0])
+                if entry_id >= 0 and similarities[0][0] >= self.threshold:
+                    entry = self._entries[entry_id]
+                    if time.time() - entry['created'] <= self.ttl:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        ANSWER_CACHE.inc(result='hit')
+                        return dict(entry, similarity=float(similarities[0][0]))
+
+                    self._remove(entry_id)
+                    self.expirations += 1
+
+            self.misses += 1
+            ANSWER_CACHE.inc(result='miss')
+            return None
+
+    def store(self, query, embedding, response, sources, created=None):
+        """Cache an answer; evicts the least recently used entry when full"""
+        vector = np.asarray(embedding, dtype='float32').reshape(1, -1)
+
+        with self._lock:
+            while len(self._entries) >= self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = {
+                'query': query,
+                'response': response,
+                'sources': sources,
+                'created': created if created is not None else time.time()
+            }
+
+    def _remove(self, entry_id):
+        self._index.remove_ids(np.array([entry_id], dtype='int64'))
+        del self._entries[entry_id]
+
+    def invalidate(self, index_version=None):
+        """Drop every entry, e.g. after the main index was rebuilt"""
+        with self._lock:
+            self._index.reset()
+            self._entries.clear()
+            self.index_version = index_version
+            self.invalidations += 1
+
+    def check_index_version(self, index_version):
+        """Invalidate if answers were cached against a different main index"""
+        if index_version != self.index_version:
+            self.invalidate(index_version)
+
+    def refresh_index_version(self):
+        """Re-read the build time from `meta_path` when the file changed, invalidating if it is new"""
+        if self.meta_path is None:
+            return
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+            if mtime == self._meta_mtime:
+                return
+            index_version = load_index_meta(self.meta_path).get('built_at')
+        except (OSError, ValueError):
+            # Missing, or caught mid-write; try again on the next lookup
+            return
+        self._meta_mtime = mtime
+        self.check_index_version(index_version)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+
+def warm_from_queries(cache, model, conn, limit, since=None):
+    """Fill the cache from the most recent answered queries in the queries table.
+
+    Only queries logged after `since` (the main index build time) are used,
+    so answers retrieved from an older index are never served. Returns the
+    number of entries added.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT ON (user_query_text)
+            query_id, user_query_text, response_text,
+            EXTRACT(EPOCH FROM LOCALTIMESTAMP - query_timestamp) AS age_seconds
+        FROM queries
+        WHERE response_text IS NOT NULL
+          AND response_text NOT LIKE 'Error%%'
+          AND query_timestamp >= COALESCE(%s::timestamp, '-infinity')
+          AND query_timestamp >= LOCALTIMESTAMP - %s * INTERVAL '1 second'
+        ORDER BY user_query_text, query_timestamp DESC
+    """, (since, cache.ttl))
+    rows = sorted(cursor.fetchall(), key=lambda r: r[3])[:limit]
+    if not rows:
+        cursor.close()
+        return 0
+
+    query_ids = [r[0] for r in rows]
+    cursor.execute("""
+        SELECT query_id, chunk_id, similarity_score, retrieval_rank
+        FROM retrieval_logs
+        WHERE query_id = ANY(%s)
+        ORDER BY query_id, retrieval_rank
+    """, (query_ids,))
+    logs = cursor.fetchall()
+    cursor.close()
+
+    chunks = fetch_chunks(conn, [log[1] for log in logs])
+    sources = {}
+    for (query_id, _, similarity, rank), chunk in zip(logs, chunks):
+        if chunk:
+            sources.setdefault(query_id, []).append({
+                'rank': rank,
+                'similarity': similarity,
+                'chunk_id': chunk['chunk_id'],
+                'chunk_text': chunk['chunk_text'],
+                'document_id': chunk['document_id'],
+                'title': chunk['title'],
+                'authors': chunk['authors'],
+                'categories': chunk['categories']
+            })
+
+    rows = [r for r in rows if r[0] in sources]
+    if not rows:
+        return 0
+
+    embeddings = model.encode([r[1] for r in rows], show_progress_bar=False).astype('float32')
+    faiss.normalize_L2(embeddings)
+
+    # Store oldest first so the most recent queries are the last to be evicted
+    now = time.time()
+    for row, embedding in reversed(list(zip(rows, embeddings))):
+        cache.store(row[1], embedding, row[2], sources[row[0]], created=now - float(row[3]))
+    return len(rows)
@@ -1,98 +1,386 @@
-from flask import Flask, render_template, request, jsonify
-import sys
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import os
 import time
-import psycopg2
 import numpy as np
 import faiss
-import pickle
 from sentence_transformers import SentenceTransformer
-import requests
 import json
+import atexit
+import threading
+
+from chunk_store import load_chunk_store, fetch_chunks
+from db import get_pool
+from batch_encoder import BatchingEncoder
+from chunk_filters import filtered_search_for, parse_filters
+from vector_index import load_index, load_chunk_ids, open_embeddings, make_searcher
+from answer_cache import AnswerCache, warm_from_queries
+import embedding_cache
+from context_packing import ContextPacker
+from batch_qa import parse_questions, answer_batch
+from config import EMBEDDING_MODEL, FAISS_INDEX_META_PATH, ANSWER_CACHE_WARM, EMBEDDING_CACHE_WARM, EMBEDDING_CACHE_PATH, INDEX_MMAP, STARTUP_WARMUP, APP_EAGER_LOAD, OLLAMA_RETRY_AFTER
+from startup import StartupTimer, warm_up, WARMUP_QUERY
+from query_log import get_query_log, close_query_log
+from metrics import stage, observe_stage, render as render_metrics, CONTENT_TYPE, REQUESTS, ERRORS
+import ollama_client
 
 app = Flask(__name__)
 
+# Write out queued query logs when the server stops
+atexit.register(close_query_log)
+
 # Initialize retrieval system
 class SimpleRetriever:
-    def __init__(self):
+    def __init__(self, timer=None, start=True):
         print("Loading retrieval system...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.index = faiss.read_index('data/processed/faiss_index.bin')
+        self.startup = timer or StartupTimer()
+        with self.startup.phase('model'):
+            self.model = SentenceTransformer(EMBEDDING_MODEL)
         
-        with open('data/processed/chunk_ids.pkl', 'rb') as f:
-            self.chunk_ids = pickle.load(f)
+        # Embeddings of past queries, saved at the last shutdown; loaded
+        # before a fork, so workers share the pages until they add entries
+        with self.startup.phase('embedding_cache'):
+            self.query_cache = embedding_cache.load_embedding_cache(self.model)
         
-        self.conn = psycopg2.connect(
-            host="localhost",
-            database="rag_chatbot_db"
-        )
-        print("System ready!")
+        # Memory-mapped index and chunk ids load in milliseconds; pages are
+        # read on first use and shared with other processes
+        with self.startup.phase('index'):
+            self.index, self.index_meta = load_index(mmap=INDEX_MMAP)
+        
+        with self.startup.phase('chunk_ids'):
+            self.chunk_ids = load_chunk_ids(mmap=INDEX_MMAP)
+        
+        with self.startup.phase('chunk_store'):
+            self.store = load_chunk_store(self.chunk_ids)
+        
+        # Float32 vectors stay on disk; compressed indexes re-rank their
+        # candidates from them and small filtered searches score them exactly
+        self.embeddings = open_embeddings(len(self.chunk_ids))
+        self.searcher = make_searcher(self.index, self.index_meta, self.embeddings)
+        
+        # Prompt context within a token budget, without duplicate or overlapping text
+        self.packer = ContextPacker(self.model.tokenizer, self.embeddings)
+        
+        self.encoder = None
+        if start:
+            self.start()
     
-    def search(self, query, top_k=3):
-        query_embedding = self.model.encode([query]).astype('float32')
-        faiss.normalize_L2(query_embedding)
+    @property
+    def pool(self):
+        # Connected on first use, so hydrating from the chunk store does not
+        # need the database and no connection is opened before a fork
+        return get_pool()
+    
+    def start(self):
+        """Start the per-process parts: filtered search, the batching thread and warmup.
+        
+        serve.py calls this in each worker after forking, since threads
+        do not survive a fork.
+        """
+        # Category/date filters are applied inside the vector search
+        self.filtered = filtered_search_for(self.searcher, self.index_meta, self.chunk_ids,
+                                            self.store, self.embeddings)
+        
+        # Frequent past questions skip the model from the first request
+        if self.query_cache is not None and EMBEDDING_CACHE_WARM:
+            with self.startup.phase('embedding_cache_warm'):
+                try:
+                    with self.pool.connection() as conn:
+                        warmed = embedding_cache.warm_from_queries(self.query_cache, self.model, conn,
+                                                                   EMBEDDING_CACHE_WARM)
+                    print(f"Query embedding cache warmed with {warmed} queries")
+                except Exception as e:
+                    print(f"Query embedding cache warmup failed: {e}")
         
-        distances, indices = self.index.search(query_embedding, top_k)
+        # Concurrent requests share one encode + search call
+        self.encoder = BatchingEncoder(self.model, self.searcher, self.filtered, cache=self.query_cache)
         
+        if STARTUP_WARMUP:
+            with self.startup.phase('warmup'):
+                warm_up(self)
+        print("System ready!")
+    
+    def warm_shared(self):
+        """Run the model and touch the index once, without starting threads"""
+        with self.startup.phase('shared_warmup'):
+            embedding = self.model.encode([WARMUP_QUERY], show_progress_bar=False)
+            embedding = np.ascontiguousarray(embedding, dtype='float32')
+            faiss.normalize_L2(embedding)
+            self.searcher.search(embedding, 5)
+    
+    def search(self, query, top_k=3, filters=None, timings=None):
+        _, distances, indices = self.encoder.encode_and_search(query, top_k, filters, timings)
+        return self.hydrate(distances, indices, timings)
+    
+    def hydrate(self, distances, indices, timings=None):
+        positions = [pos for pos in indices[0] if pos >= 0]
+        with stage('hydrate', timings):
+            if self.store is not None:
+                rows = self.store.get_many(positions)
+            else:
+                with self.pool.connection() as conn:
+                    rows = fetch_chunks(conn, [self.chunk_ids[pos] for pos in positions])
+        return self.to_results(distances, positions, rows)
+    
+    def to_results(self, distances, positions, rows):
+        """Search hits and their chunk rows as result dicts, ranked"""
         results = []
-        cursor = self.conn.cursor()
-        
-        for idx, (distance, index_pos) in enumerate(zip(distances[0], indices[0])):
-            chunk_id = self.chunk_ids[index_pos]
-            
-            cursor.execute("""
-                SELECT dc.chunk_text, dc.document_id, d.title, d.authors, d.categories
-                FROM document_chunks dc
-                JOIN documents d ON dc.document_id = d.document_id
-                WHERE dc.chunk_id = %s
-            """, (chunk_id,))
-            
-            row = cursor.fetchone()
+        for distance, position, row in zip(distances[0], positions, rows):
             if row:
                 results.append({
-                    'rank': idx + 1,
+                    'rank': len(results) + 1,
                     'similarity': float(distance),
-                    'chunk_text': row[0],
-                    'document_id': row[1],
-                    'title': row[2],
-                    'authors': row[3],
-                    'categories': row[4]
+                    'position': int(position),
+                    'chunk_id': row['chunk_id'],
+                    'chunk_text': row['chunk_text'],
+                    'document_id': row['document_id'],
+                    'title': row['title'],
+                    'authors': row['authors'],
+                    'categories': row['categories']
                 })
         
-        cursor.close()
         return results
 
 # Initialize
 retriever = None
+retriever_lock = threading.Lock()
+startup_timer = StartupTimer()
+startup_error = None
 
 def get_retriever():
     global retriever
     if retriever is None:
-        retriever = SimpleRetriever()
+        # Requests arriving during startup wait for the one load in progress
+        with retriever_lock:
+            if retriever is None:
+                retriever = SimpleRetriever(startup_timer)
     return retriever
 
+def save_embedding_cache():
+    """Save query embeddings added since startup, so the next start has them"""
+    if retriever is not None and retriever.query_cache is not None and EMBEDDING_CACHE_PATH:
+        try:
+            if retriever.query_cache.save(EMBEDDING_CACHE_PATH):
+                print(f"Saved {len(retriever.query_cache)} query embeddings")
+        except OSError as e:
+            print(f"Could not save the query embedding cache: {e}")
+
+atexit.register(save_embedding_cache)
+
+def load_in_background():
+    """Load the retriever and answer cache before the first request needs them"""
+    def load():
+        global startup_error
+        try:
+            get_retriever()
+            with startup_timer.phase('answer_cache'):
+                get_answer_cache()
+            startup_timer.finish()
+        except Exception as e:
+            startup_error = str(e)
+            print(f"Startup failed: {e}")
+    threading.Thread(target=load, name='startup', daemon=True).start()
+
+def preload():
+    """Load what pre-forked workers share (model, index, chunk ids, store) in the master"""
+    global retriever
+    retriever = SimpleRetriever(startup_timer, start=False)
+    retriever.warm_shared()
+
+def start_worker():
+    """Finish startup in a forked worker: threads, connections and the answer cache"""
+    get_retriever().start()
+    with startup_timer.phase('answer_cache'):
+        get_answer_cache()
+    startup_timer.finish()
+
+answer_cache = None
+
+def get_answer_cache():
+    global answer_cache
+    ret = get_retriever()
+    index_version = ret.index_meta.get('built_at')
+    if answer_cache is None:
+        answer_cache = AnswerCache(ret.index.d, index_version=index_version,
+                                   meta_path=FAISS_INDEX_META_PATH)
+        if ANSWER_CACHE_WARM:
+            try:
+                with ret.pool.connection() as conn:
+                    warmed = warm_from_queries(answer_cache, ret.model, conn,
+                                               ANSWER_CACHE_WARM, since=index_version)
+                print(f"Answer cache warmed with {warmed} queries")
+            except Exception as e:
+                print(f"Answer cache warmup failed: {e}")
+    return answer_cache
+
 def call_ollama(prompt):
-    payload = {
-        "model": "mistral:latest",
-        "prompt": prompt,
-        "stream": False
-    }
+    try:
+        return ollama_client.generate(prompt)
+    except ollama_client.OllamaBusy:
+        # Turned away before generating; /ask answers 503
+        raise
+    except Exception as e:
+        ERRORS.inc(source='llm')
+        return f"Error: {str(e)}"
+
+def llm_busy(message):
+    """503 telling the client when to retry"""
+    return jsonify({'error': message}), 503, {'Retry-After': str(OLLAMA_RETRY_AFTER)}
+
+def build_prompt(query, results):
+    context_parts = []
+    for i, result in enumerate(results, 1):
+        context_parts.append(
+            f"[Paper {i}]\n"
+            f"Title: {result['title']}\n"
+            f"Content: {result['chunk_text']}\n"
+        )
+    context = "\n".join(context_parts)
     
+    return f"""You are a helpful research assistant. Answer based on these papers.
+
+{context}
+
+Question: {query}
+
+Instructions:
+- Answer based only on the provided papers
+- Cite which papers you use
+- Be concise and accurate
+
+Answer:"""
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def ms_since(start):
+    return int((time.perf_counter() - start) * 1000)
+
+def stream_answer(query, filters=None):
+    """Server-Sent Events: sources first, then tokens, then timings"""
+    start_time = time.perf_counter()
+    timings = {}
     try:
-        response = requests.post("http://localhost:11434/api/generate", json=payload)
-        if response.status_code == 200:
-            return response.json()['response']
+        ret = get_retriever()
+        cache = get_answer_cache()
+        
+        query_embedding, distances, indices = ret.encoder.encode_and_search(query, 3, filters, timings)
+        # Cached answers were not retrieved under these filters
+        cached = cache.lookup(query_embedding) if filters is None else None
+        results = cached['sources'] if cached else ret.hydrate(distances, indices, timings)
+        retrieval_time = ms_since(start_time)
+        
+        yield sse_event('sources', {
+            'query': query,
+            'sources': results,
+            'retrieval_time': retrieval_time,
+            'cached': cached is not None
+        })
+        
+        generation_start = time.perf_counter()
+        first_token_time = None
+        if cached:
+            first_token_time = 0
+            yield sse_event('token', {'token': cached['response']})
         else:
-            return f"Error: Status {response.status_code}"
+            with stage('context', timings):
+                passages, _ = ret.packer.pack(results)
+                prompt = build_prompt(query, passages)
+            tokens = []
+            for token in ollama_client.stream_generate(prompt):
+                if first_token_time is None:
+                    observe_stage('llm_first_token', time.perf_counter() - generation_start, timings)
+                    first_token_time = ms_since(generation_start)
+                tokens.append(token)
+                yield sse_event('token', {'token': token})
+            observe_stage('llm_total', time.perf_counter() - generation_start, timings)
+            if filters is None:
+                cache.store(query, query_embedding, ''.join(tokens), results)
+        generation_time = ms_since(generation_start)
+        total_time = ms_since(start_time)
+        
+        response_text = cached['response'] if cached else ''.join(tokens)
+        with stage('log', timings):
+            get_query_log().log(query, response_text, results,
+                                retrieval_time, generation_time, total_time)
+        observe_stage('total', time.perf_counter() - start_time, timings)
+        
+        yield sse_event('done', {
+            'retrieval_time': retrieval_time,
+            'time_to_first_token': first_token_time,
+            'generation_time': generation_time,
+            'total_time': total_time,
+            'timings': timings
+        })
+    except ollama_client.OllamaBusy as e:
+        yield sse_event('error', {'error': str(e), 'busy': True})
     except Exception as e:
-        return f"Error: {str(e)}"
+        ERRORS.inc(source='stream')
+        yield sse_event('error', {'error': str(e)})
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the model, index and caches are loaded and warm"""
+    if startup_error:
+        return jsonify({'ready': False, 'error': startup_error}), 500
+    if retriever is None or answer_cache is None:
+        return jsonify({'ready': False, 'phase': startup_timer.current,
+                        'startup': startup_timer.stats()}), 503
+    return jsonify({'ready': True, 'startup': startup_timer.stats()})
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'startup': startup_timer.stats(),
+        'db_pool': get_pool().stats(),
+        'embedding_batches': get_retriever().encoder.stats(),
+        'embedding_cache': get_retriever().query_cache.stats() if get_retriever().query_cache else None,
+        'filtered_search': get_retriever().filtered.stats(),
+        'answer_cache': get_answer_cache().stats(),
+        'query_log': get_query_log().stats(),
+        'llm': ollama_client.get_client().stats()
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Stage latency histograms and counters in the Prometheus text format"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+@app.route('/search', methods=['POST'])
+def search_chunks():
+    """Retrieval only: the chunks /ask would answer from, without generating or logging"""
+    data = request.json or {}
+    query = data.get('query', '')
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    try:
+        filters = parse_filters(data)
+        top_k = min(max(int(data.get('top_k', 3)), 1), 100)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    
+    REQUESTS.inc(endpoint='/search')
+    start_time = time.perf_counter()
+    timings = {}
+    try:
+        results = get_retriever().search(query, top_k, filters, timings)
+    except Exception as e:
+        ERRORS.inc(source='search')
+        return jsonify({'error': str(e)}), 500
+    observe_stage('total', time.perf_counter() - start_time, timings)
+    return jsonify({
+        'query': query,
+        'sources': results,
+        'retrieval_time': ms_since(start_time),
+        'timings': timings
+    })
+
 @app.route('/ask', methods=['POST'])
 def ask():
+    REQUESTS.inc(endpoint='/ask')
     try:
         data = request.json
         query = data.get('query', '')
@@ -100,49 +388,124 @@ def ask():
         if not query:
             return jsonify({'error': 'No query provided'}), 400
         
-        # Retrieve
-        ret = get_retriever()
-        results = ret.search(query, top_k=3)
-        
-        # Build context
-        context_parts = []
-        for i, result in enumerate(results, 1):
-            context_parts.append(
-                f"[Paper {i}]\n"
-                f"Title: {result['title']}\n"
-                f"Content: {result['chunk_text']}\n"
+        # Optional filters: categories (list or space-separated), date_from, date_to
+        try:
+            filters = parse_filters(data)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter: {e}'}), 400
+        
+        if data.get('stream'):
+            # Once the stream starts the status is 200, so shed load up front
+            if not ollama_client.get_client().accepting():
+                return llm_busy("Ollama busy: request queue is full")
+            return Response(
+                stream_with_context(stream_answer(query, filters)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
             )
-        context = "\n".join(context_parts)
         
-        # Create prompt
-        prompt = f"""You are a helpful research assistant. Answer based on these papers.
-
-{context}
-
-Question: {query}
-
-Instructions:
-- Answer based only on the provided papers
-- Cite which papers you use
-- Be concise and accurate
-
-Answer:"""
+        # Retrieve; timings collects each stage in milliseconds
+        start_time = time.perf_counter()
+        timings = {}
+        ret = get_retriever()
+        cache = get_answer_cache()
+        query_embedding, distances, indices = ret.encoder.encode_and_search(query, 3, filters, timings)
+        
+        # Reuse the answer to a near-identical earlier question (unfiltered only)
+        cached = cache.lookup(query_embedding) if filters is None else None
+        if cached:
+            retrieval_time = ms_since(start_time)
+            with stage('log', timings):
+                get_query_log().log(query, cached['response'], cached['sources'],
+                                    retrieval_time, 0, retrieval_time)
+            observe_stage('total', time.perf_counter() - start_time, timings)
+            return jsonify({
+                'query': query,
+                'response': cached['response'],
+                'sources': cached['sources'],
+                'cached': True,
+                'retrieval_time': retrieval_time,
+                'generation_time': 0,
+                'total_time': ms_since(start_time),
+                'timings': timings
+            })
+        
+        results = ret.hydrate(distances, indices, timings)
+        retrieval_time = ms_since(start_time)
+        
+        # Build context and prompt: deduplicated, merged passages within the token budget
+        with stage('context', timings):
+            passages, packing = ret.packer.pack(results)
+            prompt = build_prompt(query, passages)
         
         # Generate
-        response_text = call_ollama(prompt)
+        generation_start = time.perf_counter()
+        with stage('llm_total', timings):
+            response_text = call_ollama(prompt)
+        generation_time = ms_since(generation_start)
+        if filters is None and not response_text.startswith('Error'):
+            cache.store(query, query_embedding, response_text, results)
+        with stage('log', timings):
+            get_query_log().log(query, response_text, results, retrieval_time, generation_time,
+                                ms_since(start_time))
+        observe_stage('total', time.perf_counter() - start_time, timings)
         
         return jsonify({
             'query': query,
             'response': response_text,
             'sources': results,
-            'retrieval_time': 0,
-            'generation_time': 0,
-            'total_time': 0
+            'cached': False,
+            'context_tokens': packing['tokens'],
+            'retrieval_time': retrieval_time,
+            'generation_time': generation_time,
+            'total_time': ms_since(start_time),
+            'timings': timings
         })
     
+    except ollama_client.OllamaBusy as e:
+        return llm_busy(str(e))
     except Exception as e:
+        ERRORS.inc(source='ask')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/ask_batch', methods=['POST'])
+def ask_batch():
+    """Answer a list of questions; streams one JSON line per answer as it completes.
+    
+    Body: {"questions": ["...", {"id": ..., "query": "..."}], "top_k": 3, "log": false}
+    All questions are encoded, searched and hydrated together, then
+    generated BATCH_LLM_CONCURRENCY at a time.
+    """
+    REQUESTS.inc(endpoint='/ask_batch')
+    data = request.get_json(silent=True) or {}
+    try:
+        questions = parse_questions(data.get('questions'))
+        top_k = min(max(int(data.get('top_k', 3)), 1), 20)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    
+    if not ollama_client.get_client().accepting():
+        return llm_busy("Ollama busy: request queue is full")
+    
+    try:
+        results = answer_batch(get_retriever(), questions, build_prompt, ollama_client.generate, top_k,
+                               query_log=get_query_log() if data.get('log') else None)
+    except Exception as e:
+        ERRORS.inc(source='ask_batch')
+        return jsonify({'error': str(e)}), 500
+    
+    def lines():
+        for result in results:
+            yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+# Development server; for production use serve.py, which pre-forks workers
 if __name__ == '__main__':
     print("Starting Flask app...")
+    # The debug reloader re-runs this file in a child process that serves
+    # requests; only that process loads the model and index
+    if APP_EAGER_LOAD and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        load_in_background()
     app.run(debug=True, port=5000)
\ No newline at end of file
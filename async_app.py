@@ -0,0 +1,393 @@
+"""Async (ASGI) version of the app.py API.
+
+In app.py every request holds a thread while it waits for the database and
+for Ollama. Here a request awaits instead: its encode + FAISS search is
+queued on the batching encoder's thread and awaited as a future, chunk
+store reads run in the default executor, database hydration goes through
+asyncpg and generation through AsyncOllamaClient (aiohttp). A single process
+can then hold hundreds of questions in flight, most of them waiting on the
+LLM. The model, index, answer cache, prompt and query log are app.py's.
+
+    uvicorn async_app:app --port 5000
+    python serve.py --async --workers 4
+"""
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse, FileResponse
+from starlette.routing import Route
+
+import app as rag_app
+from app import build_prompt, ms_since, sse_event
+from batch_qa import parse_questions, prepare_batch, batch_result
+from chunk_filters import parse_filters
+from chunk_store import fetch_chunks_async
+from config import OLLAMA_RETRY_AFTER, BATCH_LLM_CONCURRENCY
+from db import get_async_pool, close_async_pool
+from metrics import stage, observe_stage, render as render_metrics, CONTENT_TYPE, REQUESTS, ERRORS
+from ollama_client import get_async_client, close_async_client, OllamaBusy
+from query_log import get_query_log, close_query_log
+
+INDEX_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html')
+
+
+def loaded():
+    """The retriever and answer cache, or None while app.py is still loading them"""
+    ret = rag_app.retriever
+    if ret is None or ret.encoder is None or rag_app.answer_cache is None:
+        return None
+    return ret, rag_app.answer_cache
+
+
+def not_ready():
+    if rag_app.startup_error:
+        return JSONResponse({'error': rag_app.startup_error}, 500)
+    return JSONResponse({'error': 'Starting up', 'phase': rag_app.startup_timer.current}, 503,
+                        headers={'Retry-After': '1'})
+
+
+def llm_busy(message):
+    return JSONResponse({'error': message}, 503, headers={'Retry-After': str(OLLAMA_RETRY_AFTER)})
+
+
+async def encode_and_search(ret, query, top_k, filters, timings):
+    """Queue the query on the batching encoder and await its batch"""
+    return await asyncio.wrap_future(ret.encoder.submit(query, top_k, filters, timings))
+
+
+async def hydrate(ret, distances, indices, timings):
+    positions = [pos for pos in indices[0] if pos >= 0]
+    with stage('hydrate', timings):
+        if ret.store is not None:
+            # Memory-mapped reads can page-fault; keep them off the event loop
+            rows = await asyncio.get_running_loop().run_in_executor(None, ret.store.get_many, positions)
+        else:
+            pool = await get_async_pool()
+            async with pool.connection() as conn:
+                rows = await fetch_chunks_async(conn, [ret.chunk_ids[pos] for pos in positions])
+    return ret.to_results(distances, positions, rows)
+
+
+async def call_ollama(prompt):
+    try:
+        return await get_async_client().generate(prompt)
+    except OllamaBusy:
+        raise
+    except Exception as e:
+        ERRORS.inc(source='llm')
+        return f"Error: {str(e)}"
+
+
+async def stream_answer(ret, cache, query, filters=None):
+    """Server-Sent Events: sources first, then tokens, then timings"""
+    start_time = time.perf_counter()
+    timings = {}
+    try:
+        query_embedding, distances, indices = await encode_and_search(ret, query, 3, filters, timings)
+        # Cached answers were not retrieved under these filters
+        cached = cache.lookup(query_embedding) if filters is None else None
+        results = cached['sources'] if cached else await hydrate(ret, distances, indices, timings)
+        retrieval_time = ms_since(start_time)
+
+        yield sse_event('sources', {
+            'query': query,
+            'sources': results,
+            'retrieval_time': retrieval_time,
+            'cached': cached is not None
+        })
+
+        generation_start = time.perf_counter()
+        first_token_time = None
+        if cached:
+            first_token_time = 0
+            yield sse_event('token', {'token': cached['response']})
+        else:
+            with stage('context', timings):
+                passages, _ = ret.packer.pack(results)
+                prompt = build_prompt(query, passages)
+            tokens = []
+            async for token in get_async_client().stream_generate(prompt):
+                if first_token_time is None:
+                    observe_stage('llm_first_token', time.perf_counter() - generation_start, timings)
+                    first_token_time = ms_since(generation_start)
+                tokens.append(token)
+                yield sse_event('token', {'token': token})
+            observe_stage('llm_total', time.perf_counter() - generation_start, timings)
+            if filters is None:
+                cache.store(query, query_embedding, ''.join(tokens), results)
+        generation_time = ms_since(generation_start)
+        total_time = ms_since(start_time)
+
+        response_text = cached['response'] if cached else ''.join(tokens)
+        with stage('log', timings):
+            get_query_log().log(query, response_text, results,
+                                retrieval_time, generation_time, total_time)
+        observe_stage('total', time.perf_counter() - start_time, timings)
+
+        yield sse_event('done', {
+            'retrieval_time': retrieval_time,
+            'time_to_first_token': first_token_time,
+            'generation_time': generation_time,
+            'total_time': total_time,
+            'timings': timings
+        })
+    except OllamaBusy as e:
+        yield sse_event('error', {'error': str(e), 'busy': True})
+    except Exception as e:
+        ERRORS.inc(source='stream')
+        yield sse_event('error', {'error': str(e)})
+
+
+async def ask(request):
+    REQUESTS.inc(endpoint='/ask')
+    try:
+        data = await request.json()
+        query = data.get('query', '')
+
+        if not query:
+            return JSONResponse({'error': 'No query provided'}, 400)
+
+        # Optional filters: categories (list or space-separated), date_from, date_to
+        try:
+            filters = parse_filters(data)
+        except ValueError as e:
+            return JSONResponse({'error': f'Invalid filter: {e}'}, 400)
+
+        state = loaded()
+        if state is None:
+            return not_ready()
+        ret, cache = state
+
+        if data.get('stream'):
+            # Once the stream starts the status is 200, so shed load up front
+            if not get_async_client().accepting():
+                return llm_busy("Ollama busy: request queue is full")
+            return StreamingResponse(
+                stream_answer(ret, cache, query, filters),
+                media_type='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        # Retrieve; timings collects each stage in milliseconds
+        start_time = time.perf_counter()
+        timings = {}
+        query_embedding, distances, indices = await encode_and_search(ret, query, 3, filters, timings)
+
+        # Reuse the answer to a near-identical earlier question (unfiltered only)
+        cached = cache.lookup(query_embedding) if filters is None else None
+        if cached:
+            retrieval_time = ms_since(start_time)
+            with stage('log', timings):
+                get_query_log().log(query, cached['response'], cached['sources'],
+                                    retrieval_time, 0, retrieval_time)
+            observe_stage('total', time.perf_counter() - start_time, timings)
+            return JSONResponse({
+                'query': query,
+                'response': cached['response'],
+                'sources': cached['sources'],
+                'cached': True,
+                'retrieval_time': retrieval_time,
+                'generation_time': 0,
+                'total_time': ms_since(start_time),
+                'timings': timings
+            })
+
+        results = await hydrate(ret, distances, indices, timings)
+        retrieval_time = ms_since(start_time)
+
+        # Packing is a millisecond or so of tokenizing, fine on the event loop
+        with stage('context', timings):
+            passages, packing = ret.packer.pack(results)
+            prompt = build_prompt(query, passages)
+
+        # Generate
+        generation_start = time.perf_counter()
+        with stage('llm_total', timings):
+            response_text = await call_ollama(prompt)
+        generation_time = ms_since(generation_start)
+        if filters is None and not response_text.startswith('Error'):
+            cache.store(query, query_embedding, response_text, results)
+        with stage('log', timings):
+            get_query_log().log(query, response_text, results, retrieval_time, generation_time,
+                                ms_since(start_time))
+        observe_stage('total', time.perf_counter() - start_time, timings)
+
+        return JSONResponse({
+            'query': query,
+            'response': response_text,
+            'sources': results,
+            'cached': False,
+            'context_tokens': packing['tokens'],
+            'retrieval_time': retrieval_time,
+            'generation_time': generation_time,
+            'total_time': ms_since(start_time),
+            'timings': timings
+        })
+
+    except OllamaBusy as e:
+        return llm_busy(str(e))
+    except Exception as e:
+        ERRORS.inc(source='ask')
+        return JSONResponse({'error': str(e)}, 500)
+
+
+async def batch_lines(items, query_log):
+    """Generate BATCH_LLM_CONCURRENCY at a time; one JSON line per answer as it completes"""
+    client = get_async_client()
+    slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer(item):
+        async with slots:
+            start = time.perf_counter()
+            response, error = None, None
+            try:
+                response = await client.generate(item['prompt'])
+            except Exception as e:
+                ERRORS.inc(source='batch_llm')
+                error = str(e)
+            return batch_result(item, response, error, time.perf_counter() - start, query_log)
+
+    tasks = [asyncio.ensure_future(answer(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + '\n'
+    finally:
+        # A client that disconnects stops the generations still pending
+        for task in tasks:
+            task.cancel()
+
+
+async def ask_batch(request):
+    """Answer a list of questions; streams one JSON line per answer (see app.ask_batch)"""
+    REQUESTS.inc(endpoint='/ask_batch')
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    try:
+        questions = parse_questions(data.get('questions'))
+        top_k = min(max(int(data.get('top_k', 3)), 1), 20)
+    except ValueError as e:
+        return JSONResponse({'error': f'Invalid request: {e}'}, 400)
+
+    state = loaded()
+    if state is None:
+        return not_ready()
+    ret, _ = state
+    if not get_async_client().accepting():
+        return llm_busy("Ollama busy: request queue is full")
+
+    try:
+        # One encode, search and hydrate for the whole batch, off the event loop
+        items = await asyncio.get_running_loop().run_in_executor(
+            None, prepare_batch, ret, questions, build_prompt, top_k)
+    except Exception as e:
+        ERRORS.inc(source='ask_batch')
+        return JSONResponse({'error': str(e)}, 500)
+
+    query_log = get_query_log() if data.get('log') else None
+    return StreamingResponse(batch_lines(items, query_log), media_type='application/x-ndjson',
+                             headers={'X-Accel-Buffering': 'no'})
+
+
+async def search_chunks(request):
+    """Retrieval only: the chunks /ask would answer from, without generating or logging"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    query = data.get('query', '')
+    if not query:
+        return JSONResponse({'error': 'No query provided'}, 400)
+    try:
+        filters = parse_filters(data)
+        top_k = min(max(int(data.get('top_k', 3)), 1), 100)
+    except ValueError as e:
+        return JSONResponse({'error': f'Invalid request: {e}'}, 400)
+
+    state = loaded()
+    if state is None:
+        return not_ready()
+    ret, _ = state
+
+    REQUESTS.inc(endpoint='/search')
+    start_time = time.perf_counter()
+    timings = {}
+    try:
+        _, distances, indices = await encode_and_search(ret, query, top_k, filters, timings)
+        results = await hydrate(ret, distances, indices, timings)
+    except Exception as e:
+        ERRORS.inc(source='search')
+        return JSONResponse({'error': str(e)}, 500)
+    observe_stage('total', time.perf_counter() - start_time, timings)
+    return JSONResponse({
+        'query': query,
+        'sources': results,
+        'retrieval_time': ms_since(start_time),
+        'timings': timings
+    })
+
+
+async def ready(request):
+    """Readiness probe: 200 once the model, index and caches are loaded and warm"""
+    if rag_app.startup_error:
+        return JSONResponse({'ready': False, 'error': rag_app.startup_error}, 500)
+    if loaded() is None:
+        return JSONResponse({'ready': False, 'phase': rag_app.startup_timer.current,
+                             'startup': rag_app.startup_timer.stats()}, 503)
+    return JSONResponse({'ready': True, 'startup': rag_app.startup_timer.stats()})
+
+
+async def stats(request):
+    state = loaded()
+    if state is None:
+        return not_ready()
+    ret, cache = state
+    pool = await get_async_pool() if ret.store is None else None
+    return JSONResponse({
+        'startup': rag_app.startup_timer.stats(),
+        'db_pool': pool.stats() if pool else None,
+        'embedding_batches': ret.encoder.stats(),
+        'embedding_cache': ret.query_cache.stats() if ret.query_cache else None,
+        'filtered_search': ret.filtered.stats(),
+        'answer_cache': cache.stats(),
+        'query_log': get_query_log().stats(),
+        'llm': get_async_client().stats()
+    })
+
+
+async def metrics(request):
+    """Stage latency histograms and counters in the Prometheus text format"""
+    return Response(render_metrics(), headers={'Content-Type': CONTENT_TYPE})
+
+
+async def home(request):
+    return FileResponse(INDEX_HTML)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # serve.py has loaded and started everything before the server starts;
+    # on its own (uvicorn async_app:app) load in the background like app.py
+    if rag_app.retriever is None:
+        rag_app.load_in_background()
+    yield
+    await close_async_client()
+    await close_async_pool()
+    # Write out queued query logs
+    close_query_log()
+
+
+app = Starlette(routes=[
+    Route('/', home),
+    Route('/ask', ask, methods=['POST']),
+    Route('/ask_batch', ask_batch, methods=['POST']),
+    Route('/search', search_chunks, methods=['POST']),
+    Route('/ready', ready),
+    Route('/stats', stats),
+    Route('/metrics', metrics),
+], lifespan=lifespan)
@@ -0,0 +1,174 @@
+"""Dynamic micro-batching of query embeddings and FAISS searches.
+
+Concurrent requests each call BatchingEncoder.search(). A single worker
+thread collects the queries that arrive within a short window (or until
+the batch is full), encodes them in one model.encode call, runs one
+index.search over the stacked matrix and hands each caller its own row.
+Filtered queries share the encode call but are searched one at a time
+through a chunk_filters.FilteredSearch. With an embedding_cache.EmbeddingCache,
+only queries not asked before reach the model. Encode and search times are
+recorded per batch in the metrics stage histogram, and copied into the
+caller's `timings` dict if one is passed.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+import faiss
+import numpy as np
+
+from config import EMBED_BATCH_MAX_SIZE, EMBED_BATCH_WINDOW_MS
+from metrics import EMBED_BATCH_SIZE, stage
+
+
+def _resolve(future, result=None, exception=None):
+    """Complete a caller's future; one already done must not stop the worker"""
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class BatchingEncoder:
+    def __init__(self, model, index, filtered=None, max_batch_size=EMBED_BATCH_MAX_SIZE,
+                 window_ms=EMBED_BATCH_WINDOW_MS, cache=None):
+        self.model = model
+        self.index = index
+        self.filtered = filtered
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+
+        self.batches = 0
+        self.queries = 0
+
+        self._worker = threading.Thread(target=self._run, name='batching-encoder', daemon=True)
+        self._worker.start()
+
+    def search(self, query, top_k, filters=None, timings=None):
+        """Encode and search one query; returns (distances, indices) shaped (1, top_k).
+
+        `filters` is a dict of FilteredSearch.search keyword arguments
+        (categories, date_from, date_to). `timings` receives the embed and
+        search milliseconds of the batch the query ran in.
+        """
+        _, distances, indices = self.encode_and_search(query, top_k, filters, timings)
+        return distances, indices
+
+    def encode_and_search(self, query, top_k, filters=None, timings=None):
+        """Like search(), but also return the normalized query embedding"""
+        return self.submit(query, top_k, filters, timings).result()
+
+    def submit(self, query, top_k, filters=None, timings=None):
+        """Queue a query without waiting; the Future resolves to encode_and_search()'s result.
+
+        Async callers await it with asyncio.wrap_future, so no thread is
+        held while the query waits for its batch.
+        """
+        if filters and self.filtered is None:
+            raise ValueError("Filtered search is not enabled for this encoder")
+        future = Future()
+        self._queue.put((query, top_k, filters or None, future, timings))
+        return future
+
+    def _collect(self):
+        """Block for one request, then gather more until the window closes or the batch fills"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # close() queues None; finish what was collected, then stop
+            stop = None in batch
+            # Callers that gave up (a cancelled asyncio.wrap_future, for one)
+            # have cancelled futures; the rest can no longer be cancelled
+            self._process([item for item in batch
+                           if item is not None and item[3].set_running_or_notify_cancel()])
+            if stop:
+                return
+
+    def _process(self, batch):
+        if not batch:
+            return
+        texts = [item[0] for item in batch]
+        unfiltered = [row for row, item in enumerate(batch) if item[2] is None]
+        batch_timings = {}
+
+        try:
+            with stage('embed', batch_timings):
+                embeddings = self.embed(texts)
+            if unfiltered:
+                max_k = max(batch[row][1] for row in unfiltered)
+                with stage('search', batch_timings):
+                    distances, indices = self.index.search(embeddings[unfiltered], max_k)
+        except Exception as e:
+            for item in batch:
+                _resolve(item[3], exception=e)
+            return
+
+        self.batches += 1
+        self.queries += len(batch)
+        EMBED_BATCH_SIZE.observe(len(batch))
+
+        for i, row in enumerate(unfiltered):
+            _, top_k, _, future, timings = batch[row]
+            if timings is not None:
+                timings.update(batch_timings)
+            _resolve(future, (embeddings[row], distances[i:i + 1, :top_k], indices[i:i + 1, :top_k]))
+
+        for row, (_, top_k, filters, future, timings) in enumerate(batch):
+            if filters is None:
+                continue
+            row_timings = {'embed': batch_timings['embed']}
+            try:
+                with stage('filtered_search', row_timings):
+                    distances_row, indices_row = self.filtered.search(embeddings[row:row + 1], top_k,
+                                                                      **filters)
+            except Exception as e:
+                _resolve(future, exception=e)
+                continue
+            if timings is not None:
+                timings.update(row_timings)
+            _resolve(future, (embeddings[row], distances_row, indices_row))
+
+    def embed(self, texts):
+        """Normalized float32 embeddings, from the cache where possible.
+
+        Called on the worker thread for each batch, and directly by
+        batch_qa for whole question sets.
+        """
+        if self.cache is not None:
+            return self.cache.encode(self.model, texts)
+        embeddings = self.model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'avg_batch_size': self.queries / self.batches if self.batches else 0.0
+        }
+
+    def close(self):
+        """Stop the worker after it drains queued requests"""
+        self._queue.put(None)
+        self._worker.join()
@@ -0,0 +1,144 @@
+"""Answer many questions at once: POST /ask_batch and scripts/10_batch_eval.py.
+
+prepare_batch() encodes every question in one model call (through the
+query embedding cache), searches them with one matrix index.search,
+hydrates all of their hits with a single chunk store read or database
+query, and packs each question's prompt. answer_batch() then sends the
+generations to the LLM from a bounded thread pool and yields each answer
+as it completes, so results can be streamed out as JSON lines.
+
+Batches bypass the answer cache, so an evaluation run always measures
+fresh generations, and are only written to the query log when asked.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from chunk_store import fetch_chunks
+from config import BATCH_MAX_QUESTIONS, BATCH_LLM_CONCURRENCY
+from metrics import stage, observe_stage, ERRORS
+
+
+def parse_questions(items, max_questions=BATCH_MAX_QUESTIONS):
+    """(id, query) pairs from a list of strings or {'id': ..., 'query': ...} objects.
+
+    Ids default to the position in the list. Raises ValueError for an
+    empty, oversized or malformed list.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("questions must be a non-empty list")
+    if len(items) > max_questions:
+        raise ValueError(f"at most {max_questions} questions per batch")
+    questions = []
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            question_id, query = item.get('id', i), item.get('query')
+        else:
+            question_id, query = i, item
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError(f"question {i} has no query text")
+        questions.append((question_id, query))
+    return questions
+
+
+def retrieve_batch(ret, queries, top_k, timings=None):
+    """Search results for every query, in order, from one encode, search and hydrate"""
+    with stage('embed', timings):
+        embeddings = ret.encoder.embed(queries)
+    with stage('search', timings):
+        distances, indices = ret.searcher.search(embeddings, top_k)
+
+    # Questions on the same topic share chunks; read each one once
+    positions = np.unique(indices[indices >= 0]).tolist()
+    with stage('hydrate', timings):
+        if ret.store is not None:
+            rows = ret.store.get_many(positions)
+        else:
+            with ret.pool.connection() as conn:
+                rows = fetch_chunks(conn, [int(ret.chunk_ids[pos]) for pos in positions])
+    row_at = dict(zip(positions, rows))
+
+    results = []
+    for i in range(len(queries)):
+        hits = [int(pos) for pos in indices[i] if pos >= 0]
+        results.append(ret.to_results(distances[i:i + 1], hits, [row_at[pos] for pos in hits]))
+    return results
+
+
+def prepare_batch(ret, questions, build_prompt, top_k=3, timings=None):
+    """Retrieve and pack every question; returns one dict per question with its prompt"""
+    start = time.perf_counter()
+    retrieved = retrieve_batch(ret, [query for _, query in questions], top_k, timings)
+    retrieval_ms = int((time.perf_counter() - start) * 1000)
+
+    # Packing is tokenizer work; doing it up front leaves the generation
+    # threads nothing to do but wait on the LLM
+    items = []
+    with stage('context', timings):
+        for (question_id, query), results in zip(questions, retrieved):
+            passages, packing = ret.packer.pack(results)
+            items.append({
+                'id': question_id,
+                'query': query,
+                'results': results,
+                'prompt': build_prompt(query, passages),
+                'context_tokens': packing['tokens'],
+                'retrieval_ms': retrieval_ms
+            })
+    return items
+
+
+def batch_result(item, response, error, generation_seconds, query_log=None):
+    """Record one generation and return the JSON line written for its question"""
+    observe_stage('llm_total', generation_seconds)
+    generation_ms = int(generation_seconds * 1000)
+    if query_log is not None and error is None:
+        query_log.log(item['query'], response, item['results'], item['retrieval_ms'],
+                      generation_ms, item['retrieval_ms'] + generation_ms)
+    return {
+        'id': item['id'],
+        'query': item['query'],
+        'response': response,
+        'error': error,
+        'sources': [{'rank': r['rank'], 'chunk_id': r['chunk_id'], 'document_id': r['document_id'],
+                     'title': r['title'], 'similarity': r['similarity']} for r in item['results']],
+        'context_tokens': item['context_tokens'],
+        'retrieval_ms': item['retrieval_ms'],
+        'generation_ms': generation_ms
+    }
+
+
+def answer_batch(ret, questions, build_prompt, generate, top_k=3, concurrency=BATCH_LLM_CONCURRENCY,
+                 query_log=None, timings=None):
+    """Answer (id, query) pairs; returns an iterator of batch_result() dicts in completion order.
+
+    Retrieval runs before this returns, so its errors are raised here.
+    `generate(prompt)` returns the answer text; its exceptions are
+    reported in the question's 'error' field. At most `concurrency`
+    generations run at once. Closing the iterator early cancels the
+    generations that have not started.
+    """
+    items = prepare_batch(ret, questions, build_prompt, top_k, timings)
+
+    def answer(item):
+        start = time.perf_counter()
+        response, error = None, None
+        try:
+            response = generate(item['prompt'])
+        except Exception as e:
+            ERRORS.inc(source='batch_llm')
+            error = str(e)
+        return batch_result(item, response, error, time.perf_counter() - start, query_log)
+
+    def results():
+        pool = ThreadPoolExecutor(concurrency, thread_name_prefix='batch-llm')
+        try:
+            futures = [pool.submit(answer, item) for item in items]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # A client that disconnects stops the generations not yet started
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return results()
@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDINGS_PATH
+from vector_index import (make_spec, build_index, apply_search_params, index_memory_bytes,
+                          RescoredIndex)
+
+# Reports recall@k against the exact flat index, single-query QPS and index
+# RAM for each index type over a sweep of search-time settings. With
+# --encodings, each type is also built with compressed vectors (fp16, sq8,
+# pq, which HNSW skips); --rescore N adds a row per setting that re-ranks
+# N * k candidates with the float32 vectors.
+# Uses data/processed/embeddings.npy by default, or a clustered synthetic
+# corpus with --synthetic N. Run from the repository root.
+
+parser = argparse.ArgumentParser(description="ANN index recall/latency benchmark")
+parser.add_argument('--synthetic', type=int, help="use N synthetic vectors instead of embeddings.npy")
+parser.add_argument('--limit', type=int, help="only index the first N embeddings")
+parser.add_argument('--queries', type=int, default=1000)
+parser.add_argument('--k', type=int, default=10)
+parser.add_argument('--nlist', type=int, help="IVF centroids (default: 4 * sqrt(N))")
+parser.add_argument('--encodings', nargs='+', default=['float32'],
+                    choices=['float32', 'fp16', 'sq8', 'pq'])
+parser.add_argument('--rescore', type=int, default=0, help="also re-rank N * k candidates exactly")
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+
+
+def synthetic_embeddings(n, dimension=384, num_topics=200):
+    """Clustered unit vectors, closer to real embeddings than uniform noise"""
+    topics = rng.standard_normal((num_topics, dimension)).astype('float32')
+    vectors = topics[rng.integers(0, num_topics, n)] + \
+        0.5 * rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+if args.synthetic:
+    embeddings = synthetic_embeddings(args.synthetic)
+else:
+    embeddings = np.load(EMBEDDINGS_PATH, mmap_mode='r')
+    if args.limit:
+        embeddings = embeddings[:args.limit]
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    faiss.normalize_L2(embeddings)
+
+# Queries are perturbed corpus vectors, so they are realistic but not exact hits
+queries = embeddings[rng.choice(len(embeddings), args.queries, replace=False)] + \
+    0.05 * rng.standard_normal((args.queries, embeddings.shape[1])).astype('float32')
+faiss.normalize_L2(queries)
+
+nlist = args.nlist or int(4 * np.sqrt(len(embeddings)))
+print(f"Corpus: {embeddings.shape[0]} x {embeddings.shape[1]}, queries: {args.queries}, "
+      f"k={args.k}, nlist={nlist}\n")
+
+specs = []
+for encoding in args.encodings:
+    specs += [
+        (make_spec('flat', encoding=encoding), [None]),
+        (make_spec('ivf', nlist=nlist, encoding=encoding), [1, 8, 32, 128])
+    ]
+    # make_spec rejects HNSW over PQ codes
+    if encoding != 'pq':
+        specs.append((make_spec('hnsw', encoding=encoding), [16, 64, 128, 256]))
+if 'pq' not in args.encodings:
+    specs.append((make_spec('ivfpq', nlist=nlist), [8, 32, 128]))
+
+# Exact results to measure recall against
+_, ground_truth = faiss.knn(queries, embeddings, args.k, metric=faiss.METRIC_INNER_PRODUCT)
+
+print(f"{'type':<7} {'encoding':<8} {'setting':<24} {'recall@k':>9} {'QPS':>9} "
+      f"{'B/vector':>9} {'RAM MB':>9} {'build s':>8}")
+
+for spec, settings in specs:
+    build_start = time.time()
+    index = build_index(embeddings, spec)
+    build_time = time.time() - build_start
+    ram_bytes = index_memory_bytes(index)
+    ram_mb = ram_bytes / 1024 / 1024
+
+    searchers = [('', index)]
+    if args.rescore and spec['encoding'] != 'float32':
+        searchers.append((f" rescore x{args.rescore}", RescoredIndex(index, embeddings, args.rescore)))
+
+    for setting in settings:
+        label = '-'
+        if spec['type'] in ('ivf', 'ivfpq'):
+            spec['nprobe'] = setting
+            label = f"nprobe={setting}"
+        elif spec['type'] == 'hnsw':
+            spec['ef_search'] = setting
+            label = f"efSearch={setting}"
+        apply_search_params(index, spec)
+
+        for suffix, searcher in searchers:
+            # One query at a time, like the /ask path
+            results = np.empty((args.queries, args.k), dtype='int64')
+            start = time.perf_counter()
+            for i in range(args.queries):
+                _, results[i] = searcher.search(queries[i:i + 1], args.k)
+            qps = args.queries / (time.perf_counter() - start)
+
+            recall = np.mean([
+                len(set(results[i]) & set(ground_truth[i])) / args.k
+                for i in range(args.queries)
+            ])
+
+            print(f"{spec['type']:<7} {spec['encoding']:<8} {label + suffix:<24} {recall:>9.3f} {qps:>9.0f} "
+                  f"{ram_bytes / index.ntotal:>9.0f} {ram_mb:>9.1f} {build_time:>8.1f}")
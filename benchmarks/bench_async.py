@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import OLLAMA_URL
+from synthetic_corpus import build_synthetic_corpus, synthetic_queries
+
+# Sync (app.py) against async (async_app.py) serving of POST /ask, both
+# through serve.py with the same number of workers. A fake Ollama with fixed
+# latency runs as a separate process on the OLLAMA_URL port, so most of each
+# request is spent waiting on the LLM. For each concurrency level, that
+# many clients keep one request each in flight for --duration seconds.
+# Reports throughput, latency, errors and the most threads any worker used.
+#
+# The servers run with the LLM client's per-endpoint limit raised to
+# --llm-slots (the fake serves any number of generations at once) and the
+# answer cache off, so every request goes to the LLM. Uses a synthetic
+# corpus of --synthetic chunks; no database is needed (query log writes
+# fail and are counted). Stop Ollama first.
+
+parser = argparse.ArgumentParser(description="Sync vs async serving benchmark")
+parser.add_argument('--synthetic', type=int, default=20000, help="chunks in the synthetic corpus")
+parser.add_argument('--workers', type=int, default=1)
+parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256])
+parser.add_argument('--duration', type=float, default=15.0, help="seconds of load per level")
+parser.add_argument('--prefill-delay', type=float, default=0.5)
+parser.add_argument('--token-delay', type=float, default=0.01)
+parser.add_argument('--llm-slots', type=int, default=1024)
+parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+parser.add_argument('--port', type=int, default=5056)
+parser.add_argument('--startup-timeout', type=float, default=300.0)
+args = parser.parse_args()
+
+# serve.py with config overridden before anything imports it
+LAUNCHER = """
+import math, runpy, sys
+import config
+config.OLLAMA_MAX_CONCURRENCY = {slots}
+config.ANSWER_CACHE_THRESHOLD = math.inf
+config.ANSWER_CACHE_WARM = 0
+sys.argv = ['serve.py'] + {argv!r}
+runpy.run_path({serve!r}, run_name='__main__')
+"""
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def proc_status(pid, field):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(mode, data_dir, log):
+    argv = ['--workers', str(args.workers), '--port', str(args.port)]
+    if mode == 'async':
+        argv.append('--async')
+    code = LAUNCHER.format(slots=args.llm_slots, argv=argv, serve=os.path.join(REPO_DIR, 'serve.py'))
+    env = dict(os.environ, PYTHONUNBUFFERED='1',
+               PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=data_dir, env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+
+    # serve.py prints a ready line per worker
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {server.returncode}; see {log.name}")
+        pids = worker_pids(server.pid)
+        with open(log.name) as f:
+            output = f.read()
+        if len(pids) == args.workers and all(f"(pid {pid}) ready" in output for pid in pids):
+            return server
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("serve.py did not become ready in time")
+
+
+async def run_level(url, concurrency, pids):
+    """`concurrency` clients, each sending its next request when the last one returns"""
+    queries = synthetic_queries(100000, seed=concurrency)
+    latencies, statuses = [], []
+    max_threads = 0
+    stop_at = time.perf_counter() + args.duration
+    # aiohttp rather than httpx: at a few hundred keep-alive connections
+    # httpx's pool costs more CPU than the server being measured
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as client:
+        async def user(user_id):
+            i = user_id
+            while time.perf_counter() < stop_at:
+                start = time.perf_counter()
+                try:
+                    async with client.post(url, json={'query': queries[i % len(queries)]}) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = 'error'
+                latencies.append(time.perf_counter() - start)
+                statuses.append(status)
+                i += concurrency
+
+        async def sample_threads():
+            nonlocal max_threads
+            while time.perf_counter() < stop_at:
+                max_threads = max([max_threads] + [proc_status(pid, 'Threads') for pid in pids])
+                await asyncio.sleep(0.5)
+
+        start = time.perf_counter()
+        await asyncio.gather(sample_threads(), *(user(u) for u in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = np.array([t for t, s in zip(latencies, statuses) if s == 200]) * 1000
+    return {
+        'ok': len(ok),
+        'rps': len(ok) / wall,
+        'p50': np.percentile(ok, 50) if len(ok) else 0.0,
+        'p95': np.percentile(ok, 95) if len(ok) else 0.0,
+        'busy': statuses.count(503),
+        'errors': sum(1 for s in statuses if s not in (200, 503)),
+        'threads': max_threads,
+        'rss_mb': max(proc_status(pid, 'VmRSS') for pid in pids) / 1024
+    }
+
+
+workdir = tempfile.TemporaryDirectory()
+build_synthetic_corpus(workdir.name, args.synthetic)
+
+ollama_port = urlsplit(OLLAMA_URL).port or 11434
+fake_ollama = subprocess.Popen(
+    [sys.executable, os.path.join(REPO_DIR, 'benchmarks', 'fake_ollama.py'), '--port', str(ollama_port),
+     '--prefill-delay', str(args.prefill_delay), '--token-delay', str(args.token_delay)],
+    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+time.sleep(1)
+if fake_ollama.poll() is not None:
+    sys.exit(f"Could not start the fake Ollama on port {ollama_port}; stop Ollama first")
+
+url = f'http://127.0.0.1:{args.port}/ask'
+print(f"\n{args.workers} worker(s), fake Ollama prefill {args.prefill_delay * 1000:.0f}ms + "
+      f"{args.token_delay * 1000:.0f}ms/token, {args.duration:.0f}s per level, {os.cpu_count()} CPUs\n")
+print(f"{'mode':<6} {'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'503s':>5} "
+      f"{'errors':>6} {'threads':>7} {'RSS MB':>7}")
+
+try:
+    for mode in args.modes:
+        with tempfile.NamedTemporaryFile('w+', suffix='.log', delete=False) as log:
+            server = start_server(mode, workdir.name, log)
+        try:
+            pids = worker_pids(server.pid)
+            for concurrency in args.concurrency:
+                r = asyncio.run(run_level(url, concurrency, pids))
+                print(f"{mode:<6} {concurrency:>7} {r['rps']:>7.1f} {r['p50']:>8.0f} {r['p95']:>8.0f} "
+                      f"{r['busy']:>5} {r['errors']:>6} {r['threads']:>7} {r['rss_mb']:>7.0f}")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+            os.unlink(log.name)
+finally:
+    fake_ollama.terminate()
+    fake_ollama.wait()
+    workdir.cleanup()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import runpy
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from urllib.parse import urlsplit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch_qa import answer_batch, retrieve_batch
+from config import OLLAMA_URL
+from fake_ollama import start_fake_ollama
+from synthetic_corpus import build_synthetic_corpus, synthetic_queries
+
+# Answering a fixed question set the old way, RAGChatbot.generate_response
+# in a loop as in the __main__ of 08_rag_pipeline.py, against answer_batch
+# (what scripts/10_batch_eval.py runs) at each --concurrency. Also times
+# retrieval alone: retriever.search per question vs retrieve_batch over all
+# of them. Generation goes to a fake Ollama on the OLLAMA_URL port, so the
+# numbers measure this code rather than the LLM; the fake serves concurrent
+# generations at full speed, as a server with that many slots would. The
+# Ollama client still holds at most OLLAMA_MAX_CONCURRENCY per endpoint, so
+# levels beyond that queue in the client. Uses a synthetic corpus of
+# --synthetic chunks, which needs no database.
+
+parser = argparse.ArgumentParser(description="Sequential vs batch question answering benchmark")
+parser.add_argument('--synthetic', type=int, default=20000, help="chunks in the synthetic corpus")
+parser.add_argument('--questions', type=int, default=200)
+parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+parser.add_argument('--top-k', type=int, default=5)
+parser.add_argument('--prefill-delay', type=float, default=0.2, help="fake Ollama seconds before the first token")
+parser.add_argument('--token-delay', type=float, default=0.005, help="fake Ollama seconds per token")
+args = parser.parse_args()
+
+workdir = tempfile.TemporaryDirectory()
+build_synthetic_corpus(workdir.name, args.synthetic)
+# The scripts read data/processed relative to the working directory
+os.chdir(workdir.name)
+
+ollama_port = urlsplit(OLLAMA_URL).port or 11434
+try:
+    fake_ollama = start_fake_ollama(port=ollama_port, prefill_delay=args.prefill_delay,
+                                    token_delay=args.token_delay)
+except OSError as e:
+    sys.exit(f"Could not start the fake Ollama on port {ollama_port} ({e}); stop Ollama first")
+
+with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+    RAGChatbot = runpy.run_path(os.path.join(REPO_DIR, 'scripts', '08_rag_pipeline.py'),
+                                run_name='rag_pipeline')['RAGChatbot']
+    chatbot = RAGChatbot()
+# Neither path should spend time on the query log
+chatbot._log_query = lambda *a: None
+retriever = chatbot.retriever
+
+questions = list(enumerate(synthetic_queries(args.questions, seed=1)))
+queries = [query for _, query in questions]
+# Encode once up front, so neither side pays for first-call warmup
+retriever.encoder.embed(queries[:8])
+print(f"{args.questions} questions, {args.synthetic} chunks, fake Ollama prefill "
+      f"{args.prefill_delay * 1000:.0f}ms + {len(fake_ollama.tokens)} tokens at "
+      f"{args.token_delay * 1000:.0f}ms, {os.cpu_count()} CPUs\n")
+
+
+def build_prompt(query, passages):
+    return chatbot._create_prompt(query, chatbot._build_context(passages))
+
+
+def generate(prompt):
+    return chatbot.llm.generate(prompt, model=chatbot.model)
+
+
+# Retrieval only; a fresh query set each time so the embedding cache misses
+start = time.perf_counter()
+for query in synthetic_queries(args.questions, seed=2):
+    retriever.search(query, top_k=args.top_k)
+per_question = time.perf_counter() - start
+start = time.perf_counter()
+retrieve_batch(retriever, synthetic_queries(args.questions, seed=3), args.top_k)
+batched = time.perf_counter() - start
+print(f"Retrieval: {per_question:.2f}s one at a time, {batched:.2f}s batched "
+      f"({per_question / batched:.1f}x)\n")
+
+print(f"{'mode':<18} {'seconds':>8} {'per min':>8} {'errors':>7}")
+start = time.perf_counter()
+errors = 0
+with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+    for _, query in questions:
+        if chatbot.generate_response(query, top_k=args.top_k)['response'].startswith('Error'):
+            errors += 1
+elapsed = time.perf_counter() - start
+print(f"{'sequential loop':<18} {elapsed:>8.1f} {args.questions / elapsed * 60:>8.0f} {errors:>7}")
+
+for concurrency in args.concurrency:
+    start = time.perf_counter()
+    results = list(answer_batch(retriever, questions, build_prompt, generate, args.top_k,
+                                concurrency=concurrency))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for result in results if result['error'])
+    print(f"{'batch c=' + str(concurrency):<18} {elapsed:>8.1f} {args.questions / elapsed * 60:>8.0f} "
+          f"{errors:>7}")
+
+chatbot.close()
+fake_ollama.shutdown()
+os.chdir(REPO_DIR)
+workdir.cleanup()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_MODEL, FAISS_INDEX_PATH, EMBED_BATCH_MAX_SIZE, EMBED_BATCH_WINDOW_MS
+from batch_encoder import BatchingEncoder
+
+# Load test for query micro-batching: N client threads each run a stream of
+# encode + search calls, once with one model.encode per query and once
+# through BatchingEncoder. Reports throughput and latency per concurrency.
+# Uses the real FAISS index if present, else a synthetic one.
+
+parser = argparse.ArgumentParser(description="Query micro-batching load test")
+parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+parser.add_argument('--requests', type=int, default=50, help="requests per client")
+parser.add_argument('--synthetic', type=int, default=100000,
+                    help="synthetic index size when the real index is missing")
+parser.add_argument('--window-ms', type=float, default=EMBED_BATCH_WINDOW_MS)
+parser.add_argument('--max-batch', type=int, default=EMBED_BATCH_MAX_SIZE)
+parser.add_argument('--top-k', type=int, default=5)
+parser.add_argument('--model', default=EMBEDDING_MODEL, help="sentence-transformers model name or path")
+args = parser.parse_args()
+
+model = SentenceTransformer(args.model)
+
+if os.path.exists(FAISS_INDEX_PATH):
+    index = faiss.read_index(FAISS_INDEX_PATH)
+else:
+    dimension = model.get_sentence_embedding_dimension()
+    vectors = np.random.default_rng(0).standard_normal((args.synthetic, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexFlatIP(dimension)
+    index.add(vectors)
+print(f"Index: {index.ntotal} vectors\n")
+
+topics = ["graph neural networks", "speech recognition", "federated learning privacy",
+          "image segmentation", "large language model alignment", "robot motion planning",
+          "compiler optimization", "distributed consensus", "quantum error correction",
+          "recommender systems"]
+
+
+def make_query(client, i):
+    return f"{topics[(client + i) % len(topics)]} {client} {i}"
+
+
+def search_unbatched(query):
+    embedding = model.encode([query], show_progress_bar=False).astype('float32')
+    faiss.normalize_L2(embedding)
+    return index.search(embedding, args.top_k)
+
+
+def run(search, clients):
+    latencies = [[] for _ in range(clients)]
+
+    def client(c):
+        for i in range(args.requests):
+            start = time.perf_counter()
+            search(make_query(c, i))
+            latencies[c].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate(latencies) * 1000
+    return clients * args.requests / elapsed, np.percentile(all_latencies, 50), np.percentile(all_latencies, 95)
+
+
+# Warm up the model so the first configuration is not penalised
+search_unbatched("warmup")
+
+print(f"{'clients':>7} {'mode':<10} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'avg batch':>9}")
+for clients in args.clients:
+    qps, p50, p95 = run(search_unbatched, clients)
+    print(f"{clients:>7} {'single':<10} {qps:>8.1f} {p50:>8.1f} {p95:>8.1f} {1:>9.1f}")
+
+    encoder = BatchingEncoder(model, index, max_batch_size=args.max_batch, window_ms=args.window_ms)
+    qps_batched, p50, p95 = run(lambda q: encoder.search(q, args.top_k), clients)
+    batch_size = encoder.stats()['avg_batch_size']
+    encoder.close()
+    print(f"{clients:>7} {'batched':<10} {qps_batched:>8.1f} {p50:>8.1f} {p95:>8.1f} {batch_size:>9.1f}"
+          f"   ({qps_batched / qps:.2f}x)")
@@ -0,0 +1,177 @@
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import EMBEDDING_MODEL, CHUNK_MAX_TOKENS, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+from context_packing import ContextPacker
+from text_processing import TokenCounter, chunk_text
+from fake_ollama import start_fake_ollama
+from synthetic_corpus import TOPICS, FILLER
+import ollama_client
+
+# Prompt size and generation time with every retrieved chunk pasted in full
+# (the old prompt) against the packed context: near-duplicate chunks
+# dropped, overlapping chunks of one abstract merged, passages cut to the
+# token budget. Prompts are built with app.build_prompt either way. Token
+# counts use the embedding model's tokenizer. Generation goes to a fake
+# Ollama whose prefill time grows with prompt length
+# (--prompt-token-delay seconds per word), or to a real one with
+# --ollama-url, for the first --generate queries.
+# Uses the chunk store, embeddings and index in data/processed, or with
+# --synthetic N builds N abstracts (a few percent re-posted as near-copies,
+# like new arXiv versions), chunks them with the preprocessing chunker and
+# embeds them. Run from the repository root.
+
+parser = argparse.ArgumentParser(description="Context packing benchmark")
+parser.add_argument('--synthetic', type=int, help="build N synthetic abstracts instead of using data/processed")
+parser.add_argument('--top-k', type=int, nargs='+', default=[3, 5, 10])
+parser.add_argument('--queries', type=int, default=200)
+parser.add_argument('--generate', type=int, default=20, help="queries per setting sent to the LLM")
+parser.add_argument('--budget', type=int, default=CONTEXT_TOKEN_BUDGET)
+parser.add_argument('--dedup-threshold', type=float, default=CONTEXT_DEDUP_THRESHOLD)
+parser.add_argument('--prompt-token-delay', type=float, default=0.002,
+                    help="fake Ollama prefill seconds per prompt word")
+parser.add_argument('--ollama-url', help="use this Ollama instead of the fake one")
+parser.add_argument('--model', default=EMBEDDING_MODEL)
+args = parser.parse_args()
+
+from app import build_prompt
+
+rng = np.random.default_rng(0)
+model = SentenceTransformer(args.model)
+counter = TokenCounter(model.tokenizer)
+
+
+def synthetic_abstracts(n):
+    """Abstracts built from per-topic vocabularies; about 5% are near-copies of earlier ones"""
+    vocabularies = [topic.split() + [f"{word}{t}" for word in FILLER] for t, topic in enumerate(TOPICS)]
+    abstracts = []
+    for i in range(n):
+        if i > 10 and rng.random() < 0.05:
+            copy = abstracts[rng.integers(0, len(abstracts))]
+            words = copy[1].split()
+            words[rng.integers(0, len(words))] = 'revised'
+            abstracts.append((copy[0], ' '.join(words)))
+            continue
+        topic = i % len(TOPICS)
+        words = rng.choice(vocabularies[topic] + FILLER, rng.integers(150, 400))
+        abstracts.append((topic, f"We study {TOPICS[topic]}. " + ' '.join(words)))
+    return abstracts
+
+
+def build_synthetic(n):
+    """Chunk and embed synthetic abstracts; returns (index, embeddings, chunks, queries)"""
+    max_tokens = CHUNK_MAX_TOKENS - model.tokenizer.num_special_tokens_to_add()
+    chunks = []
+    for doc, (topic, abstract) in enumerate(synthetic_abstracts(n)):
+        words = abstract.split()
+        for text, _ in chunk_text(words, counter.count(words), max_tokens):
+            chunks.append({'chunk_id': len(chunks) + 1, 'chunk_text': text,
+                           'document_id': f"synthetic.{doc:06d}", 'title': f"On {TOPICS[topic]} ({doc})",
+                           'authors': "A. Author", 'categories': 'cs.LG'})
+    print(f"Embedding {len(chunks)} chunks of {n} synthetic abstracts...")
+    embeddings = model.encode([c['chunk_text'] for c in chunks], batch_size=64,
+                              show_progress_bar=False, convert_to_numpy=True).astype('float32')
+    faiss.normalize_L2(embeddings)
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+    # A question about a topic plus a few words from one of its chunks
+    queries = []
+    for i in range(args.queries):
+        chunk = chunks[rng.integers(0, len(chunks))]
+        words = chunk['chunk_text'].split()
+        start = rng.integers(0, max(len(words) - 8, 1))
+        queries.append(f"What is known about {' '.join(words[start:start + 8])}?")
+    return index, embeddings, chunks.__getitem__, queries
+
+
+def load_real():
+    from vector_index import load_index, load_chunk_ids, open_embeddings
+    from chunk_store import load_chunk_store
+    from synthetic_corpus import synthetic_queries
+
+    index, _ = load_index(mmap=True)
+    chunk_ids = load_chunk_ids()
+    store = load_chunk_store(chunk_ids)
+    if store is None:
+        sys.exit("Chunk store missing or stale; run scripts/06_build_chunk_store.py or use --synthetic")
+    embeddings = open_embeddings(len(chunk_ids))
+    return index, embeddings, store.get, synthetic_queries(args.queries)
+
+
+if args.synthetic:
+    index, embeddings, get_chunk, queries = build_synthetic(args.synthetic)
+else:
+    index, embeddings, get_chunk, queries = load_real()
+
+packer = ContextPacker(model.tokenizer, embeddings, budget=args.budget,
+                       dedup_threshold=args.dedup_threshold)
+
+if args.ollama_url:
+    ollama_url = args.ollama_url
+else:
+    fake_ollama = start_fake_ollama(prefill_delay=0.05, token_delay=0.0,
+                                    prompt_token_delay=args.prompt_token_delay)
+    ollama_url = fake_ollama.url
+
+query_vectors = model.encode(queries, show_progress_bar=False, convert_to_numpy=True).astype('float32')
+faiss.normalize_L2(query_vectors)
+
+
+def retrieve(i, top_k):
+    distances, indices = index.search(query_vectors[i:i + 1], top_k)
+    results = []
+    for distance, position in zip(distances[0], indices[0]):
+        row = get_chunk(int(position)) if position >= 0 else None
+        if row:
+            results.append(dict(row, rank=len(results) + 1, similarity=float(distance),
+                                position=int(position)))
+    return results
+
+
+def token_count(text):
+    return sum(counter.count(text.split()))
+
+
+print(f"{len(queries)} queries, budget {args.budget} tokens, LLM: {ollama_url} "
+      f"({args.generate} generations per setting)\n")
+print(f"{'k':>3} {'context':<7} {'prompt tok':>10} {'p95 tok':>8} {'pack ms':>8} "
+      f"{'gen p50 ms':>11} {'gen p95 ms':>11} {'dups':>5} {'merged':>7} {'cut':>5} {'dropped':>8}")
+
+for top_k in args.top_k:
+    for mode in ('full', 'packed'):
+        tokens, pack_times, generation_times = [], [], []
+        totals = {'duplicates': 0, 'merged': 0, 'truncated': 0, 'dropped': 0}
+        for i, query in enumerate(queries):
+            results = retrieve(i, top_k)
+            if mode == 'packed':
+                start = time.perf_counter()
+                passages, stats = packer.pack(results)
+                pack_times.append(time.perf_counter() - start)
+                for key in totals:
+                    totals[key] += stats[key]
+            else:
+                passages = results
+            prompt = build_prompt(query, passages)
+            tokens.append(token_count(prompt))
+
+            if i < args.generate:
+                start = time.perf_counter()
+                ollama_client.generate(prompt, url=ollama_url)
+                generation_times.append(time.perf_counter() - start)
+
+        generation_ms = np.array(generation_times) * 1000
+        pack_ms = np.mean(pack_times) * 1000 if pack_times else 0.0
+        print(f"{top_k:>3} {mode:<7} {np.mean(tokens):>10.0f} {np.percentile(tokens, 95):>8.0f} "
+              f"{pack_ms:>8.2f} {np.percentile(generation_ms, 50):>11.0f} "
+              f"{np.percentile(generation_ms, 95):>11.0f} "
+              + ' '.join(f"{totals[key] / len(queries):>{width}.2f}" for key, width in
+                         (('duplicates', 5), ('merged', 7), ('truncated', 5), ('dropped', 8))))
@@ -0,0 +1,322 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import OLLAMA_URL
+from fake_ollama import start_fake_ollama
+from synthetic_corpus import build_synthetic_corpus, synthetic_queries
+from query_log import get_query_log, close_query_log
+
+# End-to-end load test of the two answer paths: POST /ask on app.py (over
+# HTTP, in-process werkzeug server) and RAGChatbot.generate_response from
+# 08_rag_pipeline.py, at fixed concurrency levels. Generation goes to a fake
+# Ollama on the OLLAMA_URL port with configurable prefill and per-token
+# delays, so the numbers measure this code rather than the LLM.
+#
+# Each stage is timed by wrapping the function that does it:
+#   encode, search - model.encode and the index search, per batch (the
+#                    batching encoder serves concurrent queries together)
+#   hydrate        - search hits to chunk rows (chunk store or database)
+#   context/prompt - prompt building (app.py does both in build_prompt)
+#   generate       - the Ollama call
+#   log            - queueing the query log record
+#   total          - the whole request (client-side for /ask)
+# and reported as p50/p95/p99 with the throughput per level. Results are
+# saved as JSON; --baseline compares p95s and throughput with an earlier
+# run and exits non-zero on a regression beyond --tolerance.
+#
+# Uses the data in data/processed (run from the repository root), or a
+# synthetic corpus of N chunks with --synthetic N, which needs no database.
+# Query log writes then fail and are counted, which does not affect timings.
+
+parser = argparse.ArgumentParser(description="End-to-end RAG latency benchmark")
+parser.add_argument('--synthetic', type=int, help="build a synthetic corpus of N chunks")
+parser.add_argument('--index-type', default='ivf', help="synthetic index type")
+parser.add_argument('--targets', nargs='+', default=['ask', 'pipeline'], choices=['ask', 'pipeline'])
+parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+parser.add_argument('--requests', type=int, default=100, help="requests per concurrency level")
+parser.add_argument('--prefill-delay', type=float, default=0.2, help="fake Ollama seconds before the first token")
+parser.add_argument('--token-delay', type=float, default=0.01, help="fake Ollama seconds per token")
+parser.add_argument('--answer-cache', action='store_true', help="leave the /ask answer cache on")
+parser.add_argument('--output', help="JSON results path (default: benchmarks/results/e2e_<time>.json)")
+parser.add_argument('--baseline', help="earlier results JSON to compare against")
+parser.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown before flagging")
+args = parser.parse_args()
+
+output_path = os.path.abspath(args.output or os.path.join(
+    REPO_DIR, 'benchmarks', 'results', f"e2e_{time.strftime('%Y%m%d-%H%M%S')}.json"))
+baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+
+class StageRecorder:
+    """Per-stage timings of the level being measured"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    def reset(self):
+        self.timings = defaultdict(list)
+
+    def record(self, stage, seconds):
+        self.timings[stage].append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        return {
+            stage: {
+                'count': len(values),
+                'mean_ms': float(np.mean(values) * 1000),
+                'p50_ms': float(np.percentile(values, 50) * 1000),
+                'p95_ms': float(np.percentile(values, 95) * 1000),
+                'p99_ms': float(np.percentile(values, 99) * 1000)
+            }
+            for stage, values in self.timings.items() if values
+        }
+
+
+class TimedIndex:
+    """Stands in for the retriever's searcher and times each search"""
+
+    def __init__(self, index, recorder):
+        self.index = index
+        self.d = index.d
+        self.ntotal = index.ntotal
+        self.search = recorder.wrap('search', index.search)
+
+
+recorder = StageRecorder()
+
+
+def instrument_retriever(retriever):
+    retriever.model.encode = recorder.wrap('encode', retriever.model.encode)
+    retriever.encoder.index = TimedIndex(retriever.encoder.index, recorder)
+    retriever.hydrate = recorder.wrap('hydrate', retriever.hydrate)
+
+
+def run_level(handle, concurrency, queries):
+    """Send the queries from `concurrency` threads; return throughput and stage timings"""
+    recorder.reset()
+    pending = queue.Queue()
+    for query in queries:
+        pending.put(query)
+    errors = []
+
+    def client():
+        while True:
+            try:
+                query = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                handle(query)
+            except Exception as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    completed = len(queries) - len(errors)
+    return {
+        'requests': len(queries),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'wall_s': wall,
+        'throughput_rps': completed / wall,
+        'stages': recorder.summary()
+    }
+
+
+def setup_ask():
+    """Start app.py on a local port with its stages timed; return the request function"""
+    from werkzeug.serving import make_server
+    import app as rag_app
+
+    retriever = rag_app.get_retriever()
+    cache = rag_app.get_answer_cache()
+    if not args.answer_cache:
+        # Nothing is similar enough to hit
+        cache.threshold = float('inf')
+    instrument_retriever(retriever)
+    rag_app.build_prompt = recorder.wrap('prompt', rag_app.build_prompt)
+    rag_app.call_ollama = recorder.wrap('generate', rag_app.call_ollama)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, rag_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ask"
+    local = threading.local()
+
+    def ask(query):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.post(url, json={'query': query})
+        recorder.record('total', time.perf_counter() - start)
+        body = response.json()
+        if response.status_code != 200 or body.get('response', '').startswith('Error'):
+            raise RuntimeError(body.get('error') or body.get('response'))
+    return ask
+
+
+def setup_pipeline():
+    """Load RAGChatbot with its stages timed; return the request function"""
+    pipeline = runpy.run_path(os.path.join(REPO_DIR, 'scripts', '08_rag_pipeline.py'),
+                              run_name='rag_pipeline')
+    chatbot = pipeline['RAGChatbot']()
+    instrument_retriever(chatbot.retriever)
+    chatbot._build_context = recorder.wrap('context', chatbot._build_context)
+    chatbot._create_prompt = recorder.wrap('prompt', chatbot._create_prompt)
+    chatbot._call_ollama = recorder.wrap('generate', chatbot._call_ollama)
+    generate_response = recorder.wrap('total', chatbot.generate_response)
+
+    def answer(query):
+        result = generate_response(query, top_k=3)
+        if result['response'].startswith('Error'):
+            raise RuntimeError(result['response'])
+    return answer
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Regressions of p95 stage latency and throughput against a baseline run"""
+    regressions = []
+    for target, levels in results['targets'].items():
+        for level, result in levels.items():
+            old = baseline.get('targets', {}).get(target, {}).get(level)
+            if old is None:
+                continue
+            if result['throughput_rps'] < old['throughput_rps'] * (1 - args.tolerance):
+                regressions.append(f"{target} c={level} throughput {old['throughput_rps']:.1f} -> "
+                                   f"{result['throughput_rps']:.1f} req/s")
+            for stage, timing in result['stages'].items():
+                old_timing = old['stages'].get(stage)
+                # Ignore sub-millisecond noise
+                if old_timing and timing['p95_ms'] > old_timing['p95_ms'] * (1 + args.tolerance) + 1:
+                    regressions.append(f"{target} c={level} {stage} p95 {old_timing['p95_ms']:.1f} -> "
+                                       f"{timing['p95_ms']:.1f} ms")
+    return regressions
+
+
+workdir = None
+corpus_size = None
+if args.synthetic:
+    workdir = tempfile.TemporaryDirectory()
+    build_synthetic_corpus(workdir.name, args.synthetic, args.index_type)
+    # The app and scripts read data/processed relative to the working directory
+    os.chdir(workdir.name)
+    corpus_size = args.synthetic
+
+ollama_port = urlsplit(OLLAMA_URL).port or 11434
+try:
+    fake_ollama = start_fake_ollama(port=ollama_port, prefill_delay=args.prefill_delay,
+                                    token_delay=args.token_delay)
+except OSError as e:
+    sys.exit(f"Could not start the fake Ollama on port {ollama_port} ({e}); stop Ollama first")
+print(f"Fake Ollama on {fake_ollama.url}: prefill {args.prefill_delay * 1000:.0f}ms, "
+      f"{len(fake_ollama.tokens)} tokens at {args.token_delay * 1000:.0f}ms\n")
+
+results = {
+    'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'commit': git_commit(),
+    'config': {
+        'synthetic': corpus_size,
+        'index_type': args.index_type if corpus_size else None,
+        'requests': args.requests,
+        'prefill_delay': args.prefill_delay,
+        'token_delay': args.token_delay,
+        'answer_cache': args.answer_cache,
+        'cpus': os.cpu_count()
+    },
+    'targets': {}
+}
+
+# Both paths log through the one process-wide writer
+query_log = get_query_log()
+query_log.log = recorder.wrap('log', query_log.log)
+
+setups = {'ask': setup_ask, 'pipeline': setup_pipeline}
+stage_order = ['encode', 'search', 'hydrate', 'context', 'prompt', 'generate', 'log', 'total']
+
+for target in args.targets:
+    print(f"Loading {target}...")
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        handle = setups[target]()
+    results['targets'][target] = {}
+
+    for level_number, concurrency in enumerate(args.concurrency):
+        queries = synthetic_queries(args.requests, seed=level_number + 1)
+        # RAGChatbot prints progress for every query
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            result = run_level(handle, concurrency, queries)
+        results['targets'][target][str(concurrency)] = result
+
+        print(f"\n{target}, concurrency {concurrency}: {result['throughput_rps']:.1f} req/s, "
+              f"{result['errors']} errors" +
+              (f" (first: {result['first_error']})" if result['errors'] else ''))
+        print(f"  {'stage':<9} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for stage in stage_order:
+            timing = result['stages'].get(stage)
+            if timing:
+                print(f"  {stage:<9} {timing['count']:>6} {timing['p50_ms']:>9.1f} "
+                      f"{timing['p95_ms']:>9.1f} {timing['p99_ms']:>9.1f}")
+
+os.makedirs(os.path.dirname(output_path), exist_ok=True)
+with open(output_path, 'w') as f:
+    json.dump(results, f, indent=2)
+print(f"\nResults saved to {output_path}")
+
+status = 0
+if baseline_path:
+    with open(baseline_path) as f:
+        regressions = compare(results, json.load(f))
+    if regressions:
+        print(f"\nRegressions against {baseline_path} (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        status = 1
+    else:
+        print(f"\nNo regressions against {baseline_path}")
+
+close_query_log()
+fake_ollama.shutdown()
+if workdir is not None:
+    os.chdir(REPO_DIR)
+    workdir.cleanup()
+sys.exit(status)
@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE
+from embedding_cache import EmbeddingCache
+from synthetic_corpus import synthetic_queries
+
+# Query embedding time with and without the embedding cache. A stream of
+# --requests questions is drawn from --distinct ones with Zipf-distributed
+# popularity (a few questions asked very often, a long tail asked once),
+# and each question is retyped with random case and spacing some of the
+# time. Every request is embedded alone, as a lone user's would be, by
+# model.encode and by EmbeddingCache.encode at each cache size. Also
+# reports the hit rate, the arena's memory, and how long saving and
+# loading the cache take.
+
+parser = argparse.ArgumentParser(description="Query embedding cache benchmark")
+parser.add_argument('--requests', type=int, default=5000)
+parser.add_argument('--distinct', type=int, default=5000, help="distinct questions in the stream")
+parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent of question popularity")
+parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, EMBEDDING_CACHE_SIZE])
+parser.add_argument('--model', default=EMBEDDING_MODEL)
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+model = SentenceTransformer(args.model)
+lowercase = getattr(model.tokenizer, 'do_lower_case', False)
+
+questions = synthetic_queries(args.distinct)
+ranks = np.minimum(rng.zipf(args.zipf, args.requests), args.distinct) - 1
+stream = []
+for rank in ranks:
+    text = questions[rank]
+    if rng.random() < 0.3:
+        text = '  ' + text.upper().replace(' ', '   ') if lowercase else text.replace(' ', '  ')
+    stream.append(text)
+print(f"{args.requests} requests, {len(set(ranks))} distinct questions, "
+      f"{os.cpu_count()} CPUs\n")
+
+
+def run(encode):
+    latencies = []
+    for text in stream:
+        start = time.perf_counter()
+        encode([text])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), latencies.sum() / 1000
+
+
+def model_encode(texts):
+    embeddings = np.ascontiguousarray(model.encode(texts, show_progress_bar=False), dtype='float32')
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+print(f"{'cache':>8} {'hit rate':>9} {'p50 ms':>7} {'p95 ms':>7} {'total s':>8} {'arena MB':>9} "
+      f"{'save ms':>8} {'load ms':>8}")
+p50, p95, total = run(model_encode)
+print(f"{'none':>8} {'-':>9} {p50:>7.2f} {p95:>7.2f} {total:>8.1f} {'-':>9} {'-':>8} {'-':>8}")
+
+dimension = model_encode(['probe']).shape[1]
+for size in args.sizes:
+    cache = EmbeddingCache(dimension, size, lowercase=lowercase, model_name=args.model)
+    p50, p95, total = run(lambda texts: cache.encode(model, texts))
+    stats = cache.stats()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'cache')
+        start = time.perf_counter()
+        cache.save(path)
+        save_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        EmbeddingCache(dimension, size, lowercase=lowercase, model_name=args.model).load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{size:>8} {stats['hit_rate']:>9.3f} {p50:>7.2f} {p95:>7.2f} {total:>8.1f} "
+          f"{stats['arena_bytes'] / 1024 / 1024:>9.1f} {save_ms:>8.1f} {load_ms:>8.1f}")
@@ -0,0 +1,159 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDINGS_PATH, CHUNK_STORE_DIR, FILTER_EXACT_MAX, FILTER_MAX_EXPANSION
+from chunk_filters import ChunkAttributes, FilteredSearch
+from vector_index import make_spec, build_index, apply_search_params
+
+# Filtered search by selectivity: over-fetching k * N results and dropping
+# the ones outside the filter, against passing the filter into the index
+# (IDSelector) and against FilteredSearch, which scores small selections
+# exactly. Recall@k is measured against an exact search of the matching
+# chunks, so a method that returns too few matches loses recall.
+# Uses embeddings.npy with the attributes saved by 06_build_chunk_store.py,
+# or a synthetic corpus with Zipf-distributed categories with --synthetic N.
+# Run from the repository root.
+
+parser = argparse.ArgumentParser(description="Filtered vector search benchmark")
+parser.add_argument('--synthetic', type=int, help="use N synthetic chunks instead of the real corpus")
+parser.add_argument('--queries', type=int, default=200)
+parser.add_argument('--k', type=int, default=10)
+parser.add_argument('--overfetch', type=int, default=10, help="post-filter fetches k * this many results")
+parser.add_argument('--types', nargs='+', default=['flat', 'ivf', 'hnsw'])
+parser.add_argument('--exact-max', type=int, default=FILTER_EXACT_MAX)
+parser.add_argument('--max-expansion', type=float, default=FILTER_MAX_EXPANSION)
+parser.add_argument('--selectivity', type=float, nargs='+', default=[0.5, 0.1, 0.01, 0.001])
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+
+
+def synthetic_corpus(n, dimension=384, num_topics=200, num_categories=150):
+    """Clustered vectors; 1-3 Zipf-distributed categories and a 2020-2024 date per chunk"""
+    topics = rng.standard_normal((num_topics, dimension)).astype('float32')
+    topic = rng.integers(0, num_topics, n)
+    vectors = topics[topic] + 0.5 * rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+
+    # Categories follow the topic loosely, so filters correlate with the query like real ones do
+    weights = 1 / np.arange(1, num_categories + 1) ** 1.1
+    weights /= weights.sum()
+    topic_category = rng.choice(num_categories, num_topics, p=weights)
+    first_day = date(2020, 1, 1)
+    rows = []
+    for pos in range(n):
+        categories = {topic_category[topic[pos]]}
+        categories.update(rng.choice(num_categories, rng.integers(0, 3), p=weights))
+        day = first_day + timedelta(days=int(rng.integers(0, 5 * 365)))
+        rows.append((pos, ' '.join(f"cat.{c}" for c in categories), day))
+    return vectors, ChunkAttributes.from_rows(rows, n)
+
+
+if args.synthetic:
+    embeddings, attributes = synthetic_corpus(args.synthetic)
+else:
+    embeddings = np.ascontiguousarray(np.load(EMBEDDINGS_PATH, mmap_mode='r'), dtype='float32')
+    faiss.normalize_L2(embeddings)
+    attributes = ChunkAttributes.load(CHUNK_STORE_DIR)
+
+# Candidate filters: single categories, years and category + year pairs;
+# for each target selectivity use the candidate closest to it
+years = [(f"{y}-01-01", f"{y}-12-31") for y in range(2020, 2025)]
+candidates = [({'date_from': f"{years[0][0]}", 'date_to': years[2][1]}, '2020-2022')]
+candidates += [({'categories': [name]}, name) for name in attributes.category_names]
+candidates += [({'date_from': a, 'date_to': b}, a[:4]) for a, b in years]
+candidates += [({'categories': [name], 'date_from': a, 'date_to': b}, f"{name} {a[:4]}")
+               for name in attributes.category_names[:40] for a, b in years]
+
+masks = {label: attributes.select(**filters) for filters, label in candidates}
+chosen = []
+for target in args.selectivity:
+    filters, label = min(candidates, key=lambda c: abs(np.log(max(masks[c[1]].mean(), 1e-9) / target)))
+    chosen.append((filters, label, masks[label]))
+
+queries = embeddings[rng.choice(len(embeddings), args.queries, replace=False)] + \
+    0.05 * rng.standard_normal((args.queries, embeddings.shape[1])).astype('float32')
+faiss.normalize_L2(queries)
+
+print(f"Corpus: {embeddings.shape[0]} x {embeddings.shape[1]}, queries: {args.queries}, k={args.k}, "
+      f"{len(attributes.category_names)} categories\n")
+
+
+def exact_filtered(mask):
+    """Ground truth: brute force over the matching chunks only"""
+    selected = np.flatnonzero(mask)
+    scores = queries @ embeddings[selected].T
+    count = min(args.k, len(selected))
+    best = np.argsort(-scores, axis=1)[:, :count]
+    return [set(selected[row]) for row in best]
+
+
+def post_filter(index, mask):
+    def search(query):
+        _, labels = index.search(query, args.k * args.overfetch)
+        labels = labels[0][labels[0] >= 0]
+        return labels[mask[labels]][:args.k]
+    return search
+
+
+def in_search(searcher, filters):
+    def search(query):
+        _, labels = searcher.search(query, args.k, **filters)
+        return labels[0][labels[0] >= 0]
+    return search
+
+
+def measure(search, truth):
+    latencies = []
+    recalls = []
+    returned = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        labels = search(queries[i:i + 1])
+        latencies.append(time.perf_counter() - start)
+        returned.append(len(labels))
+        if truth is not None:
+            recalls.append(len(set(labels) & truth[i]) / max(len(truth[i]), 1))
+    latencies = np.array(latencies) * 1000
+    recall = np.mean(recalls) if recalls else float('nan')
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 95), np.mean(returned)
+
+
+print(f"{'type':<6} {'filter':<18} {'select.':>8} {'method':<14} {'recall@k':>9} "
+      f"{'p50 ms':>8} {'p95 ms':>8} {'hits':>5}")
+
+nlist = int(4 * np.sqrt(len(embeddings)))
+for index_type in args.types:
+    spec = make_spec(index_type, nlist=nlist) if index_type == 'ivf' else make_spec(index_type)
+    index = build_index(embeddings, spec)
+    apply_search_params(index, spec)
+
+    recall, p50, p95, hits = measure(lambda q: index.search(q, args.k)[1][0], None)
+    print(f"{index_type:<6} {'(none)':<18} {1.0:>8.4f} {'unfiltered':<14} {'':>9} "
+          f"{p50:>8.2f} {p95:>8.2f} {hits:>5.1f}")
+
+    selector_only = FilteredSearch(index, spec, lambda: attributes, embeddings, exact_max=0,
+                                   max_expansion=args.max_expansion)
+    hybrid = FilteredSearch(index, spec, lambda: attributes, embeddings, exact_max=args.exact_max,
+                            max_expansion=args.max_expansion)
+
+    for filters, label, mask in chosen:
+        truth = exact_filtered(mask)
+        methods = [
+            (f"post x{args.overfetch}", post_filter(index, mask)),
+            ('in-index', in_search(selector_only, filters)),
+            ('in-index+exact', in_search(hybrid, filters))
+        ]
+        for name, search in methods:
+            recall, p50, p95, hits = measure(search, truth)
+            print(f"{index_type:<6} {label[:18]:<18} {mask.mean():>8.4f} {name:<14} {recall:>9.3f} "
+                  f"{p50:>8.2f} {p95:>8.2f} {hits:>5.1f}")
+    print()
@@ -0,0 +1,78 @@
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CHUNK_IDS_PATH, CHUNK_STORE_DIR
+from db import get_pool
+from chunk_store import ChunkStore, fetch_chunks
+
+# Compares per-query hydration latency of search hits:
+#   loop  - one SELECT ... JOIN documents per hit (the original retrievers)
+#   bulk  - a single WHERE chunk_id = ANY(...) query
+#   store - memory-mapped chunk store lookup
+# Random FAISS row positions stand in for search results, so no model or
+# index is needed. Run from the repository root.
+
+NUM_QUERIES = 200
+TOP_KS = [3, 10, 50]
+
+
+def hydrate_loop(conn, chunk_ids):
+    cursor = conn.cursor()
+    rows = []
+    for chunk_id in chunk_ids:
+        cursor.execute("""
+            SELECT dc.chunk_text, dc.document_id, d.title, d.authors, d.categories
+            FROM document_chunks dc
+            JOIN documents d ON dc.document_id = d.document_id
+            WHERE dc.chunk_id = %s
+        """, (chunk_id,))
+        rows.append(cursor.fetchone())
+    cursor.close()
+    return rows
+
+
+def percentile_ms(timings, q):
+    return np.percentile(timings, q) * 1000
+
+
+with open(CHUNK_IDS_PATH, 'rb') as f:
+    chunk_ids = pickle.load(f)
+
+store = ChunkStore(CHUNK_STORE_DIR)
+if not store.is_current(chunk_ids):
+    print("Warning: chunk store does not match chunk_ids.pkl, rebuild it first")
+
+pool = get_pool()
+conn = pool.getconn()
+
+rng = np.random.default_rng(42)
+
+print(f"Hydration benchmark ({NUM_QUERIES} queries per setting, {len(chunk_ids)} chunks)")
+print(f"{'k':>4} {'method':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+for top_k in TOP_KS:
+    queries = [rng.integers(0, len(chunk_ids), size=top_k) for _ in range(NUM_QUERIES)]
+
+    methods = {
+        'loop': lambda pos: hydrate_loop(conn, [chunk_ids[p] for p in pos]),
+        'bulk': lambda pos: fetch_chunks(conn, [chunk_ids[p] for p in pos]),
+        'store': lambda pos: store.get_many(pos)
+    }
+
+    for name, hydrate in methods.items():
+        timings = []
+        for positions in queries:
+            start = time.perf_counter()
+            hydrate(positions)
+            timings.append(time.perf_counter() - start)
+
+        print(f"{top_k:>4} {name:>6} {np.mean(timings) * 1000:>9.3f} "
+              f"{percentile_ms(timings, 50):>9.3f} {percentile_ms(timings, 95):>9.3f}")
+
+pool.putconn(conn)
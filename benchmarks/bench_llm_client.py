@@ -0,0 +1,118 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ollama_client import OllamaClient, OllamaBusy
+from fake_ollama import start_fake_ollama
+
+# A burst of simultaneous generations against fake Ollama servers that share
+# one model between concurrent requests (--shared in fake_ollama.py), the
+# way a single local Ollama slows every request down as more run at once.
+#   direct    - a bare requests.post per call, no limit (the old client)
+#   bounded   - OllamaClient on one server, --max-concurrency slots and a
+#               queue big enough for the whole burst
+#   N servers - OllamaClient spreading the burst over N servers
+#   shedding  - a queue of --queue-size: the rest of the burst gets a fast 503
+#   failover  - one live server and one that refuses connections
+# Reports latency of completed calls, how many were rejected and how fast,
+# and the most generations any one server ran at once.
+
+parser = argparse.ArgumentParser(description="LLM client concurrency benchmark")
+parser.add_argument('--burst', type=int, default=32, help="simultaneous requests")
+parser.add_argument('--servers', type=int, default=2, help="servers for the load-balanced run")
+parser.add_argument('--max-concurrency', type=int, default=2, help="slots per server")
+parser.add_argument('--queue-size', type=int, default=8, help="queue for the shedding run")
+parser.add_argument('--prefill-delay', type=float, default=0.1)
+parser.add_argument('--token-delay', type=float, default=0.005)
+args = parser.parse_args()
+
+
+def start_servers(n):
+    return [start_fake_ollama(prefill_delay=args.prefill_delay, token_delay=args.token_delay, shared=True)
+            for _ in range(n)]
+
+
+def closed_port_url():
+    """URL of a local port nothing listens on"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/api/generate"
+
+
+def run_burst(call):
+    """Fire args.burst calls at once; return (outcome, seconds) per call and the wall time"""
+    barrier = threading.Barrier(args.burst)
+    results = [None] * args.burst
+
+    def worker(i):
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            call()
+            outcome = 'ok'
+        except OllamaBusy:
+            outcome = 'busy'
+        except Exception:
+            outcome = 'error'
+        results[i] = (outcome, time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.burst)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def report(name, results, wall, servers):
+    ok = np.array([seconds for outcome, seconds in results if outcome == 'ok']) * 1000
+    busy = np.array([seconds for outcome, seconds in results if outcome == 'busy']) * 1000
+    errors = sum(1 for outcome, _ in results if outcome == 'error')
+    percentile = lambda values, q: f"{np.percentile(values, q):.0f}" if len(values) else '-'
+    print(f"{name:<12} {len(ok):>4} {len(busy):>5} {errors:>6} {percentile(ok, 50):>8} "
+          f"{percentile(ok, 95):>8} {percentile(ok, 100):>8} {percentile(busy, 50):>9} "
+          f"{wall:>7.2f} {max(s.max_active for s in servers):>10}")
+
+
+def direct_call(url):
+    response = requests.post(url, json={'model': 'fake', 'prompt': 'prompt', 'stream': False})
+    response.raise_for_status()
+
+
+def scenario(name, server_count, dead=0, **client_kwargs):
+    servers = start_servers(server_count)
+    urls = [closed_port_url() for _ in range(dead)] + [s.url for s in servers]
+    if name == 'direct':
+        call = lambda: direct_call(urls[0])
+    else:
+        client_kwargs.setdefault('queue_size', args.burst)
+        client = OllamaClient(urls, model='fake', max_concurrency=args.max_concurrency, **client_kwargs)
+        call = lambda: client.generate('prompt')
+    results, wall = run_burst(call)
+    report(name, results, wall, servers)
+    for server in servers:
+        server.shutdown()
+
+
+single = args.prefill_delay + args.token_delay * 20
+print(f"Burst of {args.burst} requests; one generation alone takes about {single * 1000:.0f}ms; "
+      f"{args.max_concurrency} slots per server\n")
+print(f"{'run':<12} {'ok':>4} {'503s':>5} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+      f"{'503 p50 ms':>9} {'wall s':>7} {'max active':>10}")
+
+scenario('direct', 1)
+scenario('bounded', 1)
+scenario(f"{args.servers} servers", args.servers)
+scenario('shedding', 1, queue_size=args.queue_size)
+scenario('failover', 1, dead=1)
@@ -0,0 +1,91 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_MODEL
+from papers_dataset import load_papers
+from text_processing import chunk_batches
+
+# Papers/sec for cleaning + chunking: the original single-core df.apply and
+# word-count chunking against text_processing.chunk_batches with 1 and N
+# worker processes. Database inserts are not included. Uses the filtered
+# papers by default, or synthetic abstracts with --synthetic N.
+# Run from the repository root.
+
+parser = argparse.ArgumentParser(description="Text preprocessing throughput benchmark")
+parser.add_argument('--synthetic', type=int, help="use N synthetic abstracts")
+parser.add_argument('--limit', type=int, default=50000, help="papers to process from the dataset")
+parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()])
+parser.add_argument('--batch-papers', type=int, default=1000)
+parser.add_argument('--model', default=EMBEDDING_MODEL, help="model whose tokenizer sizes chunks")
+args = parser.parse_args()
+
+
+def legacy_clean_text(text):
+    if pd.isna(text):
+        return ""
+    text = re.sub(r'\\[a-zA-Z]+\{[^}]*\}', '', text)
+    text = re.sub(r'\\[a-zA-Z]+', '', text)
+    text = re.sub(r'[^a-zA-Z0-9\s\.,!?;:\-]', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def legacy_chunk_text(text, chunk_size=512, overlap=50):
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        chunk = ' '.join(words[i:i + chunk_size])
+        if len(chunk.split()) > 20:
+            chunks.append(chunk)
+    return chunks
+
+
+def synthetic_abstracts(n):
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(5000)] + \
+        ['the', 'of', 'model', 'we', 'propose', '$\\mathcal{O}(n)$', '\\emph{robust}', 'e.g.,', '(LLMs)']
+    lengths = rng.integers(80, 350, n)
+    return [' '.join(rng.choice(vocabulary, length)) for length in lengths]
+
+
+if args.synthetic:
+    df = pd.DataFrame({'abstract': synthetic_abstracts(args.synthetic)})
+    df['id'] = [f"synthetic.{i}" for i in range(len(df))]
+else:
+    df = load_papers(columns=['id', 'abstract']).head(args.limit)
+
+print(f"Papers: {len(df)}\n")
+print(f"{'method':<22} {'papers/sec':>11} {'chunks':>8} {'time s':>8}")
+
+# Original: df.apply + iterrows on one core
+start = time.perf_counter()
+cleaned = df['abstract'].apply(legacy_clean_text)
+num_chunks = 0
+for text in cleaned:
+    num_chunks += len(legacy_chunk_text(text))
+elapsed = time.perf_counter() - start
+print(f"{'legacy (1 core)':<22} {len(df) / elapsed:>11.0f} {num_chunks:>8} {elapsed:>8.1f}")
+
+
+def batches():
+    for i in range(0, len(df), args.batch_papers):
+        batch = df.iloc[i:i + args.batch_papers]
+        yield batch['id'].tolist(), batch['abstract'].tolist()
+
+
+for workers in args.workers:
+    start = time.perf_counter()
+    num_chunks = 0
+    for rows in chunk_batches(batches(), workers, args.model):
+        num_chunks += len(rows)
+    elapsed = time.perf_counter() - start
+    label = f"tokenized, {workers} worker{'s' if workers > 1 else ''}"
+    print(f"{label:<22} {len(df) / elapsed:>11.0f} {num_chunks:>8} {elapsed:>8.1f}")
@@ -0,0 +1,209 @@
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import psycopg2
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from config import DB_HOST, DB_NAME
+from log_rollups import (LOG_TABLES, ROLLUP_TABLES, add_months, month_start, create_log_tables,
+                         create_log_partitions, create_rollup_tables, refresh_rollups)
+from schema import create_secondary_indexes
+
+# The analytical queries on large log tables, from the raw rows and from the
+# rollups. Seeds --queries synthetic queries over the last --days days, with
+# --ranks retrieval rows each, into two scratch schemas of DB_NAME:
+#   bench_rollups_plain - queries and retrieval_logs as unpartitioned tables,
+#                         the layout before log_rollups.py
+#   bench_rollups       - monthly partitions and rollup tables, as
+#                         02_database_setup.py now creates them
+# Times the first refresh_rollups (a backfill of everything but the last
+# hour) and an hourly one, then runs each query of
+# sql_queries/analytical_queries.sql that has a variant in
+# sql_queries/rollup_queries.sql three ways: on the plain tables, on the
+# partitioned ones, and from the rollups. Reports the median of --repeat
+# runs and the table sizes. The schemas are dropped at the end unless
+# --keep is given.
+
+parser = argparse.ArgumentParser(description="Analytics on raw log tables vs rollups benchmark")
+parser.add_argument('--queries', type=int, default=1000000, help="synthetic queries to log")
+parser.add_argument('--ranks', type=int, default=5, help="retrieval rows per query")
+parser.add_argument('--days', type=int, default=90, help="days the queries are spread over")
+parser.add_argument('--documents', type=int, default=100000)
+parser.add_argument('--questions', type=int, default=50000, help="distinct question texts")
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--keep', action='store_true', help="keep the scratch schemas")
+args = parser.parse_args()
+
+SCHEMA, PLAIN_SCHEMA = 'bench_rollups', 'bench_rollups_plain'
+CATEGORIES = ['cs.LG', 'cs.CL', 'cs.CV', 'cs.AI', 'cs.IR', 'cs.RO', 'cs.CR', 'cs.DS',
+              'cs.LG stat.ML', 'cs.CV cs.LG', 'cs.CL cs.AI', 'cs.IR cs.CL']
+
+
+def read_queries(path):
+    """Query number -> SQL, from the '-- Query N:' headers of a .sql file"""
+    parts = re.split(r'(?m)^-- Query (\d+):.*$', open(path).read())
+    return {int(number): sql.strip() for number, sql in zip(parts[1::2], parts[2::2])}
+
+
+def timed(cursor, statement, params=None):
+    start = time.perf_counter()
+    cursor.execute(statement, params)
+    return time.perf_counter() - start
+
+
+def relation_mb(cursor, table):
+    cursor.execute("""
+        SELECT COALESCE(SUM(pg_total_relation_size(relid)), pg_total_relation_size(%s::regclass))
+        FROM pg_partition_tree(%s::regclass)
+    """, (table, table))
+    return cursor.fetchone()[0] / 1024 / 1024
+
+
+conn = psycopg2.connect(host=DB_HOST, database=DB_NAME)
+cursor = conn.cursor()
+cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; DROP SCHEMA IF EXISTS {PLAIN_SCHEMA} CASCADE;")
+cursor.execute(f"CREATE SCHEMA {SCHEMA}; CREATE SCHEMA {PLAIN_SCHEMA};")
+cursor.execute(f"SET search_path TO {SCHEMA}")
+
+print(f"Seeding {args.queries} queries and {args.queries * args.ranks} retrieval rows "
+      f"over {args.days} days...")
+start_time = time.perf_counter()
+cursor.execute("""
+CREATE TABLE documents (
+    document_id VARCHAR(50) PRIMARY KEY,
+    arxiv_id VARCHAR(50) UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    categories VARCHAR(200),
+    update_date DATE,
+    word_count INTEGER
+);
+CREATE TABLE document_chunks (
+    chunk_id SERIAL PRIMARY KEY,
+    document_id VARCHAR(50) REFERENCES documents(document_id) ON DELETE CASCADE,
+    chunk_text TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL
+);
+""")
+create_log_tables(cursor, months_ahead=1)
+this_month = month_start(date.today())
+create_log_partitions(cursor, add_months(this_month, -(args.days // 28 + 1)), this_month)
+create_rollup_tables(cursor)
+create_secondary_indexes(cursor)
+
+cursor.execute("""
+    INSERT INTO documents (document_id, arxiv_id, title, categories, update_date, word_count)
+    SELECT 'd' || i, 'a' || i, 'paper ' || i, (%s::text[])[1 + i %% %s],
+           DATE '2020-01-01' + i %% 1500, 100 + i %% 200
+    FROM generate_series(1, %s) i
+""", (CATEGORIES, len(CATEGORIES), args.documents))
+cursor.execute("""
+    INSERT INTO document_chunks (chunk_id, document_id, chunk_text, chunk_index)
+    SELECT i, 'd' || i, 'chunk', 0 FROM generate_series(1, %s) i
+""", (args.documents,))
+
+# A few questions are asked very often; latencies and popular papers skewed the same way
+cursor.execute("""
+    INSERT INTO queries (user_query_text, query_timestamp, response_text, response_quality_score,
+                         retrieval_time_ms, generation_time_ms, total_latency_ms)
+    SELECT 'question ' || floor(power(random(), 3) * %(questions)s)::int,
+           LOCALTIMESTAMP - random() * %(days)s * INTERVAL '1 day',
+           'answer', random(), r, g, r + g + 5
+    FROM (
+        SELECT (20 + power(random(), 4) * 400)::int AS r, (800 + random() * 4000)::int AS g
+        FROM generate_series(1, %(queries)s)
+    ) s
+""", {'questions': args.questions, 'days': args.days, 'queries': args.queries})
+cursor.execute("""
+    INSERT INTO retrieval_logs (query_id, document_id, chunk_id, similarity_score,
+                                retrieval_rank, was_used_in_response, log_timestamp)
+    SELECT query_id, 'd' || doc, doc, 0.9 - rank * 0.08 + random() * 0.1, rank, rank <= 3,
+           query_timestamp
+    FROM (
+        SELECT q.query_id, q.query_timestamp, r.rank,
+               1 + floor(power(random(), 2) * %s)::int AS doc
+        FROM queries q
+        CROSS JOIN generate_series(1, %s) AS r (rank)
+    ) s
+""", (args.documents, args.ranks))
+
+# The same rows in the old layout
+cursor.execute(f"SET search_path TO {PLAIN_SCHEMA}, {SCHEMA}")
+cursor.execute(f"""
+CREATE TABLE {PLAIN_SCHEMA}.queries (
+    query_id SERIAL PRIMARY KEY,
+    user_query_text TEXT NOT NULL,
+    query_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    response_text TEXT,
+    response_quality_score FLOAT,
+    retrieval_time_ms INTEGER,
+    generation_time_ms INTEGER,
+    total_latency_ms INTEGER
+);
+CREATE TABLE {PLAIN_SCHEMA}.retrieval_logs (
+    log_id SERIAL PRIMARY KEY,
+    query_id INTEGER REFERENCES {PLAIN_SCHEMA}.queries(query_id) ON DELETE CASCADE,
+    document_id VARCHAR(50) REFERENCES documents(document_id) ON DELETE CASCADE,
+    chunk_id INTEGER REFERENCES document_chunks(chunk_id) ON DELETE CASCADE,
+    similarity_score FLOAT,
+    retrieval_rank INTEGER,
+    was_used_in_response BOOLEAN DEFAULT FALSE,
+    log_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO {PLAIN_SCHEMA}.queries SELECT * FROM {SCHEMA}.queries;
+INSERT INTO {PLAIN_SCHEMA}.retrieval_logs SELECT * FROM {SCHEMA}.retrieval_logs;
+""")
+create_secondary_indexes(cursor, tables=list(LOG_TABLES))
+cursor.execute("ANALYZE")
+conn.commit()
+print(f"Seeded in {time.perf_counter() - start_time:.0f}s\n")
+
+# Everything but the last hour, then the last hour as the hourly cron run would
+cursor.execute(f"SET search_path TO {SCHEMA}")
+conn.commit()
+start = time.perf_counter()
+refresh_rollups(conn, lag_minutes=60)
+backfill_seconds = time.perf_counter() - start
+start = time.perf_counter()
+refresh_rollups(conn, lag_minutes=0)
+hourly_seconds = time.perf_counter() - start
+cursor.execute("ANALYZE")
+conn.commit()
+print(f"First refresh (backfill of {args.days} days): {backfill_seconds:.1f}s, "
+      f"hourly refresh: {hourly_seconds * 1000:.0f}ms\n")
+
+print(f"{'table':<28} {'MB':>8}")
+for table in LOG_TABLES:
+    print(f"{table:<28} {relation_mb(cursor, table):>8.1f}")
+rollup_mb = sum(relation_mb(cursor, table) for table in ROLLUP_TABLES)
+print(f"{'rollup tables':<28} {rollup_mb:>8.1f}\n")
+
+analytical = read_queries(os.path.join(REPO_DIR, 'sql_queries', 'analytical_queries.sql'))
+rollup = read_queries(os.path.join(REPO_DIR, 'sql_queries', 'rollup_queries.sql'))
+layouts = [('plain', f"{PLAIN_SCHEMA}, {SCHEMA}", analytical),
+           ('partitioned', SCHEMA, analytical),
+           ('rollups', SCHEMA, rollup)]
+
+print(f"{'query':>5} {'plain ms':>10} {'partitioned ms':>15} {'rollups ms':>11} {'speedup':>8}")
+for number in sorted(rollup):
+    medians = []
+    for _, search_path, statements in layouts:
+        cursor.execute(f"SET search_path TO {search_path}")
+        runs = [timed(cursor, statements[number]) for _ in range(args.repeat)]
+        cursor.fetchall()
+        medians.append(np.median(runs) * 1000)
+    print(f"{number:>5} {medians[0]:>10.1f} {medians[1]:>15.1f} {medians[2]:>11.2f} "
+          f"{medians[0] / medians[2]:>7.0f}x")
+conn.rollback()
+
+if not args.keep:
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE; DROP SCHEMA {PLAIN_SCHEMA} CASCADE;")
+    conn.commit()
+cursor.close()
+conn.close()
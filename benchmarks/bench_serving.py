@@ -0,0 +1,161 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from synthetic_corpus import TOPICS, build_synthetic_corpus
+
+# Memory and throughput of serve.py as workers are added. For each worker
+# count it starts serve.py, waits for every worker to report ready, then
+# reads each process's RSS and PSS (proportional set size: shared pages are
+# split between the processes mapping them, so PSS adds up to real memory
+# use while RSS counts the shared model and index once per process).
+# Concurrent clients then POST /search for a fixed time and the aggregate
+# QPS and latency percentiles are reported.
+# Uses the data in data/processed by default, or a synthetic index and
+# chunk store of N chunks with --synthetic N (no database needed). Run
+# from the repository root.
+
+parser = argparse.ArgumentParser(description="Pre-fork serving benchmark")
+parser.add_argument('--synthetic', type=int, help="serve a synthetic index of N chunks")
+parser.add_argument('--index-type', default='ivf', help="synthetic index type")
+parser.add_argument('--workers', type=int, nargs='+',
+                    help="worker counts to try (default: 1 up to the CPU count)")
+parser.add_argument('--clients', type=int, default=8, help="concurrent client threads")
+parser.add_argument('--duration', type=float, default=10.0, help="seconds of load per worker count")
+parser.add_argument('--top-k', type=int, default=5)
+parser.add_argument('--port', type=int, default=5055)
+parser.add_argument('--startup-timeout', type=float, default=300.0)
+args = parser.parse_args()
+
+QUERIES = TOPICS
+
+
+def memory_kb(pid):
+    """RSS and PSS of one process in kB"""
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name = line.split(':')[0]
+            if name in ('Rss', 'Pss'):
+                usage[name.lower()] = int(line.split()[1])
+    return usage
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def start_server(num_workers, data_dir, log):
+    env = dict(os.environ, PYTHONUNBUFFERED='1',
+               PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'serve.py'), '--workers', str(num_workers),
+         '--port', str(args.port)],
+        cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    # /ready only answers for whichever worker takes the request, so wait
+    # for every worker to log that it is serving
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {server.returncode}")
+        pids = worker_pids(server.pid)
+        if len(pids) == num_workers and all(worker_ready(pid, log.name) for pid in pids):
+            return server
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("serve.py did not become ready in time")
+
+
+def worker_ready(pid, log_path):
+    # serve.py prints this line once a worker is serving
+    with open(log_path) as f:
+        return f"(pid {pid}) ready" in f.read()
+
+
+def run_load(url):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.duration
+
+    def client(client_id):
+        session = requests.Session()
+        i = client_id
+        while time.perf_counter() < stop_at:
+            query = QUERIES[i % len(QUERIES)]
+            i += 1
+            start = time.perf_counter()
+            response = session.post(url, json={'query': query, 'top_k': args.top_k})
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return latencies, errors[0], wall
+
+
+workdir = None
+if args.synthetic:
+    workdir = tempfile.TemporaryDirectory()
+    build_synthetic_corpus(workdir.name, args.synthetic, args.index_type)
+    data_dir = workdir.name
+else:
+    data_dir = os.getcwd()
+
+worker_counts = args.workers or list(range(1, os.cpu_count() + 1))
+url = f'http://127.0.0.1:{args.port}/search'
+
+print(f"{args.clients} clients, {args.duration:.0f}s per setting, top_k={args.top_k}, "
+      f"{os.cpu_count()} CPUs\n")
+print(f"{'workers':>7} {'master RSS MB':>14} {'worker RSS MB':>14} {'worker PSS MB':>14} "
+      f"{'total PSS MB':>13} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+
+for num_workers in worker_counts:
+    with tempfile.NamedTemporaryFile('w+', suffix='.log', delete=False) as log:
+        server = start_server(num_workers, data_dir, log)
+    try:
+        # One untimed pass so every worker has seen a request
+        for query in QUERIES:
+            requests.post(url, json={'query': query, 'top_k': args.top_k})
+
+        master = memory_kb(server.pid)
+        workers = [memory_kb(pid) for pid in worker_pids(server.pid)]
+        total_pss = master['pss'] + sum(w['pss'] for w in workers)
+        latencies, errors, wall = run_load(url)
+        latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+
+        print(f"{num_workers:>7} {master['rss'] / 1024:>14.0f} "
+              f"{np.mean([w['rss'] for w in workers]) / 1024:>14.0f} "
+              f"{np.mean([w['pss'] for w in workers]) / 1024:>14.0f} {total_pss / 1024:>13.0f} "
+              f"{len(latencies) / wall:>8.1f} {np.percentile(latencies_ms, 50):>8.1f} "
+              f"{np.percentile(latencies_ms, 95):>8.1f} {errors:>7}")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+        os.unlink(log.name)
+
+if workdir is not None:
+    workdir.cleanup()
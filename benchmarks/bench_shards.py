@@ -0,0 +1,144 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from config import EMBEDDINGS_PATH
+from vector_index import (INDEX_TYPES, make_spec, build_index, build_sharded_index, shard_assignments,
+                          save_index, save_sharded_index, load_index, index_memory_bytes, ShardedIndex)
+
+# Single-query latency and memory as the index is split over more shards.
+# For each shard count the corpus is hash-sharded, written with
+# save_sharded_index and loaded back with load_index, as the app would.
+# Reports the size of the largest shard, the RSS that loading the index
+# and running the queries adds to a fresh process (with --mmap only the
+# pages touched count), search latency with the shards searched on
+# parallel threads and one after another, and recall@k against exact search.
+# Threads only pay off with a core per shard; the CPU count is printed.
+# Uses a clustered synthetic corpus by default, or
+# data/processed/embeddings.npy with --embeddings. Run from the repository root.
+
+parser = argparse.ArgumentParser(description="Sharded index latency/memory benchmark")
+parser.add_argument('--synthetic', type=int, default=200000, help="synthetic vectors")
+parser.add_argument('--embeddings', action='store_true', help="use embeddings.npy instead")
+parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat')
+parser.add_argument('--nlist', type=int, help="IVF centroids over the whole corpus (default: 4 * sqrt(N))")
+parser.add_argument('--queries', type=int, default=500)
+parser.add_argument('--k', type=int, default=10)
+parser.add_argument('--mmap', action='store_true', help="memory-map the shards")
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+
+
+def synthetic_embeddings(n, dimension=384, num_topics=200):
+    """Clustered unit vectors, closer to real embeddings than uniform noise"""
+    topics = rng.standard_normal((num_topics, dimension)).astype('float32')
+    vectors = topics[rng.integers(0, num_topics, n)] + \
+        0.5 * rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+# Run in a fresh process: memory freed by earlier shard counts stays in this one
+RSS_PROBE = """
+import sys
+import numpy as np
+from vector_index import load_index
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024
+
+queries = np.load(sys.argv[3])
+before = rss_mb()
+index, _ = load_index(sys.argv[1], sys.argv[2], mmap=sys.argv[4] == 'mmap')
+index.search(queries, 10)
+print(rss_mb() - before)
+"""
+
+
+def loaded_rss_mb(index_path, meta_path, queries_path):
+    output = subprocess.check_output(
+        [sys.executable, '-c', RSS_PROBE, index_path, meta_path, queries_path,
+         'mmap' if args.mmap else 'ram'], cwd=REPO_DIR)
+    return float(output.decode().split()[-1])
+
+
+def measure(index):
+    latencies, recalls = [], []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, labels = index.search(queries[i:i + 1], args.k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(labels[0]) & set(truth[i])) / args.k)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), np.mean(recalls)
+
+
+if args.embeddings:
+    embeddings = np.ascontiguousarray(np.load(EMBEDDINGS_PATH), dtype='float32')
+    faiss.normalize_L2(embeddings)
+else:
+    embeddings = synthetic_embeddings(args.synthetic)
+chunk_ids = np.arange(1, len(embeddings) + 1)
+
+# Perturbed corpus vectors, so queries are realistic but not exact hits
+queries = embeddings[rng.choice(len(embeddings), args.queries, replace=False)] + \
+    0.05 * rng.standard_normal((args.queries, embeddings.shape[1])).astype('float32')
+faiss.normalize_L2(queries)
+_, truth = faiss.knn(queries, embeddings, args.k, metric=faiss.METRIC_INNER_PRODUCT)
+
+spec = make_spec(args.index_type, nlist=args.nlist or int(4 * np.sqrt(len(embeddings))))
+print(f"Corpus: {embeddings.shape[0]} x {embeddings.shape[1]}, {spec['type']} index, "
+      f"{args.queries} queries, k={args.k}, {'mmap' if args.mmap else 'read into RAM'}, "
+      f"{os.cpu_count()} CPUs\n")
+print(f"{'shards':>6} {'shard MB':>9} {'total MB':>9} {'RSS MB':>7} {'par p50':>8} {'par p95':>8} "
+      f"{'seq p50':>8} {'seq p95':>8} {'recall@k':>9} {'build s':>8}")
+
+faiss.omp_set_num_threads(1)
+for num_shards in args.shards:
+    workdir = tempfile.TemporaryDirectory()
+    meta_path = os.path.join(workdir.name, 'faiss_index.json')
+    index_path = os.path.join(workdir.name, 'faiss_index.bin')
+
+    start = time.perf_counter()
+    if num_shards == 1:
+        index = build_index(embeddings, spec)
+        save_index(index, spec, index_path, meta_path)
+    else:
+        assignments, keys = shard_assignments(chunk_ids, num_shards)
+        index = build_sharded_index(embeddings, spec, assignments)
+        save_sharded_index(index, spec, 'hash', keys, os.path.join(workdir.name, 'shards'), meta_path)
+    build_seconds = time.perf_counter() - start
+    shards = index.shards if isinstance(index, ShardedIndex) else [index]
+    shard_mb = max(index_memory_bytes(shard) for shard in shards) / 1024 / 1024
+    total_mb = index_memory_bytes(index) / 1024 / 1024
+    del index, shards
+
+    queries_path = os.path.join(workdir.name, 'queries.npy')
+    np.save(queries_path, queries)
+    added_mb = loaded_rss_mb(index_path, meta_path, queries_path)
+    index, _ = load_index(index_path, meta_path, mmap=args.mmap)
+    parallel = measure(index)
+
+    sequential = parallel
+    if isinstance(index, ShardedIndex):
+        sequential = measure(ShardedIndex(index.shards, parallel=False))
+
+    print(f"{num_shards:>6} {shard_mb:>9.1f} {total_mb:>9.1f} {added_mb:>7.0f} {parallel[0]:>8.2f} "
+          f"{parallel[1]:>8.2f} {sequential[0]:>8.2f} {sequential[1]:>8.2f} {parallel[2]:>9.3f} "
+          f"{build_seconds:>8.1f}")
+    del index
+    workdir.cleanup()
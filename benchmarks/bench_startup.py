@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (EMBEDDING_MODEL, CHUNK_IDS_PATH, CHUNK_IDS_ARRAY_PATH,
+                    FAISS_INDEX_PATH, FAISS_INDEX_META_PATH)
+from vector_index import make_spec, build_index, save_index, load_index
+
+# Cold-start cost of the retriever, phase by phase: reading the FAISS index
+# into RAM and unpickling chunk_ids.pkl against memory-mapping the index and
+# chunk_ids.npy, plus the first and second search after each. Every mode runs
+# in a fresh process so nothing is already loaded; the OS page cache is warm
+# after the first run, as it is when a server restarts on the same machine.
+# The model phase shows what the warmup query saves the first user.
+# Uses the files in data/processed by default, or a synthetic index with
+# --synthetic N. Run from the repository root.
+
+parser = argparse.ArgumentParser(description="Retriever startup benchmark")
+parser.add_argument('--synthetic', type=int, help="build a synthetic index of N vectors")
+parser.add_argument('--index-type', default='ivf', help="synthetic index type")
+parser.add_argument('--encoding', default='float32', help="synthetic index encoding")
+parser.add_argument('--model', default=EMBEDDING_MODEL, help="model to time, or 'none' to skip")
+parser.add_argument('--runs', type=int, default=3, help="fresh processes per mode")
+parser.add_argument('--child', nargs=4, metavar=('MODE', 'INDEX', 'META', 'IDS'), help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def run_child(mode, index_path, meta_path, ids_prefix):
+    """Time one startup in this process and print the phases as JSON"""
+    phases = {}
+    base_rss = rss_mb()
+
+    if mode == 'model':
+        from sentence_transformers import SentenceTransformer
+        start = time.perf_counter()
+        model = SentenceTransformer(args.model)
+        phases['load_s'] = time.perf_counter() - start
+        for name in ('first_encode_s', 'second_encode_s'):
+            start = time.perf_counter()
+            model.encode(["transformer models for natural language processing"], show_progress_bar=False)
+            phases[name] = time.perf_counter() - start
+        phases['rss_mb'] = rss_mb() - base_rss
+        print(json.dumps(phases))
+        return
+
+    mmap = mode == 'mmap'
+    start = time.perf_counter()
+    index, _ = load_index(index_path, meta_path, mmap=mmap)
+    phases['index_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if mmap:
+        chunk_ids = np.load(ids_prefix + '.npy', mmap_mode='r')
+    else:
+        with open(ids_prefix + '.pkl', 'rb') as f:
+            chunk_ids = pickle.load(f)
+    phases['chunk_ids_s'] = time.perf_counter() - start
+    phases['load_rss_mb'] = rss_mb() - base_rss
+
+    rng = np.random.default_rng(0)
+    for name in ('first_search_s', 'second_search_s'):
+        query = rng.standard_normal((1, index.d)).astype('float32')
+        faiss.normalize_L2(query)
+        start = time.perf_counter()
+        _, labels = index.search(query, 10)
+        [chunk_ids[pos] for pos in labels[0] if pos >= 0]
+        phases[name] = time.perf_counter() - start
+    phases['rss_mb'] = rss_mb() - base_rss
+    print(json.dumps(phases))
+
+
+if args.child:
+    run_child(*args.child)
+    sys.exit(0)
+
+
+def measure(mode, paths):
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--model', args.model,
+                                 '--child', mode, *paths],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    # Median of the runs for each phase
+    return {key: float(np.median([run[key] for run in runs])) for key in runs[0]}
+
+
+workdir = None
+if args.synthetic:
+    workdir = tempfile.TemporaryDirectory()
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.synthetic, 384)).astype('float32')
+    faiss.normalize_L2(embeddings)
+    spec = make_spec(args.index_type, encoding=args.encoding, nlist=int(4 * np.sqrt(args.synthetic)))
+    print(f"Building a synthetic {args.index_type}/{args.encoding} index of {args.synthetic} vectors...")
+    index = build_index(embeddings, spec)
+    del embeddings
+
+    index_path = os.path.join(workdir.name, 'faiss_index.bin')
+    meta_path = os.path.join(workdir.name, 'faiss_index.json')
+    ids_prefix = os.path.join(workdir.name, 'chunk_ids')
+    save_index(index, spec, index_path, meta_path)
+    chunk_ids = list(range(1, args.synthetic + 1))
+    with open(ids_prefix + '.pkl', 'wb') as f:
+        pickle.dump(chunk_ids, f)
+    np.save(ids_prefix + '.npy', np.asarray(chunk_ids, dtype=np.int64))
+    del index, chunk_ids
+else:
+    index_path, meta_path = FAISS_INDEX_PATH, FAISS_INDEX_META_PATH
+    ids_prefix = os.path.splitext(CHUNK_IDS_PATH)[0]
+    if not os.path.exists(CHUNK_IDS_ARRAY_PATH):
+        sys.exit(f"{CHUNK_IDS_ARRAY_PATH} not found; rerun 05_generate_embeddings.py or use --synthetic")
+
+paths = (index_path, meta_path, ids_prefix)
+print(f"Index file: {os.path.getsize(index_path) / 1024 / 1024:.0f} MB, "
+      f"median of {args.runs} fresh processes\n")
+
+print(f"{'mode':<16} {'index s':>8} {'ids s':>8} {'1st search ms':>14} {'2nd search ms':>14} "
+      f"{'RSS loaded MB':>14} {'RSS after MB':>13}")
+for mode, label in [('read', 'read + pickle'), ('mmap', 'mmap + npy')]:
+    result = measure(mode, paths)
+    print(f"{label:<16} {result['index_s']:>8.3f} {result['chunk_ids_s']:>8.3f} "
+          f"{result['first_search_s'] * 1000:>14.2f} {result['second_search_s'] * 1000:>14.2f} "
+          f"{result['load_rss_mb']:>14.0f} {result['rss_mb']:>13.0f}")
+
+if args.model != 'none':
+    try:
+        result = measure('model', paths)
+    except subprocess.CalledProcessError as e:
+        print(f"\nModel timing skipped, could not load {args.model}: {e.stderr.strip().splitlines()[-1]}")
+    else:
+        print(f"\nModel {args.model}: load {result['load_s']:.2f}s, first encode "
+              f"{result['first_encode_s'] * 1000:.0f}ms, second encode {result['second_encode_s'] * 1000:.0f}ms "
+              f"(the warmup query pays the difference)")
+
+if workdir is not None:
+    workdir.cleanup()
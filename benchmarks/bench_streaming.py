@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ollama_client
+from fake_ollama import start_fake_ollama
+
+# Time-to-first-token with streaming versus waiting for the full response,
+# against a local fake Ollama that streams canned tokens. Also checks that
+# the streamed tokens reassemble into the complete response.
+
+NUM_REQUESTS = 20
+PREFILL_DELAY = 0.3
+TOKEN_DELAY = 0.03
+
+server = start_fake_ollama(prefill_delay=PREFILL_DELAY, token_delay=TOKEN_DELAY)
+print(f"Fake Ollama on {server.url} "
+      f"(prefill {PREFILL_DELAY * 1000:.0f}ms, {TOKEN_DELAY * 1000:.0f}ms/token, "
+      f"{len(server.tokens)} tokens)\n")
+
+blocking = []
+for _ in range(NUM_REQUESTS):
+    start = time.perf_counter()
+    text = ollama_client.generate("prompt", url=server.url)
+    blocking.append(time.perf_counter() - start)
+    assert text == server.response_text
+
+first_token = []
+streamed_total = []
+for _ in range(NUM_REQUESTS):
+    start = time.perf_counter()
+    tokens = []
+    for token in ollama_client.stream_generate("prompt", url=server.url):
+        if not tokens:
+            first_token.append(time.perf_counter() - start)
+        tokens.append(token)
+    streamed_total.append(time.perf_counter() - start)
+    assert ''.join(tokens) == server.response_text, "streamed tokens do not match"
+
+print(f"{'mode':<12} {'first text ms':>14} {'complete ms':>12}")
+print(f"{'blocking':<12} {np.median(blocking) * 1000:>14.0f} {np.median(blocking) * 1000:>12.0f}")
+print(f"{'streaming':<12} {np.median(first_token) * 1000:>14.0f} {np.median(streamed_total) * 1000:>12.0f}")
+print("\nStreamed tokens match the full response.")
+
+server.shutdown()
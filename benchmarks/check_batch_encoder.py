@@ -0,0 +1,115 @@
+import asyncio
+import os
+import sys
+import threading
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_encoder import BatchingEncoder
+
+# Checks that a caller giving up on its query does not stop the batching
+# worker: a submitted Future cancelled while it waits in the queue, and an
+# asyncio.wait_for timeout on asyncio.wrap_future(submit()) as async_app.py
+# awaits it, after which the next query must still be answered. Uses a
+# stand-in model whose encode can be held, so it needs no downloads. Exits
+# non-zero on failure.
+
+dimension = 32
+TIMEOUT = 10
+
+
+class HeldModel:
+    """Encodes text to a fixed random vector; encode waits while `hold` is clear"""
+
+    def __init__(self):
+        self.hold = threading.Event()
+        self.hold.set()
+        self.started = threading.Event()
+
+    def encode(self, texts, **kwargs):
+        self.started.set()
+        self.hold.wait()
+        return np.stack([np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(dimension)
+                         for text in texts]).astype('float32')
+
+
+vectors = np.random.default_rng(0).standard_normal((1000, dimension)).astype('float32')
+faiss.normalize_L2(vectors)
+index = faiss.IndexFlatIP(dimension)
+index.add(vectors)
+
+model = HeldModel()
+encoder = BatchingEncoder(model, index, window_ms=1)
+failures = 0
+
+
+def check(name, ok):
+    global failures
+    print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    if not ok:
+        failures += 1
+
+
+def served(query):
+    """True if a query is answered within TIMEOUT seconds"""
+    try:
+        _, indices = encoder.submit(query, 5).result(timeout=TIMEOUT)[1:]
+        return indices.shape == (1, 5)
+    except Exception:
+        return False
+
+
+# A Future cancelled while its query waits behind a batch that is encoding
+model.hold.clear()
+model.started.clear()
+first = encoder.submit('first', 5)
+model.started.wait(TIMEOUT)
+cancelled = encoder.submit('cancelled', 5)
+check("queued future cancels", cancelled.cancel())
+model.hold.set()
+check("batch in flight still answered", first.result(timeout=TIMEOUT)[2].shape == (1, 5))
+check("query after a cancelled future is served", served('after cancel'))
+check("worker alive after a cancelled future", encoder._worker.is_alive())
+
+
+# The async app's path: the awaiting task times out while its batch encodes
+async def timed_out():
+    model.hold.clear()
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(encoder.submit('timed out', 5)), 0.05)
+    except asyncio.TimeoutError:
+        return True
+    finally:
+        model.hold.set()
+    return False
+
+check("wait_for times out", asyncio.run(timed_out()))
+check("query after an async timeout is served", served('after timeout'))
+check("worker alive after an async timeout", encoder._worker.is_alive())
+
+# A timeout while the query is still queued, before the worker takes it
+model.hold.clear()
+model.started.clear()
+blocker = encoder.submit('blocker', 5)
+model.started.wait(TIMEOUT)
+
+
+async def queued_timeout():
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(encoder.submit('queued', 5)), 0.05)
+    except asyncio.TimeoutError:
+        return True
+    return False
+
+check("queued wait_for times out", asyncio.run(queued_timeout()))
+model.hold.set()
+blocker.result(timeout=TIMEOUT)
+check("query after a queued async timeout is served", served('after queued timeout'))
+check("worker alive after a queued async timeout", encoder._worker.is_alive())
+
+if encoder._worker.is_alive():
+    encoder.close()
+sys.exit(1 if failures else 0)
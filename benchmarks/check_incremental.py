@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import make_spec, build_index, update_index, write_embeddings
+
+# Checks that applying a delta with update_index() returns the same search
+# results as rebuilding the index from scratch over the surviving chunks,
+# the way 09_incremental_update.py and 05 + 06 would. Uses a synthetic
+# corpus, so it runs without PostgreSQL. Also replays an update that was
+# interrupted before chunk_ids.pkl was saved. Exits non-zero on mismatch.
+
+parser = argparse.ArgumentParser(description="Incremental index update vs full rebuild")
+parser.add_argument('--chunks', type=int, default=50000)
+parser.add_argument('--removed', type=int, default=2000, help="chunks of deleted or changed papers")
+parser.add_argument('--added', type=int, default=3000, help="chunks of new or changed papers")
+parser.add_argument('--queries', type=int, default=500)
+parser.add_argument('--k', type=int, default=10)
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+dimension = 384
+
+
+def synthetic_embeddings(n, num_topics=200):
+    topics = np.random.default_rng(1).standard_normal((num_topics, dimension)).astype('float32')
+    vectors = topics[rng.integers(0, num_topics, n)] + \
+        0.5 * rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def search_chunk_ids(index, chunk_ids, queries, k):
+    distances, labels = index.search(queries, k)
+    return distances, np.asarray(chunk_ids, dtype=np.int64)[labels]
+
+
+# Chunk ids are SERIAL: increasing, with gaps where chunks were deleted before
+chunk_ids = list(np.cumsum(rng.integers(1, 3, args.chunks)))
+embeddings = synthetic_embeddings(args.chunks)
+
+removed = sorted(rng.choice(chunk_ids, args.removed, replace=False).tolist())
+added_ids = list(range(chunk_ids[-1] + 1, chunk_ids[-1] + 1 + args.added))
+added_embeddings = synthetic_embeddings(args.added)
+
+queries = synthetic_embeddings(args.queries)
+spec = make_spec('flat')
+failures = 0
+
+# Full rebuild: 05 embeds the surviving chunks in chunk_id order, 06 indexes them
+removed_set = set(removed)
+keep = np.array([c not in removed_set for c in chunk_ids])
+full_ids = [c for c in chunk_ids if c not in removed_set] + added_ids
+start = time.perf_counter()
+full_index = build_index(np.vstack([embeddings[keep], added_embeddings]), spec)
+full_time = time.perf_counter() - start
+full_distances, full_results = search_chunk_ids(full_index, full_ids, queries, args.k)
+
+# Incremental: update the index built before the delta
+index = build_index(embeddings, spec)
+start = time.perf_counter()
+new_ids, num_removed = update_index(index, spec, chunk_ids, removed, added_ids, added_embeddings)
+update_time = time.perf_counter() - start
+distances, results = search_chunk_ids(index, new_ids, queries, args.k)
+
+same = np.array_equal(results, full_results) and np.allclose(distances, full_distances, atol=1e-5)
+failures += not same
+print(f"Incremental update: removed {num_removed}, added {len(added_ids)}, "
+      f"{index.ntotal} vectors, {len(new_ids) - index.ntotal} tombstones")
+print(f"  same results as full rebuild: {same}")
+print(f"  update {update_time * 1000:.0f} ms vs rebuild {full_time * 1000:.0f} ms")
+
+# Interrupted run: the index was saved with the new labels but chunk_ids.pkl
+# was not, so the next run starts again from the old chunk_ids
+index = build_index(embeddings, spec)
+update_index(index, spec, chunk_ids, removed, added_ids, added_embeddings)
+new_ids, _ = update_index(index, spec, chunk_ids, removed, added_ids, added_embeddings)
+distances, results = search_chunk_ids(index, new_ids, queries, args.k)
+
+same = np.array_equal(results, full_results) and index.ntotal == full_index.ntotal
+failures += not same
+print(f"Rerun after interruption: same results as full rebuild: {same}")
+
+# embeddings.npy rows stay aligned with positions in chunk_ids
+with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, 'embeddings.npy')
+    np.save(path, embeddings)
+    write_embeddings(path, len(chunk_ids), added_embeddings[:10])
+    write_embeddings(path, len(chunk_ids), added_embeddings)  # rerun overwrites, not appends
+    stored = np.load(path)
+    aligned = stored.shape[0] == len(new_ids) and np.array_equal(stored[len(chunk_ids):], added_embeddings)
+    failures += not aligned
+    print(f"Embedding rows aligned with chunk_ids: {aligned}")
+
+if failures:
+    print(f"\nFAILED: {failures} check(s)")
+    sys.exit(1)
+print("\nAll checks passed")
@@ -0,0 +1,159 @@
+"""Local stand-in for the Ollama generate API.
+
+Streams canned tokens with configurable prefill and per-token delays, so
+streaming, timeouts and load can be exercised without a model. Prefill can
+also grow with the prompt (prompt_token_delay per whitespace-separated
+word), as it does on a real model. With shared=True concurrent generations
+share one model: n at once each run n times slower, as on a single GPU or
+CPU. Use it in-process with start_fake_ollama(), or run it as a server:
+
+    python benchmarks/fake_ollama.py --port 11434 --token-delay 0.05
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TOKENS = (
+    "According to Paper 1 , transformers use self - attention to weigh "
+    "every token against every other token in the sequence ."
+).split(' ')
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Hundreds of clients may connect at once
+    request_queue_size = 1024
+
+    def __init__(self, address, tokens=None, prefill_delay=0.2, token_delay=0.02,
+                 prompt_token_delay=0.0, shared=False):
+        super().__init__(address, FakeOllamaHandler)
+        self.tokens = [t + ' ' for t in (tokens or DEFAULT_TOKENS)]
+        self.prefill_delay = prefill_delay
+        self.token_delay = token_delay
+        self.prompt_token_delay = prompt_token_delay
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is expected
+        pass
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/generate"
+
+    @property
+    def response_text(self):
+        return ''.join(self.tokens)
+
+    def prefill_time(self, payload):
+        return self.prefill_delay + self.prompt_token_delay * len(payload.get('prompt', '').split())
+
+    def work(self, seconds):
+        """Sleep for `seconds` of model time, slowed by other generations if shared"""
+        if not self.shared:
+            time.sleep(seconds)
+            return
+        while seconds > 0:
+            with self.lock:
+                active = max(self.active, 1)
+            step = min(seconds, 0.005)
+            time.sleep(step * active)
+            seconds -= step
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+
+        try:
+            # Ollama streams unless told otherwise
+            if payload.get('stream', True):
+                self._stream(payload, server)
+            else:
+                self._complete(payload, server)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _complete(self, payload, server):
+        server.work(server.prefill_time(payload) + server.token_delay * len(server.tokens))
+        body = json.dumps({
+            'model': payload.get('model'),
+            'response': server.response_text,
+            'done': True
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, payload, server):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        server.work(server.prefill_time(payload))
+        for token in server.tokens:
+            self._write_chunk({'model': payload.get('model'), 'response': token, 'done': False})
+            server.work(server.token_delay)
+        self._write_chunk({'model': payload.get('model'), 'response': '', 'done': True,
+                           'eval_count': len(server.tokens)})
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _write_chunk(self, obj):
+        data = json.dumps(obj).encode('utf-8') + b'\n'
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_ollama(port=0, **kwargs):
+    """Start a fake Ollama server on a background thread and return it"""
+    server = FakeOllamaServer(('127.0.0.1', port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--prefill-delay', type=float, default=0.2)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    parser.add_argument('--prompt-token-delay', type=float, default=0.0)
+    parser.add_argument('--shared', action='store_true', help="concurrent generations slow each other down")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(('127.0.0.1', args.port),
+                              prefill_delay=args.prefill_delay,
+                              token_delay=args.token_delay,
+                              prompt_token_delay=args.prompt_token_delay,
+                              shared=args.shared)
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,98 @@
+"""Synthetic corpus in the layout the pipeline scripts write.
+
+build_synthetic_corpus() writes data/processed/ under a scratch directory
+with a FAISS index, embeddings.npy, chunk_ids.pkl/.npy, the index manifest
+and a chunk store, so the app and retrievers run from it unchanged (with
+the scratch directory as the working directory) without a database or the
+arXiv snapshot. Chunks are topic sentences padded with filler words to
+roughly the length of real chunks, so prompts are realistically sized.
+"""
+import json
+import os
+import pickle
+from datetime import date
+
+import faiss
+import numpy as np
+
+from chunk_filters import ChunkAttributes
+from chunk_store import DOCUMENT_FIELDS, StringColumnWriter
+from vector_index import make_spec, build_index, save_index, save_manifest, save_chunk_ids_array
+
+TOPICS = [
+    "transformer models for natural language processing",
+    "graph neural networks for molecule property prediction",
+    "reinforcement learning with sparse rewards",
+    "contrastive self-supervised learning for images",
+    "differential privacy in federated learning",
+    "retrieval augmented generation for question answering",
+    "adversarial robustness of image classifiers",
+    "efficient attention for long sequences",
+]
+
+CATEGORIES = ['cs.LG', 'cs.CL', 'cs.CV', 'cs.AI', 'cs.IR']
+
+FILLER = ("we propose evaluate method results show baseline dataset model training "
+          "performance improves experiments benchmark approach analysis").split()
+
+
+def synthetic_queries(n, seed=0):
+    """Distinct questions about the corpus topics"""
+    rng = np.random.default_rng(seed)
+    return [f"{TOPICS[i % len(TOPICS)]} {' '.join(rng.choice(FILLER, 3))} {i}" for i in range(n)]
+
+
+def build_synthetic_corpus(data_dir, n, index_type='ivf', dimension=384, chunk_words=150, seed=0):
+    """Write an index and chunk store of n chunks under data_dir/data/processed"""
+    processed = os.path.join(data_dir, 'data', 'processed')
+    store_dir = os.path.join(processed, 'chunk_store')
+    os.makedirs(store_dir)
+    rng = np.random.default_rng(seed)
+
+    embeddings = rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(embeddings)
+    spec = make_spec(index_type, nlist=int(4 * np.sqrt(n)))
+    print(f"Building a synthetic {index_type} index of {n} vectors...")
+    index = build_index(embeddings, spec)
+    np.save(os.path.join(processed, 'embeddings.npy'), embeddings)
+    meta = save_index(index, spec, os.path.join(processed, 'faiss_index.bin'),
+                      os.path.join(processed, 'faiss_index.json'))
+    del embeddings, index
+
+    chunk_ids = list(range(1, n + 1))
+    with open(os.path.join(processed, 'chunk_ids.pkl'), 'wb') as f:
+        pickle.dump(chunk_ids, f)
+    save_chunk_ids_array(chunk_ids, os.path.join(processed, 'chunk_ids.npy'))
+    save_manifest({'mode': 'full', 'index_built_at': meta['built_at'], 'chunk_ids': n, 'vectors': n},
+                  os.path.join(processed, 'index_manifest.json'))
+
+    # One document per chunk
+    chunk_text = StringColumnWriter(os.path.join(store_dir, 'chunk_text'))
+    doc_columns = {
+        field: StringColumnWriter(os.path.join(store_dir, f'doc_{field}'))
+        for field in DOCUMENT_FIELDS
+    }
+    attribute_rows = []
+    for pos in range(n):
+        topic = TOPICS[pos % len(TOPICS)]
+        category = CATEGORIES[pos % len(CATEGORIES)]
+        update_date = date(2020 + pos % 5, 1 + pos % 12, 1 + pos % 28)
+        filler = ' '.join(rng.choice(FILLER, chunk_words - len(topic.split())))
+        chunk_text.append(f"This paper studies {topic}. {filler}.")
+        doc_columns['document_id'].append(f"synthetic.{pos:07d}")
+        doc_columns['title'].append(f"On {topic} ({pos})")
+        doc_columns['authors'].append("A. Author, B. Author")
+        doc_columns['categories'].append(category)
+        doc_columns['update_date'].append(update_date.isoformat())
+        attribute_rows.append((pos, category, update_date))
+    chunk_text.close()
+    for column in doc_columns.values():
+        column.close()
+
+    np.save(os.path.join(store_dir, 'chunk_ids.npy'), np.asarray(chunk_ids, dtype=np.int64))
+    np.save(os.path.join(store_dir, 'doc_index.npy'), np.arange(n, dtype=np.int32))
+    ChunkAttributes.from_rows(attribute_rows, n).save(store_dir)
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump({'num_chunks': n, 'num_documents': n, 'missing_chunks': 0,
+                   'built_at': meta['built_at']}, f, indent=2)
+    return processed
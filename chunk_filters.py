@@ -0,0 +1,236 @@
+"""Category and date filters applied inside the FAISS search.
+
+ChunkAttributes holds, per FAISS row position, the update date of the
+chunk's paper and, per category, the sorted positions of chunks whose
+paper lists that category. 06_build_chunk_store.py saves them with the
+chunk store; without a current store they are loaded from PostgreSQL.
+
+FilteredSearch turns a filter into a bitmap of allowed positions. Small
+selections are scored exactly against the memory-mapped embeddings;
+larger ones are passed to the index as an IDSelector, so FAISS only ever
+returns matching chunks instead of over-fetching and discarding.
+"""
+import json
+import math
+import os
+import threading
+from datetime import date
+
+import faiss
+import numpy as np
+
+from config import FILTER_EXACT_MAX, FILTER_MAX_EXPANSION
+from db import get_pool
+
+EPOCH = date(1970, 1, 1)
+MISSING_DATE = np.iinfo(np.int32).min
+
+
+def to_days(value):
+    """Days since 1970-01-01 for a date or ISO date string"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return (value - EPOCH).days
+
+
+class ChunkAttributes:
+    def __init__(self, dates, category_names, category_offsets, category_positions):
+        self.dates = dates
+        self.category_names = list(category_names)
+        self.category_offsets = category_offsets
+        self.category_positions = category_positions
+        self._categories = {name: i for i, name in enumerate(self.category_names)}
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_rows(cls, rows, num_positions):
+        """Build from (position, categories, update_date) rows; missing positions match nothing"""
+        dates = np.full(num_positions, MISSING_DATE, dtype=np.int32)
+        by_category = {}
+        for position, categories, update_date in rows:
+            if update_date:
+                dates[position] = to_days(update_date)
+            for category in (categories or '').split():
+                by_category.setdefault(category, []).append(position)
+
+        names = sorted(by_category)
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(by_category[name]) for name in names])
+        positions = np.empty(offsets[-1], dtype=np.int64)
+        for i, name in enumerate(names):
+            positions[offsets[i]:offsets[i + 1]] = sorted(by_category[name])
+        return cls(dates, names, offsets, positions)
+
+    @classmethod
+    def from_database(cls, conn, chunk_ids):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT r.pos - 1, d.categories, d.update_date
+            FROM unnest(%s::int[]) WITH ORDINALITY AS r(chunk_id, pos)
+            JOIN document_chunks dc ON dc.chunk_id = r.chunk_id
+            JOIN documents d ON dc.document_id = d.document_id
+        """, ([int(c) for c in chunk_ids],))
+        attributes = cls.from_rows(cursor.fetchall(), len(chunk_ids))
+        cursor.close()
+        return attributes
+
+    def save(self, path):
+        np.save(os.path.join(path, 'attr_dates.npy'), self.dates)
+        np.save(os.path.join(path, 'attr_category_offsets.npy'), self.category_offsets)
+        np.save(os.path.join(path, 'attr_category_positions.npy'), self.category_positions)
+        with open(os.path.join(path, 'attr_categories.json'), 'w') as f:
+            json.dump(self.category_names, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'attr_categories.json')) as f:
+            names = json.load(f)
+        return cls(
+            np.load(os.path.join(path, 'attr_dates.npy'), mmap_mode='r'),
+            names,
+            np.load(os.path.join(path, 'attr_category_offsets.npy')),
+            np.load(os.path.join(path, 'attr_category_positions.npy'), mmap_mode='r')
+        )
+
+    def select(self, categories=None, date_from=None, date_to=None):
+        """Boolean mask of positions matching every given filter.
+
+        A chunk matches `categories` if its paper lists any of them.
+        Dates are inclusive and may be dates or ISO strings.
+        """
+        mask = np.ones(len(self.dates), dtype=bool)
+        if date_from is not None:
+            mask &= self.dates >= to_days(date_from)
+        if date_to is not None:
+            mask &= self.dates <= to_days(date_to)
+        if date_from is not None or date_to is not None:
+            mask &= self.dates != MISSING_DATE
+
+        if categories:
+            in_category = np.zeros(len(self.dates), dtype=bool)
+            for category in categories:
+                i = self._categories.get(category)
+                if i is not None:
+                    in_category[self.category_positions[self.category_offsets[i]:self.category_offsets[i + 1]]] = True
+            mask &= in_category
+        return mask
+
+
+def load_chunk_attributes(chunk_ids, store):
+    """Attributes saved with a current chunk store, else loaded from PostgreSQL"""
+    if store is not None and os.path.exists(os.path.join(store.path, 'attr_dates.npy')):
+        return ChunkAttributes.load(store.path)
+    print("Loading chunk attributes for filtered search from PostgreSQL...")
+    with get_pool().connection() as conn:
+        return ChunkAttributes.from_database(conn, chunk_ids)
+
+
+def parse_filters(data):
+    """Read categories/date_from/date_to from a request body; None if there are none.
+
+    Raises ValueError for malformed dates.
+    """
+    categories = data.get('categories') or None
+    if isinstance(categories, str):
+        categories = categories.split()
+    filters = {
+        'categories': categories,
+        'date_from': data.get('date_from') or None,
+        'date_to': data.get('date_to') or None
+    }
+    for key in ('date_from', 'date_to'):
+        if filters[key] is not None:
+            if not isinstance(filters[key], str):
+                raise ValueError(f"{key} must be a YYYY-MM-DD string")
+            to_days(filters[key])
+    if not any(filters.values()):
+        return None
+    return filters
+
+
+def filtered_search_for(index, spec, chunk_ids, store, embeddings):
+    """FilteredSearch over a retriever's index; attributes load on first use.
+
+    `embeddings` is the memory-mapped embeddings.npy, or None to always
+    search the index.
+    """
+    return FilteredSearch(index, spec, lambda: load_chunk_attributes(chunk_ids, store),
+                          embeddings=embeddings)
+
+
+class FilteredSearch:
+    """Vector search restricted to the positions selected by a filter.
+
+    `load_attributes` is called on the first filtered query, so an app
+    that never filters pays nothing at startup.
+    """
+
+    def __init__(self, index, spec, load_attributes, embeddings=None, exact_max=FILTER_EXACT_MAX,
+                 max_expansion=FILTER_MAX_EXPANSION):
+        self.index = index
+        self.spec = spec
+        self.embeddings = embeddings
+        self.exact_max = exact_max
+        self.max_expansion = max_expansion
+        self._load_attributes = load_attributes
+        self._attributes = None
+        self._lock = threading.Lock()
+
+        self.exact_searches = 0
+        self.index_searches = 0
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            with self._lock:
+                if self._attributes is None:
+                    self._attributes = self._load_attributes()
+        return self._attributes
+
+    def search(self, query, top_k, categories=None, date_from=None, date_to=None):
+        """Search one normalized query (shape (1, d)); returns (distances, indices) like index.search"""
+        mask = self.attributes.select(categories, date_from, date_to)
+        selected = np.flatnonzero(mask)
+
+        distances = np.full((1, top_k), -np.inf, dtype='float32')
+        indices = np.full((1, top_k), -1, dtype='int64')
+        if len(selected) == 0:
+            return distances, indices
+
+        if self.embeddings is not None and len(selected) <= self.exact_max:
+            # Few enough candidates to score them all exactly
+            self.exact_searches += 1
+            vectors = np.asarray(self.embeddings[selected], dtype='float32')
+            norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+            scores = (vectors @ query[0]) / np.maximum(norms, 1e-12)
+            count = min(top_k, len(selected))
+            best = np.argpartition(-scores, count - 1)[:count]
+            best = best[np.argsort(-scores[best])]
+            distances[0, :count] = scores[best]
+            indices[0, :count] = selected[best]
+            return distances, indices
+
+        # Search the index, skipping positions outside the filter. Sparse
+        # filters widen the search so enough matches are reached.
+        self.index_searches += 1
+        bitmap = np.packbits(mask, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        expansion = min(self.max_expansion, len(mask) / len(selected))
+        if self.spec['type'] in ('ivf', 'ivfpq'):
+            # FAISS caps nprobe at the number of lists
+            nprobe = math.ceil(self.spec['nprobe'] * expansion)
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        elif self.spec['type'] == 'hnsw':
+            params = faiss.SearchParametersHNSW(sel=selector,
+                                                efSearch=math.ceil(self.spec['ef_search'] * expansion))
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        return self.index.search(query, top_k, params=params)
+
+    def stats(self):
+        return {
+            'exact_searches': self.exact_searches,
+            'index_searches': self.index_searches
+        }
@@ -0,0 +1,168 @@
+"""Memory-mapped chunk store addressed by FAISS row position.
+
+scripts/06_build_chunk_store.py exports chunk text and document metadata
+into flat files so that hydrating a search hit is an array lookup instead
+of a Postgres round trip. When the store does not match the current
+chunk_ids list, retrievers fall back to fetch_chunks(), which loads all
+hits in a single query (fetch_chunks_async() in the async app).
+"""
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+from config import CHUNK_STORE_DIR
+
+DOCUMENT_FIELDS = ['document_id', 'title', 'authors', 'categories', 'update_date']
+
+
+class StringColumnWriter:
+    """Append UTF-8 strings to a blob file and record their offsets"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.blob = open(prefix + '.bin', 'wb')
+        self.offsets = [0]
+
+    def append(self, value):
+        data = b'' if value is None else str(value).encode('utf-8')
+        self.blob.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self.blob.close()
+        np.save(self.prefix + '.offsets.npy', np.array(self.offsets, dtype=np.int64))
+
+
+class StringColumn:
+    """Read-only view over a blob written by StringColumnWriter"""
+
+    def __init__(self, prefix):
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        if os.path.getsize(prefix + '.bin') > 0:
+            self.blob = np.memmap(prefix + '.bin', dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if start == end:
+            return None
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+
+class ChunkStore:
+    """Chunk text and document metadata, one row per FAISS vector"""
+
+    def __init__(self, path=CHUNK_STORE_DIR):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        self.chunk_ids = np.load(os.path.join(path, 'chunk_ids.npy'), mmap_mode='r')
+        self.doc_index = np.load(os.path.join(path, 'doc_index.npy'), mmap_mode='r')
+        self.chunk_text = StringColumn(os.path.join(path, 'chunk_text'))
+        self.documents = {
+            field: StringColumn(os.path.join(path, f'doc_{field}'))
+            for field in DOCUMENT_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def is_current(self, chunk_ids):
+        """True if the store was built for exactly this FAISS row order"""
+        if len(chunk_ids) != len(self.chunk_ids):
+            return False
+        return np.array_equal(np.asarray(chunk_ids, dtype=np.int64), self.chunk_ids)
+
+    def get(self, position):
+        """Return the chunk at a FAISS row position, or None if it was missing at build time"""
+        doc = int(self.doc_index[position])
+        if doc < 0:
+            return None
+
+        update_date = self.documents['update_date'][doc]
+        return {
+            'chunk_id': int(self.chunk_ids[position]),
+            'chunk_text': self.chunk_text[position],
+            'document_id': self.documents['document_id'][doc],
+            'title': self.documents['title'][doc],
+            'authors': self.documents['authors'][doc],
+            'categories': self.documents['categories'][doc],
+            'update_date': date.fromisoformat(update_date) if update_date else None
+        }
+
+    def get_many(self, positions):
+        return [self.get(int(pos)) for pos in positions]
+
+
+def load_chunk_store(chunk_ids, path=CHUNK_STORE_DIR):
+    """Open the chunk store if it exists and matches chunk_ids, else return None"""
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        print("Chunk store not found, hydrating from PostgreSQL")
+        return None
+
+    store = ChunkStore(path)
+    if not store.is_current(chunk_ids):
+        print("Chunk store is stale, hydrating from PostgreSQL")
+        return None
+    return store
+
+
+CHUNKS_QUERY = """
+    SELECT
+        dc.chunk_id,
+        dc.chunk_text,
+        dc.document_id,
+        d.title,
+        d.authors,
+        d.categories,
+        d.update_date
+    FROM document_chunks dc
+    JOIN documents d ON dc.document_id = d.document_id
+    WHERE dc.chunk_id = ANY({ids})
+"""
+
+
+def _ordered_rows(rows, chunk_ids):
+    found = {}
+    for row in rows:
+        found[row[0]] = {
+            'chunk_id': row[0],
+            'chunk_text': row[1],
+            'document_id': row[2],
+            'title': row[3],
+            'authors': row[4],
+            'categories': row[5],
+            'update_date': row[6]
+        }
+    return [found.get(chunk_id) for chunk_id in chunk_ids]
+
+
+def fetch_chunks(conn, chunk_ids):
+    """Load chunk rows from PostgreSQL in one round trip, in the order given"""
+    chunk_ids = [int(c) for c in chunk_ids]
+    if not chunk_ids:
+        return []
+
+    cursor = conn.cursor()
+    cursor.execute(CHUNKS_QUERY.format(ids='%s'), (chunk_ids,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    return _ordered_rows(rows, chunk_ids)
+
+
+async def fetch_chunks_async(conn, chunk_ids):
+    """fetch_chunks() on an asyncpg connection"""
+    chunk_ids = [int(c) for c in chunk_ids]
+    if not chunk_ids:
+        return []
+
+    rows = await conn.fetch(CHUNKS_QUERY.format(ids='$1'), chunk_ids)
+    return _ordered_rows(rows, chunk_ids)
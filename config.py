@@ -0,0 +1,107 @@
+# Shared settings for the app, pipeline scripts and benchmarks.
+# Paths are relative to the repository root, like the rest of the project.
+
+# PostgreSQL
+DB_HOST = "localhost"
+DB_NAME = "rag_chatbot_db"
+DB_POOL_MIN = 1
+DB_POOL_MAX = 10
+DB_POOL_TIMEOUT = 10  # seconds to wait for a free connection
+DB_HEALTHCHECK_INTERVAL = 30  # ping connections idle for longer than this
+
+# Query logging: a background thread writes queries and retrieval_logs in batches
+QUERY_LOG_QUEUE_SIZE = 10000  # records beyond this are dropped rather than waited for
+QUERY_LOG_BATCH_SIZE = 500
+QUERY_LOG_FLUSH_INTERVAL = 1.0  # seconds a partial batch waits before it is written
+
+# Log partitions and analytics rollups (log_rollups.py): queries and
+# retrieval_logs are partitioned by month, and 11_refresh_rollups.py adds
+# each completed hour to the rollup tables
+LOG_PARTITION_MONTHS_AHEAD = 3  # partitions created beyond the current month
+ROLLUP_LAG_MINUTES = 10  # an hour is rolled up once it ended this long ago
+# Log rows are stamped by the database when the writer's batch transaction
+# starts, the clock the watermark is read from; a batch that commits more
+# than ROLLUP_LAG_MINUTES after it started would still miss its hour
+
+# Raw and filtered papers
+ARXIV_SNAPSHOT_PATH = "data/raw/arxiv-metadata-oai-snapshot.json"
+PAPERS_PICKLE_PATH = "data/processed/cs_papers_2020_2024.pkl"
+PAPERS_DATASET_DIR = "data/processed/papers"  # Parquet, partitioned by year/category
+
+# Processed artifacts
+PROCESSED_DIR = "data/processed"
+EMBEDDINGS_PATH = "data/processed/embeddings.npy"
+CHUNK_IDS_PATH = "data/processed/chunk_ids.pkl"
+CHUNK_IDS_ARRAY_PATH = "data/processed/chunk_ids.npy"  # same ids as a flat int64 array
+FAISS_INDEX_PATH = "data/processed/faiss_index.bin"
+FAISS_INDEX_META_PATH = "data/processed/faiss_index.json"
+FAISS_INDEX_REPORT_PATH = "data/processed/faiss_index_report.json"  # memory/recall/latency at build time
+FAISS_SHARD_DIR = "data/processed/faiss_shards"  # one index file per shard (06 --shards N)
+INDEX_MANIFEST_PATH = "data/processed/index_manifest.json"  # snapshot the index reflects
+CHUNK_STORE_DIR = "data/processed/chunk_store"
+
+# Startup: memory-map the FAISS index and chunk_ids.npy instead of reading them
+# into RAM, run one query before reporting ready (GET /ready), and have the app
+# start loading as soon as it starts instead of on the first request
+INDEX_MMAP = True
+STARTUP_WARMUP = True
+APP_EAGER_LOAD = True
+
+# serve.py: pre-forked production server. Workers share the model, index and
+# chunk ids loaded by the master; each runs one torch/FAISS thread.
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 5000
+SERVE_WORKERS = 0  # 0 = one per CPU core
+SERVE_WORKER_THREADS = 1  # torch / OpenMP threads per worker
+
+# Models
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBED_CHECKPOINT_ROWS = 50000  # 05_generate_embeddings.py saves progress this often
+
+# Chunking, in word-pieces of the embedding model's tokenizer.
+# all-MiniLM-L6-v2 truncates its input at 256 tokens, [CLS] and [SEP] included.
+CHUNK_MAX_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 32
+CHUNK_MIN_WORDS = 20  # shorter chunks are dropped
+
+# Query micro-batching: wait up to this long for more queries to share a batch
+EMBED_BATCH_WINDOW_MS = 5
+EMBED_BATCH_MAX_SIZE = 32
+
+# Query embedding cache: normalized query text -> embedding, in front of model.encode
+EMBEDDING_CACHE_SIZE = 10000  # entries (1.5 KB each), 0 to disable
+EMBEDDING_CACHE_PATH = "data/processed/query_embedding_cache"  # .npy + .json, saved on shutdown
+EMBEDDING_CACHE_WARM = 1000  # most frequent past queries embedded at startup, 0 to disable
+
+# Filtered search (categories / date range)
+FILTER_EXACT_MAX = 2000  # selections up to this many chunks are scored exactly
+FILTER_MAX_EXPANSION = 16  # sparse filters raise nprobe / efSearch by up to this factor
+
+# Prompt context packing: retrieved chunks are deduplicated, overlapping
+# chunks of one abstract merged, and passages added up to this many tokens
+CONTEXT_TOKEN_BUDGET = 600
+CONTEXT_DEDUP_THRESHOLD = 0.95  # drop chunks this similar to a better-ranked one
+CONTEXT_MIN_OVERLAP_WORDS = 5  # shortest shared run of words that merges two chunks
+CONTEXT_MIN_PASSAGE_TOKENS = 64  # don't add a cut-down passage shorter than this
+
+# Semantic answer cache: reuse an answer when a new query is this similar
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL = 24 * 3600  # seconds
+ANSWER_CACHE_SIZE = 1000
+ANSWER_CACHE_WARM = 200  # recent queries loaded at startup, 0 to disable
+
+# Ollama
+OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "mistral:latest"
+OLLAMA_URLS = [OLLAMA_URL]  # more endpoints are load-balanced, least busy first
+OLLAMA_MAX_CONCURRENCY = 2  # generations in flight per endpoint (match OLLAMA_NUM_PARALLEL)
+OLLAMA_QUEUE_SIZE = 32  # callers waiting for a slot; beyond this requests get a 503
+OLLAMA_QUEUE_TIMEOUT = 60  # seconds a caller waits for a slot before giving up
+OLLAMA_CONNECT_TIMEOUT = 3.0  # seconds
+OLLAMA_READ_TIMEOUT = 300.0  # seconds without a byte (a whole answer when not streaming)
+OLLAMA_ENDPOINT_COOLDOWN = 10  # seconds an unreachable endpoint is skipped
+OLLAMA_RETRY_AFTER = 5  # Retry-After seconds sent with a 503
+
+# Batch answering (/ask_batch and scripts/10_batch_eval.py)
+BATCH_MAX_QUESTIONS = 1000  # per /ask_batch request
+BATCH_LLM_CONCURRENCY = OLLAMA_MAX_CONCURRENCY * len(OLLAMA_URLS)  # generations in flight per batch
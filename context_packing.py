@@ -0,0 +1,163 @@
+"""Token-budgeted prompt context from retrieved chunks.
+
+Retrieved chunks overlap a lot: consecutive chunks of one abstract share
+CHUNK_OVERLAP_TOKENS of text, and near-identical abstracts come back as
+separate hits. ContextPacker.pack() drops chunks whose stored vectors are
+near-duplicates of a better-ranked chunk, stitches overlapping chunks of
+the same document back into one passage, and adds passages in rank order
+until the token budget is spent, cutting the last one short if needed.
+
+Tokens are counted with the embedding model's tokenizer, which is close to,
+but not the same as, the LLM's count. Results need a `position` (their
+FAISS row) for the duplicate check; without stored vectors it is skipped.
+"""
+import numpy as np
+
+from config import (CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MIN_OVERLAP_WORDS,
+                    CONTEXT_MIN_PASSAGE_TOKENS)
+from metrics import Histogram, Counter
+from text_processing import TokenCounter
+
+CONTEXT_TOKENS = Histogram('rag_context_tokens', "Prompt context tokens after packing",
+                           buckets=(128, 256, 512, 768, 1024, 1536, 2048, 4096))
+CONTEXT_CHUNKS = Counter('rag_context_chunks_total', "Retrieved chunks by what packing did with them",
+                         ['outcome'])
+
+# Tokens taken by "[Paper N]", "Title:" and "Content:" around each passage
+PASSAGE_OVERHEAD_TOKENS = 12
+# Longest overlap looked for between two chunks; chunk overlap is at most
+# CHUNK_OVERLAP_TOKENS word-pieces, so never more words than that
+MAX_OVERLAP_WORDS = 64
+
+
+def merge_overlap(first, second, min_overlap=CONTEXT_MIN_OVERLAP_WORDS):
+    """first + second without the words they share, if first ends where second starts, else None"""
+    for size in range(min(len(first), len(second), MAX_OVERLAP_WORDS), min_overlap - 1, -1):
+        if first[-size:] == second[:size]:
+            return first + second[size:]
+    return None
+
+
+def merge_passages(passages, min_overlap=CONTEXT_MIN_OVERLAP_WORDS):
+    """Merge a document's word lists wherever one ends with the start of another.
+
+    Each passage is (words, results); merged passages keep all their results.
+    A passage contained in another is folded into it.
+    """
+    passages = list(passages)
+    merged = True
+    while merged and len(passages) > 1:
+        merged = False
+        for i in range(len(passages)):
+            for j in range(len(passages)):
+                if i == j:
+                    continue
+                words_i, results_i = passages[i]
+                words_j, results_j = passages[j]
+                if f" {' '.join(words_j)} " in f" {' '.join(words_i)} ":
+                    combined = words_i
+                else:
+                    combined = merge_overlap(words_i, words_j, min_overlap)
+                if combined is not None:
+                    passages[i] = (combined, results_i + results_j)
+                    del passages[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return passages
+
+
+class ContextPacker:
+    def __init__(self, tokenizer, embeddings=None, budget=CONTEXT_TOKEN_BUDGET,
+                 dedup_threshold=CONTEXT_DEDUP_THRESHOLD, min_overlap=CONTEXT_MIN_OVERLAP_WORDS,
+                 min_passage_tokens=CONTEXT_MIN_PASSAGE_TOKENS):
+        self.counter = TokenCounter(tokenizer)
+        self.embeddings = embeddings
+        self.budget = budget
+        self.dedup_threshold = dedup_threshold
+        self.min_overlap = min_overlap
+        self.min_passage_tokens = min_passage_tokens
+
+    def count_tokens(self, text):
+        return sum(self.counter.count(text.split())) if text else 0
+
+    def pack(self, results, budget=None):
+        """Return (passages, stats) for the prompt.
+
+        Passages are result-shaped dicts (title, categories, chunk_text, ...)
+        in rank order, with `chunk_ids` listing the chunks each one covers.
+        Every input result gets `used` set to whether its text is in the context.
+        """
+        budget = self.budget if budget is None else budget
+        stats = {'chunks': len(results), 'duplicates': 0, 'merged': 0, 'truncated': 0,
+                 'dropped': 0, 'tokens': 0}
+        for result in results:
+            result['used'] = False
+
+        kept = self._drop_duplicates(results)
+        stats['duplicates'] = len(results) - len(kept)
+
+        # Group by document in order of each document's best hit, then stitch
+        # overlapping chunks back together
+        documents = {}
+        for result in kept:
+            documents.setdefault(result['document_id'], []).append(result)
+
+        passages = []
+        for document_results in documents.values():
+            merged = merge_passages([((r['chunk_text'] or '').split(), [r]) for r in document_results],
+                                    self.min_overlap)
+            stats['merged'] += len(document_results) - len(merged)
+            for words, members in merged:
+                best = min(members, key=lambda r: r['rank'])
+                passages.append((best, words, members))
+        passages.sort(key=lambda passage: passage[0]['rank'])
+
+        packed = []
+        remaining = budget
+        for best, words, members in passages:
+            header = PASSAGE_OVERHEAD_TOKENS + self.count_tokens(best.get('title'))
+            counts = self.counter.count(words)
+
+            if header + sum(counts) > remaining:
+                # Cut the passage short if enough of it fits to be worth it,
+                # but always give the LLM at least part of the best passage
+                room = remaining - header
+                if packed and room < self.min_passage_tokens:
+                    continue
+                cut = int(np.searchsorted(np.cumsum(counts), room, side='right'))
+                if cut == 0:
+                    continue
+                words, counts = words[:cut] + ['...'], counts[:cut]
+                stats['truncated'] += 1
+
+            tokens = header + sum(counts)
+            for member in members:
+                member['used'] = True
+            packed.append(dict(best, chunk_text=' '.join(words),
+                               chunk_ids=[member['chunk_id'] for member in members]))
+            remaining -= tokens
+            stats['tokens'] += tokens
+
+        stats['dropped'] = sum(1 for result in kept if not result['used'])
+        CONTEXT_TOKENS.observe(stats['tokens'])
+        for outcome in ('duplicates', 'merged', 'truncated', 'dropped'):
+            if stats[outcome]:
+                CONTEXT_CHUNKS.inc(stats[outcome], outcome=outcome)
+        return packed, stats
+
+    def _drop_duplicates(self, results):
+        """Results minus those whose vector is near-identical to a better-ranked one"""
+        if self.embeddings is None or any('position' not in r for r in results) or len(results) < 2:
+            return list(results)
+
+        vectors = np.asarray(self.embeddings[np.array([r['position'] for r in results])], dtype='float32')
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarities = vectors @ vectors.T
+
+        kept = []
+        for i, result in enumerate(results):
+            if all(similarities[i, j] < self.dedup_threshold for j in kept):
+                kept.append(i)
+        return [results[i] for i in kept]
@@ -0,0 +1,259 @@
+"""Thread-safe PostgreSQL connection pool shared by the app and scripts.
+
+psycopg2's ThreadedConnectionPool raises as soon as every connection is
+checked out; ConnectionPool instead makes callers wait (up to a timeout),
+health-checks connections before handing them out, replaces dropped ones
+and records how long callers waited.
+
+The async app (async_app.py) uses an asyncpg pool instead, from
+get_async_pool(), with the same size, timeout and wait-time metrics.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from config import (DB_HOST, DB_NAME, DB_POOL_MIN, DB_POOL_MAX,
+                    DB_POOL_TIMEOUT, DB_HEALTHCHECK_INTERVAL)
+from metrics import POOL_WAIT_SECONDS, POOL_TIMEOUTS
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool timeout"""
+
+
+class ConnectionPool:
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_interval=DB_HEALTHCHECK_INTERVAL, **connect_kwargs):
+        connect_kwargs.setdefault('host', DB_HOST)
+        connect_kwargs.setdefault('database', DB_NAME)
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+
+        self.checkouts = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.reconnects = 0
+
+    def getconn(self, timeout=None):
+        """Check out a healthy connection, waiting for a free slot if needed"""
+        timeout = self.timeout if timeout is None else timeout
+
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.timeouts += 1
+            POOL_TIMEOUTS.inc()
+            raise PoolTimeout(f"No database connection free after {timeout}s")
+        waited = time.perf_counter() - start
+        POOL_WAIT_SECONDS.observe(waited)
+
+        try:
+            conn = self._healthy_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection; broken or explicitly closed ones are discarded"""
+        with self._lock:
+            self.in_use -= 1
+            self._last_used[id(conn)] = time.monotonic()
+
+        try:
+            if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            close = True
+
+        close = close or bool(conn.closed)
+        if close:
+            with self._lock:
+                self._last_used.pop(id(conn), None)
+
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection, committing on success and rolling back on error"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def _healthy_connection(self):
+        conn = self._pool.getconn()
+        if not self._needs_check(conn) or self._ping(conn):
+            return conn
+
+        # Dead connection (server restart, network drop): replace it once
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+            self.reconnects += 1
+        return self._pool.getconn()
+
+    def _needs_check(self, conn):
+        if conn.closed:
+            return True
+        last_used = self._last_used.get(id(conn))
+        return last_used is None or time.monotonic() - last_used > self.healthcheck_interval
+
+    def _ping(self, conn):
+        if conn.closed:
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def stats(self):
+        """Pool usage and wait-time counters"""
+        with self._lock:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'wait_avg_ms': 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max_ms': 1000 * self.wait_max,
+                'wait_total_ms': 1000 * self.wait_total,
+                'timeouts': self.timeouts,
+                'reconnects': self.reconnects
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    """Close every pooled connection; safe to call more than once"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+class AsyncConnectionPool:
+    """asyncpg pool with ConnectionPool's timeout, metrics and stats"""
+
+    def __init__(self, pool, timeout=DB_POOL_TIMEOUT):
+        self._pool = pool
+        self.timeout = timeout
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        """Check out a connection for the block"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            POOL_TIMEOUTS.inc()
+            raise PoolTimeout(f"No database connection free after {timeout}s")
+        waited = time.perf_counter() - start
+        POOL_WAIT_SECONDS.observe(waited)
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    def stats(self):
+        return {
+            'min_size': self._pool.get_min_size(),
+            'max_size': self._pool.get_max_size(),
+            'in_use': self._pool.get_size() - self._pool.get_idle_size(),
+            'checkouts': self.checkouts,
+            'wait_avg_ms': 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+            'wait_max_ms': 1000 * self.wait_max,
+            'timeouts': self.timeouts
+        }
+
+    async def close(self):
+        await self._pool.close()
+
+
+_async_pool = None
+_async_pool_lock = None
+
+
+async def get_async_pool():
+    """Return this event loop's asyncpg pool, creating it on first use"""
+    global _async_pool, _async_pool_lock
+    if _async_pool is None:
+        # asyncpg is only needed by the async app
+        import asyncpg
+
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = await asyncpg.create_pool(host=DB_HOST, database=DB_NAME,
+                                                 min_size=DB_POOL_MIN, max_size=DB_POOL_MAX)
+                _async_pool = AsyncConnectionPool(pool)
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
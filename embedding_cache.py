@@ -0,0 +1,212 @@
+"""LRU cache of query embeddings keyed by normalized query text.
+
+The same questions come in again and again, and each one used to cost a
+transformer forward pass. EmbeddingCache maps the normalized text
+(whitespace collapsed, lowercased for uncased models) to its normalized
+float32 embedding. Vectors live in one preallocated (max_size, dimension)
+array; a slot is reused when its entry is evicted, so the cache never
+allocates per query. The cache can be saved to disk and loaded at startup,
+and warmed with the most frequent questions in the queries table.
+"""
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from config import EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_MODEL
+from metrics import EMBEDDING_CACHE
+
+
+def normalize_query(text, lowercase=True):
+    """Cache key for a query: NFKC, single spaces, and lowercase if the model ignores case"""
+    text = ' '.join(unicodedata.normalize('NFKC', text).split())
+    return text.lower() if lowercase else text
+
+
+class EmbeddingCache:
+    def __init__(self, dimension, max_size=EMBEDDING_CACHE_SIZE, lowercase=True, model_name=EMBEDDING_MODEL):
+        self.dimension = dimension
+        self.max_size = max_size
+        self.lowercase = lowercase
+        self.model_name = model_name
+
+        self._vectors = np.zeros((max_size, dimension), dtype='float32')
+        self._slots = OrderedDict()  # key -> row of _vectors, least recently used first
+        self._free = list(range(max_size - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._changed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def key(self, text):
+        return normalize_query(text, self.lowercase)
+
+    def _get(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        self._slots.move_to_end(key)
+        return self._vectors[slot]
+
+    def _put(self, key, vector):
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self.evictions += 1
+            self._slots[key] = slot
+        self._slots.move_to_end(key)
+        self._vectors[slot] = vector
+        self._changed = True
+
+    def get(self, text):
+        """A copy of the cached embedding of `text`, or None"""
+        with self._lock:
+            vector = self._get(self.key(text))
+            return None if vector is None else vector.copy()
+
+    def put(self, text, vector):
+        with self._lock:
+            self._put(self.key(text), vector)
+
+    def encode(self, model, texts):
+        """Normalized float32 embeddings of `texts`, running the model only for uncached ones"""
+        keys = [self.key(text) for text in texts]
+        embeddings = np.empty((len(texts), self.dimension), dtype='float32')
+        missing = OrderedDict()  # key -> rows waiting for it
+        with self._lock:
+            for row, key in enumerate(keys):
+                vector = self._get(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(row)
+                else:
+                    embeddings[row] = vector
+            hits = len(texts) - sum(len(rows) for rows in missing.values())
+            self.hits += hits
+            self.misses += len(texts) - hits
+        EMBEDDING_CACHE.inc(hits, result='hit')
+        EMBEDDING_CACHE.inc(len(texts) - hits, result='miss')
+
+        if missing:
+            # The normalized text is encoded, so every spelling of a key gets the same vector
+            vectors = model.encode(list(missing), batch_size=len(missing), show_progress_bar=False)
+            vectors = np.ascontiguousarray(vectors, dtype='float32')
+            faiss.normalize_L2(vectors)
+            with self._lock:
+                for (key, rows), vector in zip(missing.items(), vectors):
+                    self._put(key, vector)
+                    embeddings[rows] = vector
+        return embeddings
+
+    def save(self, path=EMBEDDING_CACHE_PATH):
+        """Write the entries, least recently used first, to path.npy and path.json.
+
+        Skipped if nothing was added since the cache was loaded or saved.
+        Each file is written under a temporary name and renamed into
+        place, so workers saving at the same time do not mix their files.
+        """
+        with self._lock:
+            if not self._changed:
+                return False
+            keys = list(self._slots)
+            vectors = self._vectors[list(self._slots.values())]
+            self._changed = False
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp + '.npy', 'wb') as f:
+            np.save(f, vectors)
+        with open(tmp + '.json', 'w') as f:
+            json.dump({'model': self.model_name, 'dimension': self.dimension,
+                       'lowercase': self.lowercase, 'keys': keys}, f)
+        os.replace(tmp + '.npy', path + '.npy')
+        os.replace(tmp + '.json', path + '.json')
+        return True
+
+    def load(self, path=EMBEDDING_CACHE_PATH):
+        """Add entries saved by save(); returns how many, 0 if missing or from another model"""
+        if not (os.path.exists(path + '.npy') and os.path.exists(path + '.json')):
+            return 0
+        with open(path + '.json') as f:
+            saved = json.load(f)
+        vectors = np.load(path + '.npy')
+        if (saved['model'] != self.model_name or saved['dimension'] != self.dimension
+                or saved['lowercase'] != self.lowercase or len(saved['keys']) != len(vectors)):
+            print("Saved query embedding cache does not match the model, ignoring it")
+            return 0
+
+        # The most recently used entries are last, so they survive if max_size shrank
+        keys, vectors = saved['keys'][-self.max_size:], vectors[-self.max_size:]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._put(key, vector)
+            self._changed = False
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._slots),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'arena_bytes': self._vectors.nbytes
+            }
+
+
+def load_embedding_cache(model, path=EMBEDDING_CACHE_PATH, max_size=EMBEDDING_CACHE_SIZE):
+    """A cache for this model, with saved entries loaded; None if the cache is disabled"""
+    if not max_size:
+        return None
+    cache = EmbeddingCache(model.get_sentence_embedding_dimension(), max_size,
+                           lowercase=getattr(model.tokenizer, 'do_lower_case', False))
+    if path:
+        loaded = cache.load(path)
+        if loaded:
+            print(f"Loaded {loaded} cached query embeddings")
+    return cache
+
+
+def warm_from_queries(cache, model, conn, limit, batch_size=64):
+    """Embed the most frequently asked questions in the queries table.
+
+    Questions already cached are skipped. Returns the number added.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT user_query_text, COUNT(*) AS uses
+        FROM queries
+        GROUP BY user_query_text
+        ORDER BY uses DESC
+        LIMIT %s
+    """, (limit,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    # Texts that differ only in case or spacing share a key
+    keys = list(OrderedDict.fromkeys(cache.key(text) for text, _ in rows))
+    keys = [key for key in keys if key and cache.get(key) is None]
+
+    # Least frequent first, so the most frequent are the last to be evicted
+    keys.reverse()
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        vectors = model.encode(batch, batch_size=len(batch), show_progress_bar=False)
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        faiss.normalize_L2(vectors)
+        for key, vector in zip(batch, vectors):
+            cache.put(key, vector)
+    return len(keys)
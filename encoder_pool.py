@@ -0,0 +1,46 @@
+"""Process pool that encodes text batches with a sentence-transformers model.
+
+Each worker loads its own copy of the model once and gets an equal share
+of the CPU threads. Batches come back in submission order.
+"""
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+_model = None
+
+
+def _init_worker(model_name, threads):
+    global _model
+    torch.set_num_threads(threads)
+    _model = SentenceTransformer(model_name)
+
+
+def _encode(task):
+    ids, texts, batch_size = task
+    embeddings = _model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+    return ids, embeddings.astype('float32')
+
+
+def start_encoder_pool(model_name, workers):
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return Pool(workers, initializer=_init_worker, initargs=(model_name, threads))
+
+
+def encode_batches(pool, batches, batch_size, workers):
+    """Yield (ids, embeddings) for each (ids, texts) batch, in order.
+
+    Only a couple of batches per worker are in flight, so a streamed input
+    is never read far ahead of what has been encoded (Pool.imap would
+    drain it into the task queue).
+    """
+    pending = deque()
+    for ids, texts in batches:
+        pending.append(pool.apply_async(_encode, ((ids, texts, batch_size),)))
+        if len(pending) >= workers * 2:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
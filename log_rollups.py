@@ -0,0 +1,372 @@
+"""Monthly partitions for the query logs and the rollup tables the analytics read.
+
+queries and retrieval_logs grow with every answer, and the analytical
+queries in sql_queries/analytical_queries.sql scan and join all of them.
+Both tables are partitioned by month on their timestamp, with a default
+partition for rows outside the months created so far. The query log writer
+leaves both timestamps to their CURRENT_TIMESTAMP default, so a query and
+its retrievals share one value from the database clock and land in the
+same month and the same hour.
+
+refresh_rollups() adds every hour that has completed since the last
+refresh to a few small hourly, daily and running-total tables, once, and
+sql_queries/rollup_queries.sql answers the same questions from them. Old
+months can then be dropped whole while their aggregates stay.
+"""
+from datetime import date, datetime
+
+from config import LOG_PARTITION_MONTHS_AHEAD, ROLLUP_LAG_MINUTES
+
+# Partitioned log table -> its partition key
+LOG_TABLES = {'queries': 'query_timestamp', 'retrieval_logs': 'log_timestamp'}
+
+# Latencies are rolled up as histograms so percentiles can be read back:
+# 1 ms buckets below 100 ms, then 10, 100 and 1000 ms ones, so a percentile
+# taken from the buckets is at most 10% low
+LATENCY_BUCKET = """CASE WHEN {0} < 100 THEN {0} WHEN {0} < 1000 THEN {0} / 10 * 10
+    WHEN {0} < 10000 THEN {0} / 100 * 100 ELSE {0} / 1000 * 1000 END"""
+
+# The bands of query 5 in analytical_queries.sql
+QUALITY_BAND = """CASE WHEN {0} >= 0.7 THEN 'High Quality'
+    WHEN {0} >= 0.4 THEN 'Medium Quality' ELSE 'Low Quality' END"""
+
+ROLLUP_TABLES = {
+    'rollup_watermark': """
+        name VARCHAR(50) PRIMARY KEY,
+        refreshed_until TIMESTAMP NOT NULL
+    """,
+    'query_stats_hourly': """
+        hour TIMESTAMP PRIMARY KEY,
+        queries BIGINT NOT NULL,
+        quality_sum FLOAT NOT NULL,
+        quality_count BIGINT NOT NULL,
+        retrieval_ms_sum BIGINT NOT NULL,
+        retrieval_count BIGINT NOT NULL,
+        retrieval_ms_min INTEGER,
+        retrieval_ms_max INTEGER,
+        generation_ms_sum BIGINT NOT NULL,
+        generation_count BIGINT NOT NULL,
+        latency_ms_sum BIGINT NOT NULL,
+        latency_count BIGINT NOT NULL
+    """,
+    'query_latency_daily': """
+        day DATE,
+        metric VARCHAR(20),
+        bucket_ms INTEGER,
+        queries BIGINT NOT NULL,
+        PRIMARY KEY (day, metric, bucket_ms)
+    """,
+    'category_retrievals_daily': """
+        day DATE,
+        categories VARCHAR(200),
+        retrievals BIGINT NOT NULL,
+        queries BIGINT NOT NULL,
+        similarity_sum FLOAT NOT NULL,
+        PRIMARY KEY (day, categories)
+    """,
+    'rank_retrievals_daily': """
+        day DATE,
+        retrieval_rank INTEGER,
+        quality_band VARCHAR(20),
+        retrievals BIGINT NOT NULL,
+        used_in_response BIGINT NOT NULL,
+        similarity_sum FLOAT NOT NULL,
+        similarity_min FLOAT,
+        similarity_max FLOAT,
+        PRIMARY KEY (day, retrieval_rank, quality_band)
+    """,
+    'document_retrievals': """
+        document_id VARCHAR(50) PRIMARY KEY,
+        retrievals BIGINT NOT NULL,
+        queries BIGINT NOT NULL,
+        similarity_sum FLOAT NOT NULL,
+        first_retrieved TIMESTAMP,
+        last_retrieved TIMESTAMP
+    """,
+    'query_text_stats': """
+        query_hash CHAR(32) PRIMARY KEY,
+        user_query_text TEXT NOT NULL,
+        frequency BIGINT NOT NULL,
+        latency_ms_sum BIGINT NOT NULL,
+        latency_count BIGINT NOT NULL,
+        retrieval_ms_sum BIGINT NOT NULL,
+        retrieval_count BIGINT NOT NULL,
+        generation_ms_sum BIGINT NOT NULL,
+        generation_count BIGINT NOT NULL,
+        last_asked TIMESTAMP
+    """,
+}
+
+# Run in order for the rows in [start, end), which are whole hours. Each
+# hour is rolled up exactly once, so query_stats_hourly only gets new rows
+# and the daily and running totals are added to. Only query 9 needs the
+# hour of day; the rest are kept per day to stay small. A query's retrieval
+# rows share its timestamp, so COUNT(DISTINCT query_id) over separate hours
+# still adds up.
+ROLLUP_REFRESH = [
+    """
+    INSERT INTO query_stats_hourly
+    SELECT date_trunc('hour', query_timestamp), COUNT(*),
+           COALESCE(SUM(response_quality_score), 0), COUNT(response_quality_score),
+           COALESCE(SUM(retrieval_time_ms), 0), COUNT(retrieval_time_ms),
+           MIN(retrieval_time_ms), MAX(retrieval_time_ms),
+           COALESCE(SUM(generation_time_ms), 0), COUNT(generation_time_ms),
+           COALESCE(SUM(total_latency_ms), 0), COUNT(total_latency_ms)
+    FROM queries
+    WHERE query_timestamp >= %(start)s AND query_timestamp < %(end)s
+    GROUP BY 1
+    """,
+    f"""
+    INSERT INTO query_latency_daily AS r
+    SELECT q.query_timestamp::date, m.metric, {LATENCY_BUCKET.format('m.ms')}, COUNT(*)
+    FROM queries q
+    CROSS JOIN LATERAL (VALUES ('retrieval', q.retrieval_time_ms),
+                               ('generation', q.generation_time_ms),
+                               ('total', q.total_latency_ms)) AS m (metric, ms)
+    WHERE q.query_timestamp >= %(start)s AND q.query_timestamp < %(end)s
+      AND m.ms IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, metric, bucket_ms) DO UPDATE SET queries = r.queries + EXCLUDED.queries
+    """,
+    """
+    INSERT INTO category_retrievals_daily AS r
+    SELECT rl.log_timestamp::date, COALESCE(d.categories, ''),
+           COUNT(*), COUNT(DISTINCT rl.query_id), COALESCE(SUM(rl.similarity_score), 0)
+    FROM retrieval_logs rl
+    JOIN documents d ON d.document_id = rl.document_id
+    WHERE rl.log_timestamp >= %(start)s AND rl.log_timestamp < %(end)s
+    GROUP BY 1, 2
+    ON CONFLICT (day, categories) DO UPDATE SET
+        retrievals = r.retrievals + EXCLUDED.retrievals,
+        queries = r.queries + EXCLUDED.queries,
+        similarity_sum = r.similarity_sum + EXCLUDED.similarity_sum
+    """,
+    # Unranked rows count as rank 0
+    f"""
+    INSERT INTO rank_retrievals_daily AS r
+    SELECT rl.log_timestamp::date, COALESCE(rl.retrieval_rank, 0),
+           {QUALITY_BAND.format('q.response_quality_score')},
+           COUNT(*), COUNT(*) FILTER (WHERE rl.was_used_in_response),
+           COALESCE(SUM(rl.similarity_score), 0), MIN(rl.similarity_score), MAX(rl.similarity_score)
+    FROM retrieval_logs rl
+    LEFT JOIN queries q ON q.query_id = rl.query_id AND q.query_timestamp = rl.log_timestamp
+    WHERE rl.log_timestamp >= %(start)s AND rl.log_timestamp < %(end)s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, retrieval_rank, quality_band) DO UPDATE SET
+        retrievals = r.retrievals + EXCLUDED.retrievals,
+        used_in_response = r.used_in_response + EXCLUDED.used_in_response,
+        similarity_sum = r.similarity_sum + EXCLUDED.similarity_sum,
+        similarity_min = LEAST(r.similarity_min, EXCLUDED.similarity_min),
+        similarity_max = GREATEST(r.similarity_max, EXCLUDED.similarity_max)
+    """,
+    """
+    INSERT INTO document_retrievals AS r
+    SELECT document_id, COUNT(*), COUNT(DISTINCT query_id), COALESCE(SUM(similarity_score), 0),
+           MIN(log_timestamp), MAX(log_timestamp)
+    FROM retrieval_logs
+    WHERE log_timestamp >= %(start)s AND log_timestamp < %(end)s
+      AND document_id IS NOT NULL
+    GROUP BY document_id
+    ON CONFLICT (document_id) DO UPDATE SET
+        retrievals = r.retrievals + EXCLUDED.retrievals,
+        queries = r.queries + EXCLUDED.queries,
+        similarity_sum = r.similarity_sum + EXCLUDED.similarity_sum,
+        last_retrieved = EXCLUDED.last_retrieved
+    """,
+    # Keyed by a hash because long questions do not fit in a btree entry
+    """
+    INSERT INTO query_text_stats AS r
+    SELECT md5(user_query_text), user_query_text, COUNT(*),
+           COALESCE(SUM(total_latency_ms), 0), COUNT(total_latency_ms),
+           COALESCE(SUM(retrieval_time_ms), 0), COUNT(retrieval_time_ms),
+           COALESCE(SUM(generation_time_ms), 0), COUNT(generation_time_ms),
+           MAX(query_timestamp)
+    FROM queries
+    WHERE query_timestamp >= %(start)s AND query_timestamp < %(end)s
+    GROUP BY user_query_text
+    ON CONFLICT (query_hash) DO UPDATE SET
+        frequency = r.frequency + EXCLUDED.frequency,
+        latency_ms_sum = r.latency_ms_sum + EXCLUDED.latency_ms_sum,
+        latency_count = r.latency_count + EXCLUDED.latency_count,
+        retrieval_ms_sum = r.retrieval_ms_sum + EXCLUDED.retrieval_ms_sum,
+        retrieval_count = r.retrieval_count + EXCLUDED.retrieval_count,
+        generation_ms_sum = r.generation_ms_sum + EXCLUDED.generation_ms_sum,
+        generation_count = r.generation_count + EXCLUDED.generation_count,
+        last_asked = EXCLUDED.last_asked
+    """,
+]
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month:%Y_%m}"
+
+
+def create_log_tables(cursor, months_ahead=LOG_PARTITION_MONTHS_AHEAD):
+    """Create queries and retrieval_logs partitioned by month, with partitions from this month on.
+
+    documents and document_chunks must exist. A unique key on a partitioned
+    table has to include the partition key, so retrieval_logs.query_id has
+    no foreign key; the query log writer inserts both in one transaction.
+    """
+    cursor.execute("""
+    CREATE TABLE queries (
+        query_id SERIAL,
+        user_query_text TEXT NOT NULL,
+        query_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        response_text TEXT,
+        response_quality_score FLOAT,
+        retrieval_time_ms INTEGER,
+        generation_time_ms INTEGER,
+        total_latency_ms INTEGER,
+        PRIMARY KEY (query_id, query_timestamp)
+    ) PARTITION BY RANGE (query_timestamp);
+    """)
+    cursor.execute("""
+    CREATE TABLE retrieval_logs (
+        log_id SERIAL,
+        query_id INTEGER,
+        document_id VARCHAR(50) REFERENCES documents(document_id) ON DELETE CASCADE,
+        chunk_id INTEGER REFERENCES document_chunks(chunk_id) ON DELETE CASCADE,
+        similarity_score FLOAT,
+        retrieval_rank INTEGER,
+        was_used_in_response BOOLEAN DEFAULT FALSE,
+        log_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (log_id, log_timestamp)
+    ) PARTITION BY RANGE (log_timestamp);
+    """)
+    for table in LOG_TABLES:
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;")
+
+    this_month = month_start(date.today())
+    return create_log_partitions(cursor, this_month, add_months(this_month, months_ahead))
+
+
+def create_log_partitions(cursor, first_month, last_month):
+    """Create the missing monthly partitions of both log tables, first_month to last_month.
+
+    Rows for a new month that went to the default partition are moved into
+    it. Returns the names of the partitions created.
+    """
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        next_month = add_months(month, 1)
+        for table, column in LOG_TABLES.items():
+            name = partition_name(table, month)
+            cursor.execute("SELECT to_regclass(%s)", (name,))
+            if cursor.fetchone()[0] is not None:
+                continue
+
+            # Filled before it is attached, since a new partition may not
+            # overlap rows still in the default one
+            cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS);")
+            cursor.execute(f"""
+                WITH moved AS (
+                    DELETE FROM {table}_default
+                    WHERE {column} >= %s AND {column} < %s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """, (month, next_month))
+            cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                           f"FOR VALUES FROM (%s) TO (%s);", (month, next_month))
+            created.append(name)
+        month = next_month
+    return created
+
+
+def log_partitions(cursor, table):
+    """(month, name) of the monthly partitions of a log table, oldest first"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (table,))
+    partitions = []
+    for (name,) in cursor.fetchall():
+        try:
+            month = datetime.strptime(name[len(table) + 1:], '%Y_%m').date()
+        except ValueError:
+            continue  # the default partition
+        partitions.append((month, name))
+    return sorted(partitions)
+
+
+def drop_log_partitions(cursor, before):
+    """Drop the monthly partitions of both log tables that end by `before`.
+
+    Months not yet fully rolled up are kept. Returns the names dropped.
+    """
+    refreshed_until = rollup_watermark(cursor)
+    if refreshed_until is None:
+        return []
+    before = min(datetime.combine(before, datetime.min.time()), refreshed_until)
+
+    dropped = []
+    for table in LOG_TABLES:
+        for month, name in log_partitions(cursor, table):
+            if datetime.combine(add_months(month, 1), datetime.min.time()) <= before:
+                cursor.execute(f"DROP TABLE {name};")
+                dropped.append(name)
+    return dropped
+
+
+def create_rollup_tables(cursor):
+    for name, columns in ROLLUP_TABLES.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns});")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_text_stats_frequency "
+                   "ON query_text_stats(frequency DESC);")
+
+
+def rollup_watermark(cursor):
+    """The end of the log rows already rolled up, or None before the first refresh"""
+    cursor.execute("SELECT refreshed_until FROM rollup_watermark WHERE name = 'logs'")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def refresh_rollups(conn, lag_minutes=ROLLUP_LAG_MINUTES):
+    """Add the log rows of every hour completed since the last refresh to the rollups.
+
+    An hour is complete once it ended `lag_minutes` ago by the database
+    clock, the one log rows are stamped with, so query log batches still
+    being written are not missed. Runs in one transaction
+    under an advisory lock, so concurrent refreshes wait instead of
+    counting rows twice. Returns the (start, end) rolled up, start None on
+    the first refresh, or None if no hour has completed since.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('log_rollups'))")
+        start = rollup_watermark(cursor)
+        cursor.execute("SELECT date_trunc('hour', LOCALTIMESTAMP - %s * INTERVAL '1 minute')",
+                       (lag_minutes,))
+        end = cursor.fetchone()[0]
+        if start is not None and end <= start:
+            conn.commit()
+            return None
+
+        params = {'start': start or datetime.min, 'end': end}
+        for statement in ROLLUP_REFRESH:
+            cursor.execute(statement, params)
+        cursor.execute("""
+            INSERT INTO rollup_watermark (name, refreshed_until) VALUES ('logs', %(end)s)
+            ON CONFLICT (name) DO UPDATE SET refreshed_until = EXCLUDED.refreshed_until
+        """, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return start, end
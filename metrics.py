@@ -0,0 +1,155 @@
+"""In-process latency histograms and counters, exported as Prometheus text.
+
+Pipeline code times its stages with stage(), which records into the
+rag_stage_seconds histogram and, if given a dict, stores the milliseconds
+there too so a response can report its own timings. Counters and other
+histograms are module-level objects that callers update directly.
+render() formats everything for the /metrics endpoint.
+
+Metrics are per process. Under serve.py each worker keeps its own, and its
+samples carry a `worker` label (set with set_labels()) so series from
+different workers are not mixed up.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from sub-millisecond lookups to slow LLM generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = []
+_const_labels = {}
+
+
+def _format_labels(labels):
+    labels = dict(_const_labels, **labels)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, optionally split by labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[bucket] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                yield self.name + '_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield self.name + '_sum', labels, values[-2]
+            yield self.name + '_count', labels, values[-1]
+
+
+STAGE_SECONDS = Histogram('rag_stage_seconds', "Time spent in each pipeline stage", ['stage'])
+REQUESTS = Counter('rag_requests_total', "Requests handled, by endpoint", ['endpoint'])
+ERRORS = Counter('rag_errors_total', "Errors, by where they happened", ['source'])
+ANSWER_CACHE = Counter('rag_answer_cache_lookups_total', "Answer cache lookups, by result", ['result'])
+EMBEDDING_CACHE = Counter('rag_embedding_cache_lookups_total', "Query embedding cache lookups, by result",
+                          ['result'])
+EMBED_BATCH_SIZE = Histogram('rag_embed_batch_size', "Queries per batched encode + search",
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+POOL_WAIT_SECONDS = Histogram('rag_db_pool_wait_seconds', "Time waited for a database connection")
+POOL_TIMEOUTS = Counter('rag_db_pool_timeouts_total', "Database connection checkouts that timed out")
+QUERY_LOG_RECORDS = Counter('rag_query_log_records_total', "Query log records, by outcome", ['outcome'])
+LLM_QUEUE_SECONDS = Histogram('rag_llm_queue_seconds', "Time waited for a free LLM slot")
+LLM_REQUESTS = Counter('rag_llm_requests_total', "LLM calls, by endpoint and outcome", ['endpoint', 'outcome'])
+LLM_REJECTED = Counter('rag_llm_rejected_total', "LLM calls turned away without a slot", ['reason'])
+
+
+def observe_stage(name, seconds, timings=None):
+    """Record one stage duration (and timings[name] in ms)"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if timings is not None:
+        timings[name] = round(seconds * 1000, 1)
+
+
+@contextmanager
+def stage(name, timings=None):
+    """Time a block into rag_stage_seconds{stage=name} (and timings[name] in ms)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start, timings)
+
+
+def set_labels(**labels):
+    """Add labels to every sample this process exports"""
+    _const_labels.update({name: str(value) for name, value in labels.items()})
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,428 @@
+"""Client for the Ollama generate API.
+
+generate() waits for the full completion; stream_generate() yields tokens
+as Ollama produces them from its NDJSON stream.
+
+Calls go through an OllamaClient, which keeps connections alive in one
+session, applies connect and read timeouts, and allows at most
+OLLAMA_MAX_CONCURRENCY generations per endpoint at a time. Further callers
+wait in a queue of OLLAMA_QUEUE_SIZE for a free slot; once the queue is full,
+or after OLLAMA_QUEUE_TIMEOUT, they get OllamaBusy straight away instead of
+piling more parallel generations onto the model. With several OLLAMA_URLS
+each call goes to the endpoint with the fewest calls in flight, and an
+endpoint that refuses connections is skipped for OLLAMA_ENDPOINT_COOLDOWN.
+
+AsyncOllamaClient does the same for the async app with aiohttp, waiting
+for slots without holding a thread.
+"""
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (OLLAMA_URLS, OLLAMA_MODEL, OLLAMA_MAX_CONCURRENCY, OLLAMA_QUEUE_SIZE,
+                    OLLAMA_QUEUE_TIMEOUT, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT,
+                    OLLAMA_ENDPOINT_COOLDOWN)
+from metrics import LLM_QUEUE_SECONDS, LLM_REQUESTS, LLM_REJECTED
+
+
+class OllamaError(Exception):
+    """Ollama returned an error status or an error message in its stream"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaBusy(OllamaError):
+    """No generation slot free and no room (or time left) to wait for one"""
+
+    def __init__(self, message):
+        super().__init__(message, 503)
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.active = 0
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+
+class OllamaClient:
+    def __init__(self, urls=None, model=OLLAMA_MODEL, max_concurrency=OLLAMA_MAX_CONCURRENCY,
+                 queue_size=OLLAMA_QUEUE_SIZE, queue_timeout=OLLAMA_QUEUE_TIMEOUT,
+                 connect_timeout=OLLAMA_CONNECT_TIMEOUT, read_timeout=OLLAMA_READ_TIMEOUT,
+                 cooldown=OLLAMA_ENDPOINT_COOLDOWN):
+        self.endpoints = [Endpoint(url) for url in (urls or OLLAMA_URLS)]
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.timeout = (connect_timeout, read_timeout)
+        self.cooldown = cooldown
+        self.session = self._make_session()
+
+        self._cond = threading.Condition()
+        self.waiting = 0
+        self.calls = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _make_session(self):
+        # Enough kept-alive connections for every slot on every endpoint
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=self.max_concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def generate(self, prompt, model=None):
+        """Return the full completion for a prompt"""
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": False
+        }
+
+        with self._post(payload) as response:
+            return response.json()['response']
+
+    def stream_generate(self, prompt, model=None):
+        """Yield completion tokens as they arrive"""
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": True
+        }
+
+        with self._post(payload, stream=True) as response:
+            # One JSON object per line; the last one has "done": true
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise OllamaError(chunk['error'])
+                if chunk.get('response'):
+                    yield chunk['response']
+                if chunk.get('done'):
+                    break
+
+    def accepting(self):
+        """Whether a call now would get a slot or a place in the queue"""
+        with self._cond:
+            return self._pick() is not None or self.waiting < self.queue_size
+
+    @contextmanager
+    def _post(self, payload, stream=False):
+        """POST to the least busy endpoint while holding one of its slots"""
+        tried = []
+        while True:
+            endpoint = self._acquire(tried)
+            try:
+                response = self.session.post(endpoint.url, json=payload, stream=stream,
+                                             timeout=self.timeout)
+                break
+            except requests.ConnectionError as e:
+                # Nothing was generated; try the next endpoint
+                self._release(endpoint, 'unreachable')
+                tried.append(endpoint)
+                if len(tried) == len(self.endpoints):
+                    raise OllamaError(f"Ollama unreachable at {endpoint.url}: {e}") from e
+            except requests.Timeout as e:
+                self._release(endpoint, 'timeout')
+                raise OllamaError(f"Ollama at {endpoint.url} timed out after {self.timeout[1]}s",
+                                  504) from e
+            except BaseException:
+                self._release(endpoint, 'error')
+                raise
+
+        outcome = 'error'
+        try:
+            with response:
+                if response.status_code != 200:
+                    raise OllamaError(f"Status {response.status_code}", response.status_code)
+                yield response
+            outcome = 'ok'
+        except GeneratorExit:
+            # The caller stopped reading a stream
+            outcome = 'cancelled'
+            raise
+        except requests.RequestException as e:
+            # Read timeouts while streaming surface as connection errors
+            raise OllamaError(f"Ollama at {endpoint.url} failed mid-response: {e}") from e
+        finally:
+            self._release(endpoint, outcome)
+
+    def _pick(self, exclude=()):
+        """Least busy endpoint with a free slot; unreachable ones only if all are"""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        reachable = [e for e in candidates if e.down_until <= now]
+        free = [e for e in (reachable or candidates) if e.active < self.max_concurrency]
+        return min(free, key=lambda e: (e.active, e.requests)) if free else None
+
+    def _acquire(self, exclude):
+        start = time.perf_counter()
+        with self._cond:
+            endpoint = self._pick(exclude)
+            if endpoint is None:
+                self._check_queue()
+
+                self.waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while endpoint is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._queue_timed_out()
+                        self._cond.wait(remaining)
+                        endpoint = self._pick(exclude)
+                finally:
+                    self.waiting -= 1
+            self._checked_out(endpoint, time.perf_counter() - start)
+        return endpoint
+
+    def _check_queue(self):
+        if self.waiting >= self.queue_size:
+            self._reject('queue_full')
+            raise OllamaBusy(f"Ollama busy: {self.waiting} requests already waiting")
+
+    def _queue_timed_out(self):
+        self._reject('queue_timeout')
+        raise OllamaBusy(f"Ollama busy: no slot free after {self.queue_timeout}s")
+
+    def _checked_out(self, endpoint, waited):
+        endpoint.active += 1
+        endpoint.requests += 1
+        self.calls += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        LLM_QUEUE_SECONDS.observe(waited)
+
+    def _reject(self, reason):
+        self.rejected += 1
+        LLM_REJECTED.inc(reason=reason)
+
+    def _release(self, endpoint, outcome):
+        with self._cond:
+            endpoint.active -= 1
+            if outcome == 'unreachable':
+                endpoint.failures += 1
+                endpoint.down_until = time.monotonic() + self.cooldown
+            elif outcome == 'ok':
+                endpoint.down_until = 0.0
+            # Waiters may be excluding different endpoints, so wake them all
+            self._cond.notify_all()
+        LLM_REQUESTS.inc(endpoint=endpoint.url, outcome=outcome)
+
+    def stats(self):
+        """Slots, queue and per-endpoint counters"""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'queue_size': self.queue_size,
+                'waiting': self.waiting,
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'wait_avg_ms': 1000 * self.wait_total / self.calls if self.calls else 0.0,
+                'wait_max_ms': 1000 * self.wait_max,
+                'endpoints': [{
+                    'url': e.url,
+                    'active': e.active,
+                    'requests': e.requests,
+                    'failures': e.failures,
+                    'down': e.down_until > now
+                } for e in self.endpoints]
+            }
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOllamaClient(OllamaClient):
+    """OllamaClient for asyncio code: aiohttp requests, awaited slots.
+
+    Use it from one event loop. Waiters are futures woken when a slot is
+    released, so a queued call holds no thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters = []
+
+    def _make_session(self):
+        # aiohttp sessions belong to an event loop; opened on the first call
+        return None
+
+    def _open_session(self):
+        # aiohttp is only needed by the async app
+        import aiohttp
+
+        slots = len(self.endpoints) * self.max_concurrency
+        return aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout[0],
+                                          sock_read=self.timeout[1]),
+            connector=aiohttp.TCPConnector(limit=slots, limit_per_host=self.max_concurrency))
+
+    async def generate(self, prompt, model=None):
+        """Return the full completion for a prompt"""
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": False
+        }
+
+        async with self._post(payload) as response:
+            return (await response.json(content_type=None))['response']
+
+    async def stream_generate(self, prompt, model=None):
+        """Yield completion tokens as they arrive"""
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": True
+        }
+
+        async with self._post(payload) as response:
+            # One JSON object per line; the last one has "done": true
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise OllamaError(chunk['error'])
+                if chunk.get('response'):
+                    yield chunk['response']
+                if chunk.get('done'):
+                    break
+
+    @asynccontextmanager
+    async def _post(self, payload):
+        """POST to the least busy endpoint while holding one of its slots"""
+        import aiohttp
+
+        if self.session is None:
+            self.session = self._open_session()
+
+        tried = []
+        while True:
+            endpoint = await self._acquire(tried)
+            try:
+                response = await self.session.post(endpoint.url, json=payload)
+                break
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError) as e:
+                # Nothing was generated; try the next endpoint
+                self._release(endpoint, 'unreachable')
+                tried.append(endpoint)
+                if len(tried) == len(self.endpoints):
+                    raise OllamaError(f"Ollama unreachable at {endpoint.url}: {e}") from e
+            except asyncio.TimeoutError as e:
+                self._release(endpoint, 'timeout')
+                raise OllamaError(f"Ollama at {endpoint.url} timed out after {self.timeout[1]}s",
+                                  504) from e
+            except BaseException:
+                self._release(endpoint, 'error')
+                raise
+
+        outcome = 'error'
+        try:
+            if response.status != 200:
+                raise OllamaError(f"Status {response.status}", response.status)
+            yield response
+            outcome = 'ok'
+        except (GeneratorExit, asyncio.CancelledError):
+            # The caller stopped reading a stream, or the request was cancelled
+            outcome = 'cancelled'
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise OllamaError(f"Ollama at {endpoint.url} failed mid-response: {e!r}") from e
+        finally:
+            self._release(endpoint, outcome)
+            response.release()
+
+    async def _acquire(self, exclude):
+        start = time.perf_counter()
+        endpoint = self._pick(exclude)
+        if endpoint is None:
+            self._check_queue()
+
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while endpoint is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue_timed_out()
+                    waiter = asyncio.get_running_loop().create_future()
+                    self._waiters.append(waiter)
+                    try:
+                        await asyncio.wait_for(waiter, remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    endpoint = self._pick(exclude)
+            finally:
+                self.waiting -= 1
+        self._checked_out(endpoint, time.perf_counter() - start)
+        return endpoint
+
+    def _release(self, endpoint, outcome):
+        super()._release(endpoint, outcome)
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(urls=None):
+    """Return the process-wide client for these endpoints (OLLAMA_URLS by default)"""
+    key = tuple(urls or OLLAMA_URLS)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OllamaClient(list(key))
+    return client
+
+
+_async_client = None
+
+
+def get_async_client():
+    """Return this process's AsyncOllamaClient for OLLAMA_URLS"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOllamaClient()
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def generate(prompt, model=OLLAMA_MODEL, url=None):
+    """Return the full completion for a prompt"""
+    return get_client([url] if url else None).generate(prompt, model)
+
+
+def stream_generate(prompt, model=OLLAMA_MODEL, url=None):
+    """Yield completion tokens as they arrive"""
+    return get_client([url] if url else None).stream_generate(prompt, model)
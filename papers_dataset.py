@@ -0,0 +1,182 @@
+"""Partitioned Parquet copy of the filtered arXiv papers.
+
+01_data_collection.py --parallel splits the snapshot into byte ranges and
+filters them in worker processes (ingest_range), writing Parquet files
+partitioned by year and primary category. load_papers() reads back only
+the partitions a script asks for, falling back to the pickle written by
+the single-process collector.
+"""
+import hashlib
+import io
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import ARXIV_SNAPSHOT_PATH, PAPERS_DATASET_DIR, PAPERS_PICKLE_PATH
+
+START_DATE = pd.Timestamp('2020-01-01')
+END_DATE = pd.Timestamp('2024-12-31')
+
+# Nested fields (versions, authors_parsed) are not used downstream and are dropped
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('submitter', pa.string()),
+    ('authors', pa.string()),
+    ('title', pa.string()),
+    ('comments', pa.string()),
+    ('journal-ref', pa.string()),
+    ('doi', pa.string()),
+    ('report-no', pa.string()),
+    ('categories', pa.string()),
+    ('license', pa.string()),
+    ('abstract', pa.string()),
+    ('update_date', pa.date32()),
+    ('word_count', pa.int32()),
+    ('year', pa.int16()),
+    ('primary_category', pa.string())
+])
+
+PARTITION_COLS = ['year', 'primary_category']
+
+# Fields that end up in documents or document_chunks; a change to any of
+# them means the paper has to be reloaded and re-chunked
+HASHED_FIELDS = ['title', 'authors', 'categories', 'abstract', 'update_date']
+
+
+def split_ranges(path, num_ranges):
+    """Split a file into roughly equal [start, end) byte ranges"""
+    size = os.path.getsize(path)
+    step = max(1, size // num_ranges)
+    bounds = list(range(0, size, step)) + [size]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+
+def read_lines(f, start, end, batch_lines):
+    """Yield batches of the lines whose first byte lies in [start, end)"""
+    if start > 0:
+        # Skip the line that straddles start; the previous range owns it
+        f.seek(start - 1)
+        f.readline()
+
+    batch = []
+    while f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        batch.append(line)
+        if len(batch) >= batch_lines:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def filter_batch(lines):
+    """Parse a batch of JSON lines and keep CS papers updated 2020-2024"""
+    # Cheap byte-level prefilter before parsing
+    lines = [line for line in lines if b'cs.' in line.lower()]
+    if not lines:
+        return None
+
+    df = pd.read_json(io.BytesIO(b''.join(lines)), lines=True, dtype=False, convert_dates=False)
+    df = df[df['categories'].str.contains('cs.', case=False, regex=False, na=False)]
+
+    update_date = pd.to_datetime(df['update_date'], errors='coerce')
+    in_range = (update_date >= START_DATE) & (update_date <= END_DATE)
+    df = df[in_range].copy()
+    if df.empty:
+        return None
+
+    df['update_date'] = update_date[in_range].dt.date
+    df['word_count'] = df['abstract'].str.split().str.len().fillna(0).astype('int32')
+    df['year'] = update_date[in_range].dt.year.astype('int16')
+    df['primary_category'] = df['categories'].str.split().str[0]
+
+    for column in SCHEMA.names:
+        if column not in df:
+            df[column] = None
+    return df[SCHEMA.names]
+
+
+def ingest_range(path, start, end, range_id, out_dir, batch_lines):
+    """Worker: filter one byte range and append it to the Parquet dataset"""
+    scanned = 0
+    kept = 0
+
+    with open(path, 'rb') as f:
+        for batch_number, lines in enumerate(read_lines(f, start, end, batch_lines)):
+            scanned += len(lines)
+            df = filter_batch(lines)
+            if df is None:
+                continue
+
+            kept += len(df)
+            table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+            pq.write_to_dataset(
+                table,
+                out_dir,
+                partition_cols=PARTITION_COLS,
+                basename_template=f"part-{range_id:04d}-{batch_number:05d}-{{i}}.parquet"
+            )
+
+    return range_id, scanned, kept
+
+
+def ingest_range_args(args):
+    return ingest_range(*args)
+
+
+def load_papers(years=None, categories=None, columns=None, dataset_dir=PAPERS_DATASET_DIR):
+    """Load filtered papers, reading only the requested partitions when possible.
+
+    `years` and `categories` restrict the Parquet partitions that are read
+    (categories match the primary category). Without a Parquet dataset the
+    full pickle from the single-process collector is loaded and filtered.
+    """
+    if os.path.isdir(dataset_dir):
+        filters = []
+        if years:
+            filters.append(('year', 'in', [int(y) for y in years]))
+        if categories:
+            filters.append(('primary_category', 'in', list(categories)))
+
+        df = pd.read_parquet(dataset_dir, columns=columns, filters=filters or None)
+        for column in PARTITION_COLS:
+            if column in df and isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(df[column].cat.categories.dtype)
+        return df.reset_index(drop=True)
+
+    df = pd.read_pickle(PAPERS_PICKLE_PATH)
+    if years:
+        df = df[pd.to_datetime(df['update_date']).dt.year.isin([int(y) for y in years])]
+    if categories:
+        df = df[df['categories'].str.split().str[0].isin(list(categories))]
+    if columns:
+        df = df[columns]
+    return df.reset_index(drop=True)
+
+
+def content_hash(df):
+    """SHA-1 of each paper's HASHED_FIELDS, used to detect changed papers"""
+    dates = pd.to_datetime(df['update_date'], errors='coerce').dt.strftime('%Y-%m-%d')
+    fields = [df[column].where(df[column].notna(), '').astype(str)
+              for column in HASHED_FIELDS if column != 'update_date']
+    fields.append(dates.fillna(''))
+
+    return pd.Series(
+        [hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest() for values in zip(*fields)],
+        index=df.index
+    )
+
+
+def snapshot_info(path=ARXIV_SNAPSHOT_PATH):
+    """Identify the raw snapshot and the filtered papers it was turned into"""
+    source = PAPERS_DATASET_DIR if os.path.isdir(PAPERS_DATASET_DIR) else PAPERS_PICKLE_PATH
+    info = {'snapshot_path': path, 'papers_source': source}
+    if os.path.exists(path):
+        stat = os.stat(path)
+        info['snapshot_size'] = stat.st_size
+        info['snapshot_mtime'] = int(stat.st_mtime)
+    return info
@@ -0,0 +1,172 @@
+"""Background writer for the queries and retrieval_logs tables.
+
+Requests call QueryLogWriter.log(), which only puts a record on a bounded
+queue. A worker thread drains the queue in batches and writes each batch
+in one transaction with multi-row inserts. When the queue is full the
+record is dropped and counted rather than slowing the request down.
+close() writes whatever is still queued.
+"""
+import queue
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from config import QUERY_LOG_QUEUE_SIZE, QUERY_LOG_BATCH_SIZE, QUERY_LOG_FLUSH_INTERVAL
+from db import get_pool
+from metrics import QUERY_LOG_RECORDS
+
+
+class QueryLogWriter:
+    def __init__(self, pool=None, max_queue=QUERY_LOG_QUEUE_SIZE, batch_size=QUERY_LOG_BATCH_SIZE,
+                 flush_interval=QUERY_LOG_FLUSH_INTERVAL):
+        self._pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+
+        self.logged = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.retrieval_rows = 0
+
+        self._worker = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+        self._worker.start()
+
+    @property
+    def pool(self):
+        # Connected by the writer thread on first write, so logging never
+        # fails a request when the database is down; the batch is counted
+        # as failed instead
+        return self._pool or get_pool()
+
+    def log(self, query, response, results, retrieval_ms, generation_ms, total_ms):
+        """Queue one answered query and its retrieved chunks; False if it was dropped"""
+        record = (query, response, retrieval_ms, generation_ms, total_ms,
+                  [(r['document_id'], r['chunk_id'], r['similarity'], r['rank'], r.get('used', True))
+                   for r in results])
+        if self._closed:
+            self.dropped += 1
+            QUERY_LOG_RECORDS.inc(outcome='dropped')
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            QUERY_LOG_RECORDS.inc(outcome='dropped')
+            return False
+        return True
+
+    def _collect(self):
+        """Block for one record, then take more until the batch fills or the interval ends"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # close() queues None after the last record
+            stop = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    self.failed += len(records)
+                    QUERY_LOG_RECORDS.inc(len(records), outcome='failed')
+                    print(f"Query log write failed, {len(records)} records lost: {e}")
+            if stop:
+                return
+
+    def _write(self, records):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            # Reserve ids up front so retrieval rows can reference them
+            cursor.execute("""
+                SELECT nextval(pg_get_serial_sequence('queries', 'query_id'))
+                FROM generate_series(1, %s)
+            """, (len(records),))
+            query_ids = [row[0] for row in cursor.fetchall()]
+
+            # Timestamps come from the column defaults: the database clock
+            # the rollup watermark is read from, and one value per
+            # transaction, so a query and its retrievals share it
+            execute_values(cursor, """
+                INSERT INTO queries (
+                    query_id, user_query_text, response_text,
+                    retrieval_time_ms, generation_time_ms, total_latency_ms
+                ) VALUES %s
+            """, [(query_id,) + record[:5] for query_id, record in zip(query_ids, records)],
+                page_size=self.batch_size)
+
+            retrieval_rows = [
+                (query_id, document_id, chunk_id, similarity, rank, used)
+                for query_id, record in zip(query_ids, records)
+                for document_id, chunk_id, similarity, rank, used in record[5]
+            ]
+            execute_values(cursor, """
+                INSERT INTO retrieval_logs (
+                    query_id, document_id, chunk_id,
+                    similarity_score, retrieval_rank, was_used_in_response
+                ) VALUES %s
+            """, retrieval_rows, page_size=1000)
+            cursor.close()
+
+        self.logged += len(records)
+        QUERY_LOG_RECORDS.inc(len(records), outcome='logged')
+        self.retrieval_rows += len(retrieval_rows)
+        self.batches += 1
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'logged': self.logged,
+            'retrieval_rows': self.retrieval_rows,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def close(self):
+        """Stop accepting records and wait until the queued ones are written"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_query_log():
+    """Return the process-wide log writer, creating it on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = QueryLogWriter()
+    return _writer
+
+
+def close_query_log():
+    """Flush and stop the log writer; safe to call more than once"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
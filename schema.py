@@ -0,0 +1,25 @@
+"""Secondary index definitions shared by 02_database_setup.py and the loaders.
+
+02_database_setup.py --defer-indexes skips these so bulk loads don't pay
+for index maintenance row by row; the loaders create them afterwards.
+"""
+
+SECONDARY_INDEXES = [
+    ('idx_documents_categories', 'documents', 'categories'),
+    ('idx_documents_date', 'documents', 'update_date'),
+    ('idx_queries_timestamp', 'queries', 'query_timestamp'),
+    ('idx_chunks_document', 'document_chunks', 'document_id'),
+    ('idx_retrieval_query', 'retrieval_logs', 'query_id'),
+    ('idx_retrieval_document', 'retrieval_logs', 'document_id'),
+    ('idx_retrieval_timestamp', 'retrieval_logs', 'log_timestamp'),
+]
+
+
+def create_secondary_indexes(cursor, tables=None):
+    """Create missing secondary indexes, optionally only for some tables"""
+    created = []
+    for name, table, column in SECONDARY_INDEXES:
+        if tables is None or table in tables:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({column});")
+            created.append(name)
+    return created
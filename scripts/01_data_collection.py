@@ -1,50 +1,122 @@
 import pandas as pd
 import json
 from datetime import datetime
+import argparse
 import os
+import shutil
+import sys
+import time
+from multiprocessing import Pool
 
-print("🔄 Loading full ArXiv dataset (this takes 5-10 minutes)...")
-
-# Load all data
-data = []
-count = 0
-
-with open('data/raw/arxiv-metadata-oai-snapshot.json', 'r') as f:
-    for line in f:
-        paper = json.loads(line)
-        
-        # Filter CS papers from 2020-2024 on the fly
-        if 'cs.' in paper['categories'].lower():
-            update_date = pd.to_datetime(paper['update_date'])
-            if update_date >= pd.Timestamp('2020-01-01') and update_date <= pd.Timestamp('2024-12-31'):
-                data.append(paper)
-        
-        count += 1
-        if count % 100000 == 0:
-            print(f"Processed {count} papers... Found {len(data)} CS papers so far")
-
-print(f"\n✅ Finished processing {count} total papers")
-print(f"✅ Found {len(data)} Computer Science papers (2020-2024)")
-
-# Create DataFrame
-df = pd.DataFrame(data)
-
-# Basic cleaning
-df['update_date'] = pd.to_datetime(df['update_date'])
-df['word_count'] = df['abstract'].str.split().str.len()
-
-# Save filtered dataset
-os.makedirs('data/processed', exist_ok=True)
-df.to_csv('data/processed/cs_papers_2020_2024.csv', index=False)
-df.to_pickle('data/processed/cs_papers_2020_2024.pkl')
-
-print(f"\n📊 Dataset Statistics:")
-print(f"Total CS papers: {len(df)}")
-print(f"Date range: {df['update_date'].min()} to {df['update_date'].max()}")
-print(f"Average abstract length: {df['word_count'].mean():.0f} words")
-print(f"\nTop CS categories:")
-print(df['categories'].value_counts().head(10))
-
-print(f"\n💾 Saved to:")
-print(f"  - data/processed/cs_papers_2020_2024.csv")
-print(f"  - data/processed/cs_papers_2020_2024.pkl")
\ No newline at end of file
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ARXIV_SNAPSHOT_PATH, PAPERS_DATASET_DIR
+from papers_dataset import split_ranges, ingest_range_args, load_papers
+
+
+def collect_single_process():
+    """Original single-core loader: writes CSV and pickle"""
+    print("🔄 Loading full ArXiv dataset (this takes 5-10 minutes)...")
+
+    # Load all data
+    data = []
+    count = 0
+
+    with open(ARXIV_SNAPSHOT_PATH, 'r') as f:
+        for line in f:
+            paper = json.loads(line)
+
+            # Filter CS papers from 2020-2024 on the fly
+            if 'cs.' in paper['categories'].lower():
+                update_date = pd.to_datetime(paper['update_date'])
+                if update_date >= pd.Timestamp('2020-01-01') and update_date <= pd.Timestamp('2024-12-31'):
+                    data.append(paper)
+
+            count += 1
+            if count % 100000 == 0:
+                print(f"Processed {count} papers... Found {len(data)} CS papers so far")
+
+    print(f"\n✅ Finished processing {count} total papers")
+    print(f"✅ Found {len(data)} Computer Science papers (2020-2024)")
+
+    # Create DataFrame
+    df = pd.DataFrame(data)
+
+    # Basic cleaning
+    df['update_date'] = pd.to_datetime(df['update_date'])
+    df['word_count'] = df['abstract'].str.split().str.len()
+
+    # Save filtered dataset
+    os.makedirs('data/processed', exist_ok=True)
+    df.to_csv('data/processed/cs_papers_2020_2024.csv', index=False)
+    df.to_pickle('data/processed/cs_papers_2020_2024.pkl')
+
+    print(f"\n📊 Dataset Statistics:")
+    print(f"Total CS papers: {len(df)}")
+    print(f"Date range: {df['update_date'].min()} to {df['update_date'].max()}")
+    print(f"Average abstract length: {df['word_count'].mean():.0f} words")
+    print(f"\nTop CS categories:")
+    print(df['categories'].value_counts().head(10))
+
+    print(f"\n💾 Saved to:")
+    print(f"  - data/processed/cs_papers_2020_2024.csv")
+    print(f"  - data/processed/cs_papers_2020_2024.pkl")
+
+
+def collect_parallel(workers, batch_lines):
+    """Filter byte ranges of the snapshot in worker processes into partitioned Parquet"""
+    print(f"🔄 Loading ArXiv dataset with {workers} worker processes...")
+    start_time = time.time()
+
+    # Several ranges per worker keeps the pool busy when ranges finish unevenly
+    ranges = split_ranges(ARXIV_SNAPSHOT_PATH, workers * 4)
+
+    shutil.rmtree(PAPERS_DATASET_DIR, ignore_errors=True)
+    os.makedirs(PAPERS_DATASET_DIR)
+
+    tasks = [
+        (ARXIV_SNAPSHOT_PATH, start, end, range_id, PAPERS_DATASET_DIR, batch_lines)
+        for range_id, (start, end) in enumerate(ranges)
+    ]
+
+    total_scanned = 0
+    total_kept = 0
+    with Pool(workers) as pool:
+        for done, (range_id, scanned, kept) in enumerate(pool.imap_unordered(ingest_range_args, tasks), 1):
+            total_scanned += scanned
+            total_kept += kept
+            print(f"Finished range {done}/{len(tasks)}: {total_scanned} papers scanned, "
+                  f"{total_kept} CS papers so far")
+
+    elapsed = time.time() - start_time
+    print(f"\n✅ Finished processing {total_scanned} total papers in {elapsed:.0f}s "
+          f"({total_scanned / elapsed:.0f} papers/sec)")
+    print(f"✅ Found {total_kept} Computer Science papers (2020-2024)")
+
+    # Statistics only need three columns, so this stays small
+    df = load_papers(columns=['update_date', 'word_count', 'categories'])
+    print(f"\n📊 Dataset Statistics:")
+    print(f"Total CS papers: {len(df)}")
+    print(f"Date range: {df['update_date'].min()} to {df['update_date'].max()}")
+    print(f"Average abstract length: {df['word_count'].mean():.0f} words")
+    print(f"\nTop CS categories:")
+    print(df['categories'].value_counts().head(10))
+
+    print(f"\n💾 Saved to:")
+    print(f"  - {PAPERS_DATASET_DIR}/year=YYYY/primary_category=.../*.parquet")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Filter CS papers (2020-2024) from the arXiv snapshot")
+    parser.add_argument('--parallel', action='store_true',
+                        help="multi-process ingestion into partitioned Parquet")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="worker processes for --parallel")
+    parser.add_argument('--batch-lines', type=int, default=100000,
+                        help="lines parsed per batch in each worker (bounds memory)")
+    args = parser.parse_args()
+
+    if args.parallel:
+        collect_parallel(args.workers, args.batch_lines)
+    else:
+        collect_single_process()
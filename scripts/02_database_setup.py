@@ -1,6 +1,19 @@
+import argparse
+import os
+import sys
 import psycopg2
 from psycopg2 import sql
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import create_secondary_indexes
+from log_rollups import ROLLUP_TABLES, create_log_tables, create_rollup_tables
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--defer-indexes', action='store_true',
+                    help="skip secondary indexes; the loader scripts create them after bulk loading")
+args = parser.parse_args()
+
 print("🗄️ Setting up PostgreSQL database schema...")
 
 # Connect to database
@@ -16,6 +29,8 @@ cursor.execute("DROP TABLE IF EXISTS retrieval_logs CASCADE;")
 cursor.execute("DROP TABLE IF EXISTS document_chunks CASCADE;")
 cursor.execute("DROP TABLE IF EXISTS queries CASCADE;")
 cursor.execute("DROP TABLE IF EXISTS documents CASCADE;")
+for table in ROLLUP_TABLES:
+    cursor.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
 
 # Create Documents table
 print("Creating Documents table...")
@@ -30,25 +45,11 @@ CREATE TABLE documents (
     publication_date DATE,
     update_date DATE,
     word_count INTEGER,
+    content_hash CHAR(40),
     created_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 """)
 
-# Create Queries table
-print("Creating Queries table...")
-cursor.execute("""
-CREATE TABLE queries (
-    query_id SERIAL PRIMARY KEY,
-    user_query_text TEXT NOT NULL,
-    query_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    response_text TEXT,
-    response_quality_score FLOAT,
-    retrieval_time_ms INTEGER,
-    generation_time_ms INTEGER,
-    total_latency_ms INTEGER
-);
-""")
-
 # Create Document_Chunks table
 print("Creating Document_Chunks table...")
 cursor.execute("""
@@ -63,29 +64,21 @@ CREATE TABLE document_chunks (
 );
 """)
 
-# Create Retrieval_Logs table
-print("Creating Retrieval_Logs table...")
-cursor.execute("""
-CREATE TABLE retrieval_logs (
-    log_id SERIAL PRIMARY KEY,
-    query_id INTEGER REFERENCES queries(query_id) ON DELETE CASCADE,
-    document_id VARCHAR(50) REFERENCES documents(document_id) ON DELETE CASCADE,
-    chunk_id INTEGER REFERENCES document_chunks(chunk_id) ON DELETE CASCADE,
-    similarity_score FLOAT,
-    retrieval_rank INTEGER,
-    was_used_in_response BOOLEAN DEFAULT FALSE,
-    log_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-""")
+# Create the log tables, partitioned by month
+print("Creating Queries and Retrieval_Logs tables (monthly partitions)...")
+partitions = create_log_tables(cursor)
+print(f"  Created {', '.join(partitions)}")
+
+# Create the hourly, daily and running-total rollups the analytics read
+print("Creating rollup tables...")
+create_rollup_tables(cursor)
 
 # Create indexes for faster queries
-print("Creating indexes...")
-cursor.execute("CREATE INDEX idx_documents_categories ON documents(categories);")
-cursor.execute("CREATE INDEX idx_documents_date ON documents(update_date);")
-cursor.execute("CREATE INDEX idx_queries_timestamp ON queries(query_timestamp);")
-cursor.execute("CREATE INDEX idx_chunks_document ON document_chunks(document_id);")
-cursor.execute("CREATE INDEX idx_retrieval_query ON retrieval_logs(query_id);")
-cursor.execute("CREATE INDEX idx_retrieval_document ON retrieval_logs(document_id);")
+if args.defer_indexes:
+    print("Deferring secondary indexes until data is loaded")
+else:
+    print("Creating indexes...")
+    create_secondary_indexes(cursor)
 
 # Commit changes
 conn.commit()
@@ -97,4 +90,5 @@ print("\nTables created:")
 print("  1. documents - Paper metadata")
 print("  2. queries - User queries and responses")
 print("  3. document_chunks - Text chunks for RAG")
-print("  4. retrieval_logs - Query-document matches")
\ No newline at end of file
+print("  4. retrieval_logs - Query-document matches")
+print("  5. rollups - Hourly, daily and per-document/question aggregates of the logs")
\ No newline at end of file
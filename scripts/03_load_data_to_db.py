@@ -1,12 +1,31 @@
+import argparse
+import os
+import sys
+import csv
+import io
+import time
 import pandas as pd
-import psycopg2
-from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_pool
+from papers_dataset import load_papers, content_hash
+from schema import create_secondary_indexes
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--years', nargs='+', help="only load papers updated in these years")
+parser.add_argument('--categories', nargs='+', help="only load these primary categories, e.g. cs.CL")
+args = parser.parse_args()
 
 print("Loading data into PostgreSQL...")
 
 # Load the processed data
 print("Reading processed data...")
-df = pd.read_pickle('data/processed/cs_papers_2020_2024.pkl')
+df = load_papers(
+    years=args.years,
+    categories=args.categories,
+    columns=['id', 'title', 'authors', 'categories', 'abstract', 'update_date', 'word_count']
+)
 
 # Sample or use all papers
 USE_SAMPLE = False  # Set to False to use all 547k papers
@@ -16,59 +35,132 @@ if USE_SAMPLE:
 else:
     print(f"Using all {len(df)} papers")
 
+# Stored so the incremental updater can tell which papers changed
+df['content_hash'] = content_hash(df)
+
+REJECT_PATH = 'data/processed/rejected_documents.csv'
+COPY_BATCH_ROWS = 50000
+COLUMNS = ['document_id', 'arxiv_id', 'title', 'authors', 'categories',
+           'abstract', 'update_date', 'word_count', 'content_hash']
+
+
+def clean_value(value):
+    return None if pd.isna(value) else value
+
+
+def prepare_row(paper_id, title, authors, categories, abstract, update_date, word_count, hash_value):
+    """Validate one paper and return its COPY row, or raise ValueError"""
+    paper_id = clean_value(paper_id)
+    title = clean_value(title)
+    categories = clean_value(categories)
+    word_count = clean_value(word_count)
+
+    if not paper_id or len(str(paper_id)) > 50:
+        raise ValueError("missing or too long id")
+    if not title:
+        raise ValueError("missing title")
+    if categories is not None and len(categories) > 200:
+        raise ValueError("categories longer than 200 characters")
+
+    update_date = pd.to_datetime(clean_value(update_date), errors='coerce')
+    if pd.isna(update_date):
+        raise ValueError("invalid update_date")
+
+    if word_count is not None:
+        word_count = int(word_count)
+
+    return [paper_id, paper_id, title, clean_value(authors), categories,
+            clean_value(abstract), update_date.date().isoformat(), word_count, hash_value]
+
+
 # Connect to database
-conn = psycopg2.connect(
-    host="localhost",
-    database="rag_chatbot_db"
-)
+pool = get_pool()
+conn = pool.getconn()
 cursor = conn.cursor()
 
-# Prepare data for insertion
-print("Inserting documents into database...")
-inserted = 0
+# Stage rows with COPY, then merge into documents with a single upsert
+print("Copying documents into staging table...")
+start_time = time.time()
+cursor.execute("""
+    CREATE TEMP TABLE documents_staging (
+        document_id TEXT,
+        arxiv_id TEXT,
+        title TEXT,
+        authors TEXT,
+        categories TEXT,
+        abstract TEXT,
+        update_date DATE,
+        word_count INTEGER,
+        content_hash CHAR(40)
+    ) ON COMMIT DROP;
+""")
+
+copy_sql = f"COPY documents_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+staged = 0
 errors = 0
 
-for idx, row in df.iterrows():
-    try:
-        cursor.execute("""
-            INSERT INTO documents (
-                document_id, arxiv_id, title, authors, categories,
-                abstract, publication_date, update_date, word_count
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (arxiv_id) DO NOTHING;
-        """, (
-            row['id'],
-            row['id'],
-            row['title'],
-            row['authors'],
-            row['categories'],
-            row['abstract'],
-            None,
-            row['update_date'],
-            row['word_count']
-        ))
-        inserted += 1
-        
-        if inserted % 10000 == 0:
-            conn.commit()
-            print(f"  Inserted {inserted} documents...")
-            
-    except Exception as e:
-        errors += 1
-        if errors < 5:
-            print(f"  Error inserting {row['id']}: {e}")
-
-# Final commit
+with open(REJECT_PATH, 'w', newline='') as reject_file:
+    rejects = csv.writer(reject_file)
+    rejects.writerow(['id', 'reason'])
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = df[['id', 'title', 'authors', 'categories', 'abstract', 'update_date', 'word_count',
+               'content_hash']]
+
+    for row in rows.itertuples(index=False, name=None):
+        try:
+            writer.writerow(prepare_row(*row))
+            staged += 1
+        except (ValueError, TypeError) as e:
+            # Malformed rows go to the reject file instead of aborting the COPY
+            errors += 1
+            rejects.writerow([row[0], str(e)])
+            if errors < 5:
+                print(f"  Error inserting {row[0]}: {e}")
+            continue
+
+        if staged % COPY_BATCH_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            print(f"  Staged {staged} documents...")
+
+    buffer.seek(0)
+    cursor.copy_expert(copy_sql, buffer)
+
+copy_time = time.time() - start_time
+print(f"Staged {staged} documents in {copy_time:.1f}s")
+
+print("Merging into documents...")
+cursor.execute(f"""
+    INSERT INTO documents ({', '.join(COLUMNS)})
+    SELECT {', '.join(COLUMNS)} FROM documents_staging
+    ON CONFLICT (arxiv_id) DO NOTHING;
+""")
+inserted = cursor.rowcount
+conn.commit()
+load_time = time.time() - start_time
+
+# Secondary indexes are built once, after the data is in
+print("Creating secondary indexes...")
+index_start = time.time()
+create_secondary_indexes(cursor, tables=['documents'])
 conn.commit()
+index_time = time.time() - index_start
 
 # Verify insertion
 cursor.execute("SELECT COUNT(*) FROM documents;")
 count = cursor.fetchone()[0]
 
 cursor.close()
-conn.close()
+pool.putconn(conn)
 
 print(f"\nData loading complete!")
 print(f"  Successfully inserted: {inserted} documents")
-print(f"  Errors: {errors}")
-print(f"  Total in database: {count}")
\ No newline at end of file
+print(f"  Skipped (already loaded): {staged - inserted}")
+print(f"  Errors: {errors} (see {REJECT_PATH})")
+print(f"  Total in database: {count}")
+print(f"  Load time: {load_time:.1f}s ({staged / max(load_time, 1e-6):.0f} rows/sec)")
+print(f"  Index build time: {index_time:.1f}s")
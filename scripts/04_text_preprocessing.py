@@ -1,98 +1,84 @@
-import pandas as pd
-import re
-import psycopg2
-from psycopg2.extras import execute_batch
-
-print("Starting text preprocessing...")
-
-# Load data
-df = pd.read_pickle('data/processed/cs_papers_2020_2024.pkl')
-print(f"Loaded {len(df)} papers")
-
-def clean_text(text):
-    """Clean abstract text"""
-    if pd.isna(text):
-        return ""
-    
-    # Remove LaTeX commands
-    text = re.sub(r'\\[a-zA-Z]+\{[^}]*\}', '', text)
-    text = re.sub(r'\\[a-zA-Z]+', '', text)
-    
-    # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^a-zA-Z0-9\s\.,!?;:\-]', ' ', text)
-    
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
-    
-    return text.strip()
-
-def chunk_text(text, chunk_size=512, overlap=50):
-    """Split text into overlapping chunks"""
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        if len(chunk.split()) > 20:  # Only keep chunks with at least 20 words
-            chunks.append(chunk)
-    
-    return chunks
-
-# Process papers
-print("Cleaning abstracts...")
-df['clean_abstract'] = df['abstract'].apply(clean_text)
-
-# Create chunks
-print("Creating chunks...")
-all_chunks = []
-
-for idx, row in df.iterrows():
-    if idx % 10000 == 0:
-        print(f"Processed {idx} papers...")
-    
-    text_chunks = chunk_text(row['clean_abstract'])  # Changed variable name
-    
-    for chunk_idx, chunk_content in enumerate(text_chunks):  # Changed variable name
-        all_chunks.append({
-            'document_id': row['id'],
-            'chunk_text': chunk_content,
-            'chunk_index': chunk_idx,
-            'token_count': len(chunk_content.split())
-        })
-print(f"\nTotal chunks created: {len(all_chunks)}")
-
-# Save to database
-print("Inserting chunks into database...")
-conn = psycopg2.connect(
-    host="localhost",
-    database="rag_chatbot_db"
-)
-cursor = conn.cursor()
-
-# Batch insert
-insert_query = """
-    INSERT INTO document_chunks (document_id, chunk_text, chunk_index, token_count)
-    VALUES (%s, %s, %s, %s)
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CHUNK_MAX_TOKENS
+from db import get_pool
+from papers_dataset import load_papers
+from text_processing import chunk_batches
+
+COPY_SQL = """
+    COPY document_chunks (document_id, chunk_text, chunk_index, token_count)
+    FROM STDIN WITH (FORMAT csv)
 """
 
-batch_data = [(c['document_id'], c['chunk_text'], c['chunk_index'], c['token_count']) 
-              for c in all_chunks]
 
-execute_batch(cursor, insert_query, batch_data, page_size=1000)
+def paper_batches(df, batch_papers):
+    for start in range(0, len(df), batch_papers):
+        batch = df.iloc[start:start + batch_papers]
+        yield batch['id'].tolist(), batch['abstract'].tolist()
 
-conn.commit()
 
-# Verify
-cursor.execute("SELECT COUNT(*) FROM document_chunks;")
-count = cursor.fetchone()[0]
+def main(years, categories, workers, batch_papers):
+    print("Starting text preprocessing...")
 
-cursor.close()
-conn.close()
+    # Load data
+    df = load_papers(years=years, categories=categories, columns=['id', 'abstract'])
+    print(f"Loaded {len(df)} papers")
 
-print(f"\nPreprocessing complete!")
-print(f"Total chunks in database: {count}")
+    pool = get_pool()
+    conn = pool.getconn()
+    cursor = conn.cursor()
 
-# Save chunks info for later use
-chunks_df = pd.DataFrame(all_chunks)
-chunks_df.to_pickle('data/processed/chunks_info.pkl')
-print("Chunks info saved to data/processed/chunks_info.pkl")
\ No newline at end of file
+    # Clean and chunk in worker processes, streaming each batch's chunks
+    # straight into the table instead of collecting them all first
+    print(f"Cleaning and chunking with {workers} worker process(es), "
+          f"up to {CHUNK_MAX_TOKENS} tokens per chunk...")
+    start_time = time.time()
+    papers = 0
+    total_chunks = 0
+
+    for batch_number, rows in enumerate(chunk_batches(paper_batches(df, batch_papers), workers)):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(COPY_SQL, buffer)
+
+        papers = min(len(df), (batch_number + 1) * batch_papers)
+        total_chunks += len(rows)
+        if (batch_number + 1) % 10 == 0:
+            rate = papers / (time.time() - start_time)
+            print(f"Processed {papers} papers, {total_chunks} chunks ({rate:.0f} papers/sec)...")
+
+    conn.commit()
+    elapsed = time.time() - start_time
+    print(f"\nTotal chunks created: {total_chunks}")
+
+    # Verify
+    cursor.execute("SELECT COUNT(*) FROM document_chunks;")
+    count = cursor.fetchone()[0]
+
+    cursor.close()
+    pool.putconn(conn)
+
+    print(f"\nPreprocessing complete!")
+    print(f"Processed {papers} papers in {elapsed:.1f}s ({papers / max(elapsed, 1e-6):.0f} papers/sec)")
+    print(f"Total chunks in database: {count}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', nargs='+', help="only load papers updated in these years")
+    parser.add_argument('--categories', nargs='+', help="only load these primary categories, e.g. cs.CL")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="cleaning/chunking processes")
+    parser.add_argument('--batch-papers', type=int, default=1000,
+                        help="papers per batch handed to a worker")
+    args = parser.parse_args()
+
+    main(args.years, args.categories, args.workers, args.batch_papers)
@@ -1,80 +1,199 @@
-import pandas as pd
+import argparse
+import json
+import os
+import sys
+import time
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import pickle
-import psycopg2
-
-print("Starting embedding generation...")
-
-# Load the embedding model
-print("Loading sentence-transformers model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-print(f"Model loaded. Embedding dimension: {model.get_sentence_embedding_dimension()}")
-
-# Load chunks from database
-print("Loading chunks from database...")
-conn = psycopg2.connect(
-    host="localhost",
-    database="rag_chatbot_db"
-)
-cursor = conn.cursor()
-
-cursor.execute("""
-    SELECT chunk_id, chunk_text 
-    FROM document_chunks 
-    ORDER BY chunk_id
-""")
-chunks = cursor.fetchall()
-print(f"Loaded {len(chunks)} chunks")
-
-# Generate embeddings in batches
-print("Generating embeddings (this takes 15-20 minutes)...")
-batch_size = 256
-all_embeddings = []
-chunk_ids = []
-
-for i in range(0, len(chunks), batch_size):
-    batch = chunks[i:i + batch_size]
-    batch_texts = [chunk[1] for chunk in batch]
-    batch_ids = [chunk[0] for chunk in batch]
-    
-    # Generate embeddings
-    embeddings = model.encode(batch_texts, show_progress_bar=False)
-    
-    all_embeddings.extend(embeddings)
-    chunk_ids.extend(batch_ids)
-    
-    if (i // batch_size + 1) % 10 == 0:
-        print(f"  Processed {i + len(batch)} / {len(chunks)} chunks...")
-
-# Convert to numpy array
-embeddings_array = np.array(all_embeddings).astype('float32')
-print(f"\nEmbeddings shape: {embeddings_array.shape}")
-
-# Save embeddings
-print("Saving embeddings...")
-np.save('data/processed/embeddings.npy', embeddings_array)
-with open('data/processed/chunk_ids.pkl', 'wb') as f:
-    pickle.dump(chunk_ids, f)
-
-# Update database with embedding indices
-print("Updating database with embedding indices...")
-for idx, chunk_id in enumerate(chunk_ids):
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (EMBEDDING_MODEL, EMBEDDINGS_PATH, CHUNK_IDS_PATH, CHUNK_IDS_ARRAY_PATH,
+                    EMBED_CHECKPOINT_ROWS, INDEX_MANIFEST_PATH)
+from db import get_pool
+from encoder_pool import start_encoder_pool, encode_batches
+
+# Work in progress lives next to the final files until the run completes
+EMBEDDINGS_PARTIAL_PATH = EMBEDDINGS_PATH + '.partial'
+CHUNK_IDS_PARTIAL_PATH = CHUNK_IDS_ARRAY_PATH + '.partial'
+CHECKPOINT_PATH = 'data/processed/embeddings.checkpoint.json'
+
+
+def load_checkpoint(total, dimension):
+    """Return the number of rows already written, or 0 to start over"""
+    if not os.path.exists(CHECKPOINT_PATH):
+        return 0
+
+    with open(CHECKPOINT_PATH) as f:
+        checkpoint = json.load(f)
+
+    if (checkpoint['total'] != total or checkpoint['dimension'] != dimension
+            or checkpoint['model'] != EMBEDDING_MODEL
+            or not os.path.exists(EMBEDDINGS_PARTIAL_PATH)
+            or not os.path.exists(CHUNK_IDS_PARTIAL_PATH)):
+        print("Checkpoint does not match the current chunks, starting over")
+        return 0
+
+    return checkpoint['done']
+
+
+def save_checkpoint(embeddings, chunk_ids, done, total, dimension):
+    # Data must be on disk before the checkpoint claims it is
+    embeddings.flush()
+    chunk_ids.flush()
+
+    tmp_path = CHECKPOINT_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'model': EMBEDDING_MODEL,
+            'total': total,
+            'dimension': dimension,
+            'done': done,
+            'last_chunk_id': int(chunk_ids[done - 1]) if done else None
+        }, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def read_batches(conn, after_chunk_id, batch_size):
+    """Stream (chunk_ids, texts) batches after a chunk id with a server-side cursor"""
+    cursor = conn.cursor(name='embedding_chunks')
+    cursor.itersize = batch_size * 8
+    cursor.execute("""
+        SELECT chunk_id, chunk_text
+        FROM document_chunks
+        WHERE chunk_id > %s
+        ORDER BY chunk_id
+    """, (after_chunk_id,))
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield [row[0] for row in rows], [row[1] for row in rows]
+    cursor.close()
+
+
+def encode_in_process(model, batches, batch_size):
+    for ids, texts in batches:
+        embeddings = model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        yield ids, embeddings.astype('float32')
+
+
+def main(workers, batch_size, restart):
+    print("Starting embedding generation...")
+
+    # Load the embedding model
+    print("Loading sentence-transformers model...")
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    dimension = model.get_sentence_embedding_dimension()
+    print(f"Model loaded. Embedding dimension: {dimension}")
+
+    pool = get_pool()
+    conn = pool.getconn()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*) FROM document_chunks")
+    total = cursor.fetchone()[0]
+    print(f"Found {total} chunks")
+
+    done = 0 if restart else load_checkpoint(total, dimension)
+
+    # Pre-sized memory-mapped outputs: nothing is held in RAM but the current batch
+    if done:
+        embeddings = np.lib.format.open_memmap(EMBEDDINGS_PARTIAL_PATH, mode='r+')
+        chunk_ids = np.lib.format.open_memmap(CHUNK_IDS_PARTIAL_PATH, mode='r+')
+        after_chunk_id = int(chunk_ids[done - 1])
+        print(f"Resuming after chunk {after_chunk_id} ({done} / {total} already embedded)")
+    else:
+        embeddings = np.lib.format.open_memmap(
+            EMBEDDINGS_PARTIAL_PATH, mode='w+', dtype='float32', shape=(total, dimension))
+        chunk_ids = np.lib.format.open_memmap(
+            CHUNK_IDS_PARTIAL_PATH, mode='w+', dtype='int64', shape=(total,))
+        after_chunk_id = -1
+
+    print(f"Generating embeddings with {workers} worker process(es)...")
+    start_time = time.time()
+    started_at = done
+    last_checkpoint = done
+    batches = read_batches(conn, after_chunk_id, batch_size)
+
+    encoder_pool = None
+    if workers > 1:
+        del model  # the workers load their own copies
+        encoder_pool = start_encoder_pool(EMBEDDING_MODEL, workers)
+        results = encode_batches(encoder_pool, batches, batch_size, workers)
+    else:
+        results = encode_in_process(model, batches, batch_size)
+
+    try:
+        for ids, batch_embeddings in results:
+            if done + len(ids) > total:
+                raise RuntimeError("document_chunks grew during the run; restart with --restart")
+
+            embeddings[done:done + len(ids)] = batch_embeddings
+            chunk_ids[done:done + len(ids)] = ids
+            done += len(ids)
+
+            if done - last_checkpoint >= EMBED_CHECKPOINT_ROWS:
+                save_checkpoint(embeddings, chunk_ids, done, total, dimension)
+                last_checkpoint = done
+                rate = (done - started_at) / (time.time() - start_time)
+                print(f"  Processed {done} / {total} chunks ({rate:.0f} chunks/sec)...")
+    finally:
+        if encoder_pool is not None:
+            encoder_pool.terminate()
+        save_checkpoint(embeddings, chunk_ids, done, total, dimension)
+    conn.commit()  # closes the server-side cursor's transaction
+
+    if done != total:
+        raise RuntimeError(f"Expected {total} chunks but read {done}; restart with --restart")
+
+    elapsed = time.time() - start_time
+    print(f"\nEmbeddings shape: {embeddings.shape}")
+    print(f"Encoded {done - started_at} chunks in {elapsed:.0f}s")
+
+    # Move the finished files into place
+    print("Saving embeddings...")
+    del embeddings, chunk_ids
+    os.replace(EMBEDDINGS_PARTIAL_PATH, EMBEDDINGS_PATH)
+    os.replace(CHUNK_IDS_PARTIAL_PATH, CHUNK_IDS_ARRAY_PATH)
+    os.remove(CHECKPOINT_PATH)
+    if os.path.exists(INDEX_MANIFEST_PATH):
+        # The manifest described the previous chunk set
+        os.remove(INDEX_MANIFEST_PATH)
+
+    chunk_ids = np.load(CHUNK_IDS_ARRAY_PATH)
+    with open(CHUNK_IDS_PATH, 'wb') as f:
+        pickle.dump(chunk_ids.tolist(), f)
+
+    # Update database with embedding indices in one statement
+    print("Updating database with embedding indices...")
     cursor.execute("""
-        UPDATE document_chunks 
-        SET embedding_index = %s 
-        WHERE chunk_id = %s
-    """, (idx, chunk_id))
-    
-    if (idx + 1) % 10000 == 0:
-        conn.commit()
-        print(f"  Updated {idx + 1} / {len(chunk_ids)} chunks...")
-
-conn.commit()
-cursor.close()
-conn.close()
-
-print("\nEmbedding generation complete!")
-print(f"  Total embeddings: {len(all_embeddings)}")
-print(f"  Saved to: data/processed/embeddings.npy")
-print(f"  Chunk IDs saved to: data/processed/chunk_ids.pkl")
\ No newline at end of file
+        UPDATE document_chunks dc
+        SET embedding_index = v.embedding_index
+        FROM unnest(%s::int[], %s::int[]) AS v(chunk_id, embedding_index)
+        WHERE dc.chunk_id = v.chunk_id
+    """, (chunk_ids.tolist(), list(range(len(chunk_ids)))))
+    updated = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    pool.putconn(conn)
+
+    print("\nEmbedding generation complete!")
+    print(f"  Total embeddings: {len(chunk_ids)}")
+    print(f"  Embedding indices updated: {updated}")
+    print(f"  Saved to: {EMBEDDINGS_PATH}")
+    print(f"  Chunk IDs saved to: {CHUNK_IDS_PATH} and {CHUNK_IDS_ARRAY_PATH}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Embed all chunks into a memory-mapped .npy file")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="encoder processes, each with its own model copy")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore any checkpoint and embed everything again")
+    args = parser.parse_args()
+
+    main(args.workers, args.batch_size, args.restart)
@@ -0,0 +1,123 @@
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CHUNK_IDS_PATH, CHUNK_STORE_DIR
+from db import get_pool
+from chunk_store import DOCUMENT_FIELDS, StringColumnWriter
+from chunk_filters import ChunkAttributes
+
+print("Building chunk store...")
+start_time = time.time()
+
+# Load chunk IDs in FAISS row order
+with open(CHUNK_IDS_PATH, 'rb') as f:
+    chunk_ids = pickle.load(f)
+print(f"Loaded {len(chunk_ids)} chunk IDs")
+
+# Write into a temporary directory and swap it in at the end, so a
+# running retriever never sees a half-written store
+tmp_dir = CHUNK_STORE_DIR + '.tmp'
+shutil.rmtree(tmp_dir, ignore_errors=True)
+os.makedirs(tmp_dir)
+
+pool = get_pool()
+conn = pool.getconn()
+
+# Server-side cursor streams rows in FAISS order without loading them all
+cursor = conn.cursor(name='chunk_store_export')
+cursor.itersize = 10000
+cursor.execute("""
+    SELECT
+        r.pos,
+        dc.chunk_text,
+        dc.document_id,
+        d.title,
+        d.authors,
+        d.categories,
+        d.update_date
+    FROM unnest(%s::int[]) WITH ORDINALITY AS r(chunk_id, pos)
+    LEFT JOIN document_chunks dc ON dc.chunk_id = r.chunk_id
+    LEFT JOIN documents d ON dc.document_id = d.document_id
+    ORDER BY r.pos
+""", (list(chunk_ids),))
+
+chunk_text = StringColumnWriter(os.path.join(tmp_dir, 'chunk_text'))
+doc_columns = {
+    field: StringColumnWriter(os.path.join(tmp_dir, f'doc_{field}'))
+    for field in DOCUMENT_FIELDS
+}
+doc_index = np.full(len(chunk_ids), -1, dtype=np.int32)
+doc_positions = {}
+attribute_rows = []
+missing = 0
+
+for row in cursor:
+    pos = row[0] - 1
+    document_id = row[2]
+
+    if document_id is None:
+        # Chunk was deleted after the index was built
+        chunk_text.append(None)
+        missing += 1
+        continue
+
+    chunk_text.append(row[1])
+
+    if document_id not in doc_positions:
+        doc_positions[document_id] = len(doc_positions)
+        doc_columns['document_id'].append(document_id)
+        doc_columns['title'].append(row[3])
+        doc_columns['authors'].append(row[4])
+        doc_columns['categories'].append(row[5])
+        doc_columns['update_date'].append(row[6].isoformat() if row[6] else None)
+    doc_index[pos] = doc_positions[document_id]
+    attribute_rows.append((pos, row[5], row[6]))
+
+    if (pos + 1) % 100000 == 0:
+        print(f"  Exported {pos + 1} / {len(chunk_ids)} chunks...")
+
+cursor.close()
+pool.putconn(conn)
+
+chunk_text.close()
+for column in doc_columns.values():
+    column.close()
+
+np.save(os.path.join(tmp_dir, 'chunk_ids.npy'), np.asarray(chunk_ids, dtype=np.int64))
+np.save(os.path.join(tmp_dir, 'doc_index.npy'), doc_index)
+
+# Per-chunk category and date arrays for filtered search
+attributes = ChunkAttributes.from_rows(attribute_rows, len(chunk_ids))
+attributes.save(tmp_dir)
+
+with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+    json.dump({
+        'num_chunks': len(chunk_ids),
+        'num_documents': len(doc_positions),
+        'missing_chunks': missing,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }, f, indent=2)
+
+shutil.rmtree(CHUNK_STORE_DIR, ignore_errors=True)
+os.rename(tmp_dir, CHUNK_STORE_DIR)
+
+size_mb = sum(
+    os.path.getsize(os.path.join(CHUNK_STORE_DIR, name))
+    for name in os.listdir(CHUNK_STORE_DIR)
+) / 1024 / 1024
+
+print("\nChunk store complete!")
+print(f"  Chunks: {len(chunk_ids)} ({missing} missing)")
+print(f"  Documents: {len(doc_positions)}")
+print(f"  Categories: {len(attributes.category_names)}")
+print(f"  Size on disk: {size_mb:.1f} MB")
+print(f"  Time: {time.time() - start_time:.1f}s")
+print(f"  Saved to: {CHUNK_STORE_DIR}")
@@ -1,8 +1,55 @@
+import argparse
+import json
+import os
+import sys
 import numpy as np
 import faiss
 import pickle
 
-print("Building FAISS index...")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FAISS_INDEX_REPORT_PATH, FAISS_INDEX_PATH, FAISS_SHARD_DIR
+from vector_index import (INDEX_TYPES, ENCODINGS, SHARD_KEYS, make_spec, build_index, save_index,
+                          save_manifest, load_manifest, index_memory_bytes, index_report, vector_encoding,
+                          shard_assignments, build_sharded_index, save_sharded_index)
+from papers_dataset import snapshot_info
+
+parser = argparse.ArgumentParser(description="Build the FAISS index over chunk embeddings")
+parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat',
+                    help="flat (exact), ivf, hnsw or ivfpq")
+parser.add_argument('--encoding', choices=ENCODINGS,
+                    help="vector storage: float32 (default), fp16, sq8 (int8 scalar) or pq")
+parser.add_argument('--rescore', type=int,
+                    help="re-rank RESCORE * k candidates with the float32 embeddings (0 = off)")
+parser.add_argument('--nlist', type=int, help="IVF: number of centroids")
+parser.add_argument('--pq-m', type=int, help="PQ: number of sub-quantizers")
+parser.add_argument('--pq-nbits', type=int, help="PQ: bits per sub-quantizer code")
+parser.add_argument('--hnsw-m', type=int, help="HNSW: neighbours per node")
+parser.add_argument('--ef-construction', type=int, help="HNSW: build-time beam width")
+parser.add_argument('--nprobe', type=int, help="IVF: lists scanned per query")
+parser.add_argument('--ef-search', type=int, help="HNSW: search-time beam width")
+parser.add_argument('--shards', type=int, default=1,
+                    help="split the vectors over N index files, searched in parallel")
+parser.add_argument('--shard-by', choices=SHARD_KEYS, default='hash',
+                    help="hash (even split by chunk id), year or category of the paper")
+parser.add_argument('--report-queries', type=int, default=500,
+                    help="queries for the recall/latency report (0 to skip)")
+args = parser.parse_args()
+
+spec = make_spec(
+    args.index_type,
+    encoding=args.encoding,
+    rescore=args.rescore,
+    nlist=args.nlist,
+    pq_m=args.pq_m,
+    pq_nbits=args.pq_nbits,
+    hnsw_m=args.hnsw_m,
+    ef_construction=args.ef_construction,
+    nprobe=args.nprobe,
+    ef_search=args.ef_search
+)
+
+print(f"Building FAISS index ({spec['type']}, {vector_encoding(spec)} vectors)...")
 
 # Load embeddings
 print("Loading embeddings from disk...")
@@ -14,26 +61,61 @@ with open('data/processed/chunk_ids.pkl', 'rb') as f:
     chunk_ids = pickle.load(f)
 print(f"Loaded {len(chunk_ids)} chunk IDs")
 
+manifest = load_manifest()
+if manifest and manifest.get('tombstones'):
+    print(f"Warning: {manifest['tombstones']} embeddings belong to chunks removed by "
+          f"09_incremental_update.py; rerun 05_generate_embeddings.py first to drop them")
+
 # Normalize embeddings for cosine similarity
 print("Normalizing embeddings...")
 faiss.normalize_L2(embeddings)
 
-# Build FAISS index
+# Build FAISS index (inner product = cosine similarity after normalization)
 print("Building FAISS index...")
 dimension = embeddings.shape[1]
-index = faiss.IndexFlatIP(dimension)  # Inner Product = Cosine similarity after normalization
-index.add(embeddings)
+if args.shards > 1:
+    attributes = None
+    if args.shard_by != 'hash':
+        from chunk_store import load_chunk_store
+        from chunk_filters import load_chunk_attributes
+        attributes = load_chunk_attributes(chunk_ids, load_chunk_store(chunk_ids))
+    assignments, shard_keys = shard_assignments(chunk_ids, args.shards, args.shard_by, attributes)
+    index = build_sharded_index(embeddings, spec, assignments)
+else:
+    index = build_index(embeddings, spec)
 
 print(f"Index built with {index.ntotal} vectors")
 
-# Save index
+# Save index and the spec that built it
 print("Saving FAISS index...")
-faiss.write_index(index, 'data/processed/faiss_index.bin')
+if args.shards > 1:
+    meta = save_sharded_index(index, spec, args.shard_by, shard_keys)
+    saved_to = FAISS_SHARD_DIR
+else:
+    meta = save_index(index, spec)
+    saved_to = FAISS_INDEX_PATH
+save_manifest(dict(
+    snapshot_info(),
+    mode='full',
+    index_built_at=meta['built_at'],
+    chunk_ids=len(chunk_ids),
+    vectors=int(index.ntotal),
+    # Rows of removed chunks are indexed again until 05 re-embeds from scratch
+    tombstones=manifest.get('tombstones', 0) if manifest else 0
+))
 
 print("\nFAISS index creation complete!")
+print(f"  Type: {spec['type']}")
+print(f"  Encoding: {vector_encoding(spec)}")
 print(f"  Dimension: {dimension}")
 print(f"  Total vectors: {index.ntotal}")
-print(f"  Saved to: data/processed/faiss_index.bin")
+print(f"  Index size: {index_memory_bytes(index) / 1024 / 1024:.1f} MB")
+if args.shards > 1:
+    for shard in meta['shards']:
+        keys = f" ({', '.join(shard['keys'][:5])}{', ...' if len(shard['keys']) > 5 else ''})" \
+            if shard['keys'] else ''
+        print(f"    {os.path.basename(shard['path'])}: {shard['ntotal']} vectors{keys}")
+print(f"  Saved to: {saved_to}")
 
 # Test the index
 print("\nTesting index with sample query...")
@@ -42,4 +124,23 @@ faiss.normalize_L2(test_query)
 distances, indices = index.search(test_query, k=5)
 print(f"  Top 5 similar chunks: {indices[0]}")
 print(f"  Similarity scores: {distances[0]}")
-print("\nIndex is ready for retrieval!")
\ No newline at end of file
+
+# Memory, recall and latency of this index against exact float32 search
+if args.report_queries:
+    print(f"\nMeasuring recall@10 and latency over {args.report_queries} queries...")
+    report = index_report(index, spec, embeddings, args.report_queries)
+    report['built_at'] = meta['built_at']
+    with open(FAISS_INDEX_REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"  Memory per vector: {report['bytes_per_vector']} bytes "
+          f"(float32: {report['float32_bytes_per_vector']})")
+    searches = [('search', report['search'])]
+    if 'rescored_search' in report:
+        searches.append((f"rescored x{report['rescore']}", report['rescored_search']))
+    for name, result in searches:
+        print(f"  {name}: recall@10 {result['recall_at_k']:.3f}, "
+              f"p50 {result['latency_p50_ms']:.2f}ms, p95 {result['latency_p95_ms']:.2f}ms")
+    print(f"  Report saved to: {FAISS_INDEX_REPORT_PATH}")
+
+print("\nIndex is ready for retrieval!")
@@ -1,84 +1,138 @@
-import numpy as np
-import faiss
-import pickle
-import psycopg2
+import os
+import sys
 from sentence_transformers import SentenceTransformer
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_store import load_chunk_store, fetch_chunks
+from db import get_pool, close_pool
+from batch_encoder import BatchingEncoder
+from chunk_filters import filtered_search_for
+from vector_index import load_index, load_chunk_ids, open_embeddings, make_searcher, vector_encoding
+from config import EMBEDDING_MODEL, INDEX_MMAP, STARTUP_WARMUP, EMBEDDING_CACHE_WARM, EMBEDDING_CACHE_PATH
+from embedding_cache import load_embedding_cache, warm_from_queries
+from startup import StartupTimer, warm_up
+from metrics import stage
+from context_packing import ContextPacker
+
 class RetrievalSystem:
     def __init__(self):
         print("Initializing Retrieval System...")
+        self.startup = StartupTimer()
         
         # Load embedding model
         print("Loading embedding model...")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        with self.startup.phase('model'):
+            self.model = SentenceTransformer(EMBEDDING_MODEL)
+        
+        # Embeddings of queries asked before, so repeats skip the model
+        with self.startup.phase('embedding_cache'):
+            self.query_cache = load_embedding_cache(self.model)
+            if self.query_cache is not None and EMBEDDING_CACHE_WARM:
+                try:
+                    with self.pool.connection() as conn:
+                        warm_from_queries(self.query_cache, self.model, conn, EMBEDDING_CACHE_WARM)
+                except Exception as e:
+                    print(f"Query embedding cache warmup failed: {e}")
         
-        # Load FAISS index
+        # Load FAISS index with the search settings it was built for
+        # (memory-mapped, so pages are read on first use)
         print("Loading FAISS index...")
-        self.index = faiss.read_index('data/processed/faiss_index.bin')
+        with self.startup.phase('index'):
+            self.index, self.index_meta = load_index(mmap=INDEX_MMAP)
+        print(f"Index type: {self.index_meta['type']} ({vector_encoding(self.index_meta)} vectors)")
         
-        # Load chunk IDs
+        # Load chunk IDs as a flat array
         print("Loading chunk IDs...")
-        with open('data/processed/chunk_ids.pkl', 'rb') as f:
-            self.chunk_ids = pickle.load(f)
+        with self.startup.phase('chunk_ids'):
+            self.chunk_ids = load_chunk_ids(mmap=INDEX_MMAP)
+        
+        # Memory-mapped chunk text and metadata, if built for this index
+        print("Loading chunk store...")
+        with self.startup.phase('chunk_store'):
+            self.store = load_chunk_store(self.chunk_ids)
+        
+        # Float32 vectors stay on disk; compressed indexes re-rank their
+        # candidates from them and small filtered searches score them exactly
+        self.embeddings = open_embeddings(len(self.chunk_ids))
+        self.searcher = make_searcher(self.index, self.index_meta, self.embeddings)
+        
+        # Builds prompt context within a token budget from search results
+        self.packer = ContextPacker(self.model.tokenizer, self.embeddings)
         
-        # Database connection
-        self.conn = psycopg2.connect(
-            host="localhost",
-            database="rag_chatbot_db"
-        )
+        # Category/date filters are applied inside the vector search
+        self.filtered = filtered_search_for(self.searcher, self.index_meta, self.chunk_ids,
+                                            self.store, self.embeddings)
+        
+        # Batch queries from concurrent callers into one encode + search
+        self.encoder = BatchingEncoder(self.model, self.searcher, self.filtered, cache=self.query_cache)
+        
+        # One query end to end, so the first real one is not the slow one
+        if STARTUP_WARMUP:
+            with self.startup.phase('warmup'):
+                warm_up(self)
+        self.startup.finish()
         
         print(f"System ready! {self.index.ntotal} chunks indexed.")
     
-    def search(self, query, top_k=5):
-        """Search for relevant chunks"""
-        # Generate query embedding
-        query_embedding = self.model.encode([query])
-        query_embedding = query_embedding.astype('float32')
-        faiss.normalize_L2(query_embedding)
+    @property
+    def pool(self):
+        # Pooled database connections, shared across threads; only needed
+        # when there is no chunk store
+        return get_pool()
+    
+    def search(self, query, top_k=5, categories=None, date_from=None, date_to=None, timings=None):
+        """Search for relevant chunks, optionally only in the given categories and date range.
         
-        # Search FAISS index
-        distances, indices = self.index.search(query_embedding, top_k)
+        If `timings` is a dict, the embed, search and hydrate milliseconds are added to it.
+        """
+        filters = None
+        if categories or date_from or date_to:
+            filters = {'categories': categories, 'date_from': date_from, 'date_to': date_to}
         
-        # Get chunk details from database
+        # Generate query embedding and search FAISS index (batched with
+        # any other queries arriving at the same time)
+        distances, indices = self.encoder.search(query, top_k, filters, timings)
+        return self.hydrate(distances, indices, timings)
+    
+    def hydrate(self, distances, indices, timings=None):
+        """Turn FAISS search output into result dicts"""
+        # Get chunk details from the chunk store, or in one query from the database
+        positions = [pos for pos in indices[0] if pos >= 0]
+        with stage('hydrate', timings):
+            if self.store is not None:
+                rows = self.store.get_many(positions)
+            else:
+                with self.pool.connection() as conn:
+                    rows = fetch_chunks(conn, [self.chunk_ids[pos] for pos in positions])
+        return self.to_results(distances, positions, rows)
+    
+    def to_results(self, distances, positions, rows):
+        """Search hits and their chunk rows as ranked result dicts"""
         results = []
-        cursor = self.conn.cursor()
-        
-        for idx, (distance, index_pos) in enumerate(zip(distances[0], indices[0])):
-            chunk_id = self.chunk_ids[index_pos]
-            
-            # Get chunk and document info
-            cursor.execute("""
-                SELECT 
-                    dc.chunk_text,
-                    dc.document_id,
-                    d.title,
-                    d.authors,
-                    d.categories,
-                    d.update_date
-                FROM document_chunks dc
-                JOIN documents d ON dc.document_id = d.document_id
-                WHERE dc.chunk_id = %s
-            """, (chunk_id,))
-            
-            row = cursor.fetchone()
+        for distance, position, row in zip(distances[0], positions, rows):
             if row:
                 results.append({
-                    'rank': idx + 1,
+                    'rank': len(results) + 1,
                     'similarity': float(distance),
-                    'chunk_text': row[0],
-                    'document_id': row[1],
-                    'title': row[2],
-                    'authors': row[3],
-                    'categories': row[4],
-                    'date': row[5]
+                    'position': int(position),
+                    'chunk_id': row['chunk_id'],
+                    'chunk_text': row['chunk_text'],
+                    'document_id': row['document_id'],
+                    'title': row['title'],
+                    'authors': row['authors'],
+                    'categories': row['categories'],
+                    'date': row['update_date']
                 })
         
-        cursor.close()
         return results
     
     def close(self):
-        """Close database connection"""
-        self.conn.close()
+        """Stop the encoder, save new query embeddings and close pooled database connections"""
+        self.encoder.close()
+        if self.query_cache is not None and EMBEDDING_CACHE_PATH:
+            self.query_cache.save(EMBEDDING_CACHE_PATH)
+        close_pool()
 
 
 # Test the system
@@ -109,6 +163,15 @@ if __name__ == "__main__":
             print(f"   Categories: {result['categories']}")
             print(f"   Chunk: {result['chunk_text'][:150]}...")
     
+    # Same query restricted to one category and a date range
+    print(f"\nQuery: '{test_queries[0]}' (cs.CV, 2023 only)")
+    print("-" * 60)
+    for result in retriever.search(test_queries[0], top_k=3, categories=['cs.CV'],
+                                   date_from='2023-01-01', date_to='2023-12-31'):
+        print(f"\n{result['rank']}. Similarity: {result['similarity']:.4f}")
+        print(f"   Title: {result['title'][:80]}...")
+        print(f"   Categories: {result['categories']}  Date: {result['date']}")
+    
     retriever.close()
     print("\n" + "="*60)
     print("Retrieval system test complete!")
@@ -12,52 +12,58 @@ sys.path.insert(0, current_dir)
 
 # Now import
 exec(open(os.path.join(current_dir, '07_retrieval_system.py')).read())
+import ollama_client
+from query_log import get_query_log, close_query_log
+from metrics import stage, observe_stage
 class RAGChatbot:
     def __init__(self):
         print("Initializing RAG Chatbot...")
         self.retriever = RetrievalSystem()
-        self.ollama_url = "http://localhost:11434/api/generate"
+        # Shared, concurrency-limited client for the OLLAMA_URLS endpoints
+        self.llm = ollama_client.get_client()
         self.model = "mistral:latest"
         
-        # Database connection for logging
-        self.conn = psycopg2.connect(
-            host="localhost",
-            database="rag_chatbot_db"
-        )
+        # Queries are logged by a background writer, off the response path
+        self.query_log = get_query_log()
         print("RAG Chatbot ready!")
     
     def generate_response(self, query, top_k=5):
         """Generate response using RAG"""
-        start_time = time.time()
+        start_time = time.perf_counter()
+        timings = {}  # milliseconds per stage
         
         # Step 1: Retrieve relevant chunks
         print(f"\nSearching for relevant papers...")
-        retrieval_start = time.time()
-        results = self.retriever.search(query, top_k=top_k)
-        retrieval_time = int((time.time() - retrieval_start) * 1000)
+        results = self.retriever.search(query, top_k=top_k, timings=timings)
+        retrieval_time = int((time.perf_counter() - start_time) * 1000)
         
         print(f"Found {len(results)} relevant papers in {retrieval_time}ms")
         
-        # Step 2: Build context from retrieved chunks
-        context = self._build_context(results)
-        
-        # Step 3: Create prompt
-        prompt = self._create_prompt(query, context)
+        # Step 2-3: Pack retrieved chunks into a token-budgeted context and create prompt
+        with stage('context', timings):
+            passages, packing = self.retriever.packer.pack(results)
+            context = self._build_context(passages)
+            prompt = self._create_prompt(query, context)
+        print(f"Context: {packing['tokens']} tokens from {len(passages)} passages "
+              f"({packing['merged']} chunks merged, {packing['duplicates']} duplicates, "
+              f"{packing['dropped']} over budget)")
         
         # Step 4: Generate response with Ollama
         print("Generating response with Llama 3.2...")
-        generation_start = time.time()
-        response_text = self._call_ollama(prompt)
-        generation_time = int((time.time() - generation_start) * 1000)
+        with stage('llm_total', timings):
+            response_text = self._call_ollama(prompt)
+        generation_time = int(timings['llm_total'])
         
-        total_time = int((time.time() - start_time) * 1000)
+        total_time = int((time.perf_counter() - start_time) * 1000)
         
         print(f"Response generated in {generation_time}ms")
         print(f"Total time: {total_time}ms")
         
         # Step 5: Log to database
-        self._log_query(query, response_text, results, 
-                       retrieval_time, generation_time, total_time)
+        with stage('log', timings):
+            self._log_query(query, response_text, results,
+                            retrieval_time, generation_time, total_time)
+        observe_stage('total', time.perf_counter() - start_time, timings)
         
         return {
             'query': query,
@@ -65,7 +71,54 @@ class RAGChatbot:
             'sources': results,
             'retrieval_time_ms': retrieval_time,
             'generation_time_ms': generation_time,
-            'total_time_ms': total_time
+            'total_time_ms': total_time,
+            'context_tokens': packing['tokens'],
+            'timings': timings
+        }
+    
+    def generate_response_stream(self, query, top_k=5):
+        """Generate a response with RAG, yielding events as tokens arrive.
+        
+        Yields ('sources', results) first, then ('token', text) for each
+        token, then ('done', timings) once the response is queued for logging.
+        """
+        start_time = time.perf_counter()
+        timings = {}
+        
+        results = self.retriever.search(query, top_k=top_k, timings=timings)
+        retrieval_time = int((time.perf_counter() - start_time) * 1000)
+        yield 'sources', results
+        
+        with stage('context', timings):
+            passages, packing = self.retriever.packer.pack(results)
+            prompt = self._create_prompt(query, self._build_context(passages))
+        
+        generation_start = time.perf_counter()
+        first_token_time = None
+        tokens = []
+        for token in self.llm.stream_generate(prompt, model=self.model):
+            if first_token_time is None:
+                observe_stage('llm_first_token', time.perf_counter() - generation_start, timings)
+                first_token_time = int(timings['llm_first_token'])
+            tokens.append(token)
+            yield 'token', token
+        observe_stage('llm_total', time.perf_counter() - generation_start, timings)
+        generation_time = int(timings['llm_total'])
+        
+        total_time = int((time.perf_counter() - start_time) * 1000)
+        
+        with stage('log', timings):
+            self._log_query(query, ''.join(tokens), results,
+                            retrieval_time, generation_time, total_time)
+        observe_stage('total', time.perf_counter() - start_time, timings)
+        
+        yield 'done', {
+            'retrieval_time_ms': retrieval_time,
+            'time_to_first_token_ms': first_token_time,
+            'generation_time_ms': generation_time,
+            'total_time_ms': total_time,
+            'context_tokens': packing['tokens'],
+            'timings': timings
         }
     
     def _build_context(self, results):
@@ -99,63 +152,23 @@ Answer:"""
     
     def _call_ollama(self, prompt):
         """Call Ollama API"""
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False
-        }
-        
         try:
-            response = requests.post(self.ollama_url, json=payload)
-            if response.status_code == 200:
-                return response.json()['response']
-            else:
-                return f"Error: Ollama returned status {response.status_code}"
+            return self.llm.generate(prompt, model=self.model)
+        except ollama_client.OllamaBusy as e:
+            return f"Error: {e}"
+        except ollama_client.OllamaError as e:
+            return f"Error: Ollama returned status {e.status_code}"
         except Exception as e:
             return f"Error calling Ollama: {str(e)}"
     
     def _log_query(self, query, response, results, ret_time, gen_time, total_time):
-        """Log query to database"""
-        cursor = self.conn.cursor()
-        
-        # Insert query
-        cursor.execute("""
-            INSERT INTO queries (
-                user_query_text, response_text, 
-                retrieval_time_ms, generation_time_ms, total_latency_ms
-            ) VALUES (%s, %s, %s, %s, %s)
-            RETURNING query_id
-        """, (query, response, ret_time, gen_time, total_time))
-        
-        query_id = cursor.fetchone()[0]
-        
-        # Log retrieved documents
-        for rank, result in enumerate(results, 1):
-            cursor.execute("""
-                SELECT chunk_id FROM document_chunks 
-                WHERE document_id = %s 
-                LIMIT 1
-            """, (result['document_id'],))
-            
-            chunk_row = cursor.fetchone()
-            if chunk_row:
-                chunk_id = chunk_row[0]
-                
-                cursor.execute("""
-                    INSERT INTO retrieval_logs (
-                        query_id, document_id, chunk_id,
-                        similarity_score, retrieval_rank, was_used_in_response
-                    ) VALUES (%s, %s, %s, %s, %s, %s)
-                """, (query_id, result['document_id'], chunk_id,
-                      result['similarity'], rank, True))
-        
-        self.conn.commit()
-        cursor.close()
+        """Queue the query and its retrieved chunks for the log writer"""
+        self.query_log.log(query, response, results, ret_time, gen_time, total_time)
     
     def close(self):
-        """Close connections"""
+        """Write pending logs, then close connections"""
+        close_query_log()
         self.retriever.close()
-        self.conn.close()
 
 
 # Test the chatbot
@@ -178,6 +191,24 @@ if __name__ == "__main__":
         print(f"QUESTION: {question}")
         print("="*60)
         
+        if '--stream' in sys.argv:
+            # Print sources first, then tokens as they arrive
+            for event, data in chatbot.generate_response_stream(question, top_k=3):
+                if event == 'sources':
+                    print(f"\nSOURCES USED:")
+                    for source in data:
+                        print(f"  - {source['title'][:60]}... ({source['categories']})")
+                    print(f"\nANSWER:")
+                elif event == 'token':
+                    print(data, end='', flush=True)
+                else:
+                    print(f"\n\nPERFORMANCE:")
+                    print(f"  Retrieval: {data['retrieval_time_ms']}ms")
+                    print(f"  First token: {data['time_to_first_token_ms']}ms")
+                    print(f"  Generation: {data['generation_time_ms']}ms")
+                    print(f"  Total: {data['total_time_ms']}ms")
+            continue
+        
         result = chatbot.generate_response(question, top_k=3)
         
         print(f"\nANSWER:\n{result['response']}")
@@ -189,6 +220,7 @@ if __name__ == "__main__":
         print(f"  Retrieval: {result['retrieval_time_ms']}ms")
         print(f"  Generation: {result['generation_time_ms']}ms")
         print(f"  Total: {result['total_time_ms']}ms")
+        print("  Stages: " + ", ".join(f"{name} {ms:.1f}ms" for name, ms in result['timings'].items()))
     
     chatbot.close()
     print("\n" + "="*60)
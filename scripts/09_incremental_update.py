@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+import numpy as np
+import faiss
+import pickle
+from psycopg2.extras import execute_values
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (EMBEDDING_MODEL, EMBEDDINGS_PATH, CHUNK_IDS_PATH,
+                    FAISS_INDEX_PATH)
+from db import get_pool
+from papers_dataset import load_papers, content_hash, snapshot_info
+from text_processing import chunk_papers, load_tokenizer, TokenCounter
+from vector_index import (load_index, save_index, update_index, write_embeddings, save_chunk_ids_array,
+                          supports_updates, save_manifest)
+
+DOCUMENT_COLUMNS = ['title', 'authors', 'categories', 'abstract', 'update_date',
+                    'word_count', 'content_hash']
+
+
+def diff_documents(cursor, df):
+    """Split the snapshot into new and changed papers, and list papers no longer in it"""
+    cursor.execute("SELECT document_id, content_hash FROM documents")
+    stored = dict(cursor.fetchall())
+
+    known = df['id'].isin(stored.keys())
+    changed = known & (df['content_hash'] != df['id'].map(stored))
+    deleted = list(stored.keys() - set(df['id']))
+    return df[~known], df[changed], deleted
+
+
+def document_rows(df):
+    return [
+        (row.id, row.id, row.title, row.authors, row.categories, row.abstract, row.update_date,
+         None if row.word_count is None else int(row.word_count), row.content_hash)
+        for row in df.astype(object).where(df.notna(), None).itertuples(index=False)
+    ]
+
+
+def apply_document_changes(cursor, new_df, changed_df, deleted):
+    """Bring documents and document_chunks in line with the snapshot.
+
+    Chunks of changed papers are replaced; the new chunks have no
+    embedding_index until the index has been updated.
+    """
+    if deleted:
+        # Cascades to the papers' chunks
+        cursor.execute("DELETE FROM documents WHERE document_id = ANY(%s)", (deleted,))
+
+    if len(changed_df):
+        cursor.execute("DELETE FROM document_chunks WHERE document_id = ANY(%s)",
+                       (changed_df['id'].tolist(),))
+        execute_values(cursor, f"""
+            UPDATE documents d SET
+                {', '.join(f'{c} = v.{c}' for c in DOCUMENT_COLUMNS)}
+            FROM (VALUES %s) AS v(document_id, arxiv_id, {', '.join(DOCUMENT_COLUMNS)})
+            WHERE d.document_id = v.document_id
+        """, document_rows(changed_df),
+            template="(%s, %s, %s, %s, %s, %s, %s::date, %s::int, %s)", page_size=1000)
+
+    if len(new_df):
+        execute_values(cursor, f"""
+            INSERT INTO documents (document_id, arxiv_id, {', '.join(DOCUMENT_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (arxiv_id) DO NOTHING
+        """, document_rows(new_df), page_size=1000)
+
+    chunks = chunk_papers(new_df['id'].tolist() + changed_df['id'].tolist(),
+                          new_df['abstract'].tolist() + changed_df['abstract'].tolist(),
+                          TokenCounter(load_tokenizer()))
+
+    execute_values(cursor, """
+        INSERT INTO document_chunks (document_id, chunk_text, chunk_index, token_count)
+        VALUES %s
+    """, chunks, page_size=1000)
+    return len(chunks)
+
+
+def backfill_hashes(cursor, df):
+    """Record hashes for papers loaded before content_hash existed, assuming they are current"""
+    cursor.execute("""
+        UPDATE documents d SET content_hash = v.content_hash
+        FROM unnest(%s::text[], %s::text[]) AS v(document_id, content_hash)
+        WHERE d.document_id = v.document_id AND d.content_hash IS NULL
+    """, (df['id'].tolist(), df['content_hash'].tolist()))
+    return cursor.rowcount
+
+
+def corpus_digest(df):
+    """Fingerprint of every paper id and content hash in the snapshot"""
+    digest = hashlib.sha1()
+    for paper_id, hash_value in sorted(zip(df['id'], df['content_hash'])):
+        digest.update(f"{paper_id}:{hash_value}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def main(batch_size, backfill):
+    print("Starting incremental update...")
+    start_time = time.time()
+
+    # Load the current index and its chunk id list
+    index, spec = load_index()
+    if spec.get('shards'):
+        raise SystemExit("The index is sharded; rebuild it with 06_build_faiss_index.py "
+                         f"--shards {len(spec['shards'])} --shard-by {spec['shard_by']}")
+    if not supports_updates(index):
+        raise SystemExit("The index was built without vector labels; "
+                         "rebuild it once with 06_build_faiss_index.py")
+    with open(CHUNK_IDS_PATH, 'rb') as f:
+        chunk_ids = pickle.load(f)
+    print(f"Index: {spec['type']}, {index.ntotal} vectors, {len(chunk_ids)} positions")
+
+    print("Reading snapshot...")
+    df = load_papers(columns=['id', 'title', 'authors', 'categories', 'abstract',
+                              'update_date', 'word_count'])
+    df['content_hash'] = content_hash(df)
+    print(f"Snapshot has {len(df)} papers")
+
+    pool = get_pool()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash CHAR(40)")
+        if backfill:
+            print(f"Backfilled hashes for {backfill_hashes(cursor, df)} papers")
+
+        new_df, changed_df, deleted = diff_documents(cursor, df)
+        print(f"  New papers: {len(new_df)}")
+        print(f"  Changed papers: {len(changed_df)}")
+        print(f"  Deleted papers: {len(deleted)}")
+
+        chunks_written = apply_document_changes(cursor, new_df, changed_df, deleted)
+        print(f"  Chunks written: {chunks_written}")
+        cursor.close()
+
+    # The index is reconciled against the committed chunks, so a run that
+    # stopped after the database step is finished by the next one
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT chunk_id FROM document_chunks")
+        live = {row[0] for row in cursor.fetchall()}
+        removed = [chunk_id for chunk_id in chunk_ids if chunk_id not in live]
+
+        cursor.execute("""
+            SELECT chunk_id, chunk_text FROM document_chunks
+            WHERE embedding_index IS NULL
+            ORDER BY chunk_id
+        """)
+        pending = cursor.fetchall()
+        cursor.close()
+
+    # Chunks added to the index by a run that stopped before writing embedding_index
+    positions = {chunk_id: pos for pos, chunk_id in enumerate(chunk_ids)}
+    indexed = [(chunk_id, positions[chunk_id]) for chunk_id, _ in pending if chunk_id in positions]
+    pending = [(chunk_id, text) for chunk_id, text in pending if chunk_id not in positions]
+
+    print(f"Embedding {len(pending)} chunks...")
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    added_ids = [chunk_id for chunk_id, _ in pending]
+    embeddings = np.zeros((len(pending), index.d), dtype='float32')
+    for start in range(0, len(pending), batch_size):
+        texts = [text for _, text in pending[start:start + batch_size]]
+        embeddings[start:start + len(texts)] = model.encode(texts, show_progress_bar=False)
+
+    # embeddings.npy keeps raw vectors, like 05_generate_embeddings.py
+    normalized = embeddings.copy()
+    faiss.normalize_L2(normalized)
+
+    print("Updating index...")
+    first_position = len(chunk_ids)
+    chunk_ids, num_removed = update_index(index, spec, chunk_ids, removed, added_ids, normalized)
+    indexed += list(zip(added_ids, range(first_position, len(chunk_ids))))
+
+    # chunk_ids.pkl is written last: until it is replaced, a rerun
+    # overwrites the new embedding rows and index labels from this run
+    write_embeddings(EMBEDDINGS_PATH, first_position, embeddings)
+    meta = save_index(index, spec)
+    save_chunk_ids_array(chunk_ids)
+    with open(CHUNK_IDS_PATH + '.tmp', 'wb') as f:
+        pickle.dump(chunk_ids, f)
+    os.replace(CHUNK_IDS_PATH + '.tmp', CHUNK_IDS_PATH)
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE document_chunks dc
+            SET embedding_index = v.embedding_index
+            FROM unnest(%s::int[], %s::int[]) AS v(chunk_id, embedding_index)
+            WHERE dc.chunk_id = v.chunk_id
+        """, ([c for c, _ in indexed], [p for _, p in indexed]))
+        cursor.close()
+
+    manifest = save_manifest(dict(
+        snapshot_info(),
+        mode='incremental',
+        corpus_digest=corpus_digest(df),
+        papers=len(df),
+        index_built_at=meta['built_at'],
+        chunk_ids=len(chunk_ids),
+        vectors=int(index.ntotal),
+        tombstones=len(chunk_ids) - int(index.ntotal),
+        last_update={
+            'new_papers': len(new_df),
+            'changed_papers': len(changed_df),
+            'deleted_papers': len(deleted),
+            'vectors_added': len(added_ids),
+            'vectors_removed': int(num_removed)
+        }
+    ))
+
+    print("\nIncremental update complete!")
+    print(f"  Vectors added: {len(added_ids)}")
+    print(f"  Vectors removed: {num_removed}")
+    print(f"  Index: {index.ntotal} vectors, {manifest['tombstones']} tombstoned positions")
+    print(f"  Time: {time.time() - start_time:.1f}s")
+    print(f"  Saved to: {FAISS_INDEX_PATH}")
+    print("Rebuild the chunk store with 06_build_chunk_store.py to serve the new chunks from it.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Apply new, changed and deleted papers to the database and FAISS index")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--backfill-hashes', action='store_true',
+                        help="first run on a database loaded without content hashes: treat "
+                             "stored papers as current instead of reloading all of them")
+    args = parser.parse_args()
+
+    main(args.batch_size, args.backfill_hashes)
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import runpy
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from batch_qa import parse_questions, answer_batch
+from config import BATCH_LLM_CONCURRENCY
+
+# Answer a fixed question set with the 08_rag_pipeline.py chatbot (same
+# retriever, prompt and model) and write one JSON line per answer, in the
+# order answers complete. Questions are read from a .txt file (one per
+# line) or a .jsonl file of {"id": ..., "query": ...} objects or strings.
+# Each --batch-size slice is encoded, searched and hydrated together, and
+# --concurrency generations run at once.
+
+parser = argparse.ArgumentParser(description="Answer a question set in batches and write JSONL")
+parser.add_argument('questions', help=".txt (one question per line) or .jsonl file")
+parser.add_argument('--output', help="JSONL results path (default: <questions>.results.jsonl)")
+parser.add_argument('--top-k', type=int, default=5)
+parser.add_argument('--batch-size', type=int, default=256, help="questions retrieved together")
+parser.add_argument('--concurrency', type=int, default=BATCH_LLM_CONCURRENCY,
+                    help="generations in flight")
+parser.add_argument('--log', action='store_true', help="write the answers to the query log")
+args = parser.parse_args()
+
+
+def read_questions(path):
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith('.jsonl'):
+        lines = [json.loads(line) for line in lines]
+    return parse_questions(lines, max_questions=len(lines))
+
+
+questions = read_questions(args.questions)
+output_path = args.output or os.path.splitext(args.questions)[0] + '.results.jsonl'
+print(f"{len(questions)} questions from {args.questions}")
+
+# Without running 08's own test questions
+RAGChatbot = runpy.run_path(os.path.join(current_dir, '08_rag_pipeline.py'), run_name='rag_pipeline')['RAGChatbot']
+chatbot = RAGChatbot()
+
+
+def build_prompt(query, passages):
+    return chatbot._create_prompt(query, chatbot._build_context(passages))
+
+
+def generate(prompt):
+    return chatbot.llm.generate(prompt, model=chatbot.model)
+
+
+start_time = time.perf_counter()
+generation_ms, errors, done = [], 0, 0
+with open(output_path, 'w') as out:
+    for start in range(0, len(questions), args.batch_size):
+        batch = questions[start:start + args.batch_size]
+        timings = {}
+        results = answer_batch(chatbot.retriever, batch, build_prompt, generate, args.top_k,
+                               concurrency=args.concurrency,
+                               query_log=chatbot.query_log if args.log else None, timings=timings)
+        print(f"Batch of {len(batch)}: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items()))
+
+        for result in results:
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            done += 1
+            if result['error']:
+                errors += 1
+            else:
+                generation_ms.append(result['generation_ms'])
+            if done % 50 == 0:
+                print(f"  {done}/{len(questions)} answered "
+                      f"({time.perf_counter() - start_time:.0f}s, {errors} errors)")
+
+elapsed = time.perf_counter() - start_time
+chatbot.close()
+
+print(f"\nAnswered {done} questions in {elapsed:.1f}s "
+      f"({done / elapsed * 60:.0f} per minute), {errors} errors")
+if generation_ms:
+    print(f"  Generation p50 {np.percentile(generation_ms, 50):.0f}ms, "
+          f"p95 {np.percentile(generation_ms, 95):.0f}ms")
+print(f"  Results: {output_path}")
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LOG_PARTITION_MONTHS_AHEAD, ROLLUP_LAG_MINUTES
+from db import get_pool
+from log_rollups import (add_months, month_start, create_log_partitions, drop_log_partitions,
+                         refresh_rollups)
+
+# Log table upkeep, meant to run from cron every hour:
+#   1. create the monthly partitions of queries and retrieval_logs for the
+#      coming months, moving rows that went to the default partition
+#   2. add every completed hour of log rows to the rollup tables read by
+#      sql_queries/rollup_queries.sql
+#   3. with --retain-months, drop the raw log partitions older than that;
+#      only months that are fully rolled up are dropped
+
+
+def main(months_ahead, lag_minutes, retain_months):
+    start_time = time.time()
+    pool = get_pool()
+    this_month = month_start(date.today())
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        created = create_log_partitions(cursor, this_month, add_months(this_month, months_ahead))
+        cursor.close()
+    print(f"Partitions created: {', '.join(created) if created else 'none needed'}")
+
+    with pool.connection() as conn:
+        refreshed = refresh_rollups(conn, lag_minutes)
+    if refreshed is None:
+        print("Rollups already up to date")
+    else:
+        start, end = refreshed
+        print(f"Rolled up log rows {'from ' + str(start) if start else 'from the start'} to {end}")
+
+    if retain_months is not None:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            dropped = drop_log_partitions(cursor, add_months(this_month, -retain_months))
+            cursor.close()
+        print(f"Partitions dropped: {', '.join(dropped) if dropped else 'none'}")
+
+    print(f"Done in {time.time() - start_time:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create log partitions and refresh the analytics rollups")
+    parser.add_argument('--months-ahead', type=int, default=LOG_PARTITION_MONTHS_AHEAD,
+                        help="partitions to create beyond the current month")
+    parser.add_argument('--lag-minutes', type=int, default=ROLLUP_LAG_MINUTES,
+                        help="roll up an hour once it ended this long ago")
+    parser.add_argument('--retain-months', type=int,
+                        help="drop raw log partitions older than this many months")
+    args = parser.parse_args()
+
+    main(args.months_ahead, args.lag_minutes, args.retain_months)
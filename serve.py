@@ -0,0 +1,169 @@
+"""Pre-forking production server for app.py.
+
+The master process loads the embedding model, FAISS index, chunk ids and
+chunk store once, then forks the workers. Workers inherit those pages
+copy-on-write, and the memory-mapped index and id files come from the
+shared page cache, so adding a worker costs its own heap, not another copy
+of the model and index. Each worker then starts its own batching thread,
+connection pool and query log writer, which cannot be shared across a fork,
+and serves requests from the shared listening socket. The master restarts
+workers that die and stops them all on SIGTERM or Ctrl-C.
+
+With --async the workers run async_app.py under uvicorn instead, each
+holding many requests in flight on one event loop.
+
+    python serve.py --workers 4 --port 5000
+    python serve.py --workers 4 --port 5000 --async
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from config import SERVE_HOST, SERVE_PORT, SERVE_WORKERS, SERVE_WORKER_THREADS
+
+parser = argparse.ArgumentParser(description="Serve the RAG chatbot with pre-forked workers")
+parser.add_argument('--host', default=SERVE_HOST)
+parser.add_argument('--port', type=int, default=SERVE_PORT)
+parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help="0 = one per CPU core")
+parser.add_argument('--threads', type=int, default=SERVE_WORKER_THREADS,
+                    help="torch / OpenMP threads per worker")
+parser.add_argument('--access-log', action='store_true', help="log every request")
+parser.add_argument('--async', dest='use_async', action='store_true',
+                    help="serve async_app.py with uvicorn")
+args = parser.parse_args()
+
+# Must be set before torch and FAISS start their thread pools; one pool
+# per worker with a thread per core would oversubscribe the CPU
+os.environ.setdefault('OMP_NUM_THREADS', str(args.threads))
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+import logging
+
+import faiss
+import torch
+from werkzeug.serving import make_server
+
+import app as rag_app
+from db import close_pool
+from metrics import set_labels
+from query_log import close_query_log
+
+workers = {}
+stopping = False
+
+
+def rss_mb(pid='self'):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_worker(worker_id, listener):
+    """Worker body: finish startup, then serve until SIGTERM"""
+    def stop(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # /metrics reaches whichever worker takes the request
+    set_labels(worker=worker_id)
+    try:
+        rag_app.start_worker()
+        if args.use_async:
+            serve_async(worker_id, listener)
+        else:
+            server = make_server(args.host, args.port, rag_app.app, threaded=True, fd=listener.fileno())
+            print(f"Worker {worker_id} (pid {os.getpid()}) ready, RSS {rss_mb():.0f} MB")
+            server.serve_forever()
+    except SystemExit:
+        pass
+    finally:
+        # Write queued query logs and new query embeddings before exiting
+        close_query_log()
+        rag_app.save_embedding_cache()
+        close_pool()
+
+
+def serve_async(worker_id, listener):
+    """Run async_app on the shared socket until uvicorn handles SIGTERM"""
+    import uvicorn
+    import async_app
+
+    config = uvicorn.Config(async_app.app, log_level='info' if args.access_log else 'warning',
+                            access_log=args.access_log, timeout_graceful_shutdown=10)
+    server = uvicorn.Server(config)
+    print(f"Worker {worker_id} (pid {os.getpid()}) ready, RSS {rss_mb():.0f} MB")
+    server.run(sockets=[listener])
+
+
+def spawn(worker_id, listener):
+    # Otherwise buffered output is printed again by each child
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(worker_id, listener)
+        finally:
+            os._exit(0)
+    workers[pid] = worker_id
+
+
+def shutdown(signum, frame):
+    global stopping
+    if stopping:
+        return
+    stopping = True
+    print("Stopping workers...")
+    for pid in list(workers):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def main():
+    num_workers = args.workers or os.cpu_count()
+    torch.set_num_threads(args.threads)
+    faiss.omp_set_num_threads(args.threads)
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    print(f"Loading shared state in the master (pid {os.getpid()})...")
+    rag_app.preload()
+    # Keep the garbage collector from touching (and so copying) every
+    # object the workers inherit
+    gc.freeze()
+    print(f"Master RSS after loading: {rss_mb():.0f} MB")
+
+    listener = socket.create_server((args.host, args.port), backlog=1024)
+    print(f"Listening on http://{args.host}:{args.port} with {num_workers} workers")
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for worker_id in range(num_workers):
+        spawn(worker_id, listener)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = workers.pop(pid, None)
+        if worker_id is None or stopping:
+            continue
+        print(f"Worker {worker_id} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(1)
+        spawn(worker_id, listener)
+
+    listener.close()
+    print("All workers stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+-- The log queries of analytical_queries.sql, answered from the rollup
+-- tables that scripts/11_refresh_rollups.py keeps up to date instead of
+-- scanning queries and retrieval_logs. They cover log rows up to
+-- rollup_watermark.refreshed_until. Query 1 only reads documents and has
+-- no variant here.
+
+-- Query 2: Query response success rate over time
+SELECT
+    DATE(hour) as query_date,
+    SUM(queries) as total_queries,
+    SUM(quality_sum) / NULLIF(SUM(quality_count), 0) as avg_quality,
+    SUM(latency_ms_sum)::float / NULLIF(SUM(latency_count), 0) as avg_latency_ms
+FROM query_stats_hourly
+GROUP BY query_date
+ORDER BY query_date DESC;
+
+-- Query 3: Retrieval latency tracking
+-- Percentiles are the lower bound of their histogram bucket (at most 10% low)
+WITH buckets AS (
+    SELECT bucket_ms, SUM(queries) as queries
+    FROM query_latency_daily
+    WHERE metric = 'retrieval'
+    GROUP BY bucket_ms
+),
+cumulative AS (
+    SELECT
+        bucket_ms,
+        SUM(queries) OVER (ORDER BY bucket_ms) as running,
+        SUM(queries) OVER () as total
+    FROM buckets
+),
+totals AS (
+    SELECT
+        SUM(retrieval_ms_sum)::float / NULLIF(SUM(retrieval_count), 0) as avg_retrieval_ms,
+        MIN(retrieval_ms_min) as min_retrieval_ms,
+        MAX(retrieval_ms_max) as max_retrieval_ms
+    FROM query_stats_hourly
+)
+SELECT
+    (SELECT MIN(bucket_ms) FROM cumulative WHERE running >= 0.5 * total) as median_retrieval_ms,
+    (SELECT MIN(bucket_ms) FROM cumulative WHERE running >= 0.95 * total) as p95_retrieval_ms,
+    avg_retrieval_ms,
+    min_retrieval_ms,
+    max_retrieval_ms
+FROM totals;
+
+-- Query 4: Source reliability by category
+-- The rollup stores papers without categories under ''
+WITH by_category AS (
+    SELECT
+        categories,
+        SUM(queries) as times_retrieved,
+        SUM(similarity_sum) / SUM(retrievals) as avg_similarity
+    FROM category_retrievals_daily
+    GROUP BY categories
+),
+papers AS (
+    SELECT COALESCE(d.categories, '') as categories, COUNT(*) as unique_papers
+    FROM document_retrievals dr
+    JOIN documents d ON d.document_id = dr.document_id
+    GROUP BY 1
+)
+SELECT
+    NULLIF(c.categories, '') as categories,
+    c.times_retrieved,
+    c.avg_similarity,
+    COALESCE(p.unique_papers, 0) as unique_papers
+FROM by_category c
+LEFT JOIN papers p ON p.categories = c.categories
+ORDER BY times_retrieved DESC
+LIMIT 20;
+
+-- Query 5: Embedding similarity for responses
+SELECT
+    quality_band as quality_category,
+    SUM(retrievals) as query_count,
+    SUM(similarity_sum) / SUM(retrievals) as avg_similarity,
+    MIN(similarity_min) as min_similarity,
+    MAX(similarity_max) as max_similarity
+FROM rank_retrievals_daily
+WHERE retrieval_rank = 1
+GROUP BY quality_band;
+
+-- Query 6: User interaction frequency by topic
+WITH by_category AS (
+    SELECT
+        categories,
+        SUM(queries) as query_count,
+        SUM(similarity_sum) / SUM(retrievals) as avg_similarity
+    FROM category_retrievals_daily
+    GROUP BY categories
+),
+papers AS (
+    SELECT COALESCE(d.categories, '') as categories, COUNT(*) as unique_docs_retrieved
+    FROM document_retrievals dr
+    JOIN documents d ON d.document_id = dr.document_id
+    GROUP BY 1
+)
+SELECT
+    NULLIF(c.categories, '') as categories,
+    c.query_count,
+    COALESCE(p.unique_docs_retrieved, 0) as unique_docs_retrieved,
+    c.avg_similarity
+FROM by_category c
+LEFT JOIN papers p ON p.categories = c.categories
+ORDER BY query_count DESC
+LIMIT 15;
+
+-- Query 7: Knowledge coverage analysis
+WITH indexed_docs AS (
+    SELECT categories, COUNT(*) as total_indexed
+    FROM documents
+    GROUP BY categories
+),
+retrieved_docs AS (
+    SELECT d.categories, COUNT(*) as total_retrieved
+    FROM document_retrievals dr
+    JOIN documents d ON d.document_id = dr.document_id
+    GROUP BY d.categories
+)
+SELECT
+    i.categories,
+    i.total_indexed,
+    COALESCE(r.total_retrieved, 0) as total_retrieved,
+    ROUND(100.0 * COALESCE(r.total_retrieved, 0) / i.total_indexed, 2) as coverage_pct
+FROM indexed_docs i
+LEFT JOIN retrieved_docs r ON i.categories = r.categories
+ORDER BY coverage_pct DESC
+LIMIT 20;
+
+-- Query 8: Top queries and common intents
+SELECT
+    user_query_text,
+    frequency,
+    latency_ms_sum::float / NULLIF(latency_count, 0) as avg_latency,
+    retrieval_ms_sum::float / NULLIF(retrieval_count, 0) as avg_retrieval_time,
+    generation_ms_sum::float / NULLIF(generation_count, 0) as avg_generation_time
+FROM query_text_stats
+ORDER BY frequency DESC
+LIMIT 20;
+
+-- Query 9: Temporal query patterns
+SELECT
+    EXTRACT(HOUR FROM hour) as hour_of_day,
+    SUM(queries) as query_count,
+    SUM(latency_ms_sum)::float / NULLIF(SUM(latency_count), 0) as avg_latency
+FROM query_stats_hourly
+GROUP BY hour_of_day
+ORDER BY hour_of_day;
+
+-- Query 10: Retrieval rank effectiveness
+SELECT
+    retrieval_rank,
+    SUM(retrievals) as times_at_rank,
+    SUM(similarity_sum) / SUM(retrievals) as avg_similarity,
+    SUM(used_in_response) as used_in_response
+FROM rank_retrievals_daily
+GROUP BY retrieval_rank
+ORDER BY retrieval_rank;
@@ -0,0 +1,55 @@
+"""Startup phase timing and warmup for the retrievers.
+
+Each retriever times its loading phases with StartupTimer, which prints
+them as they finish and keeps them for /ready and /stats. warm_up() runs
+one query end to end before the retriever is reported ready, so the first
+real request does not pay for lazy initialisation in torch, FAISS or the
+page cache.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+WARMUP_QUERY = "transformer models for natural language processing"
+
+
+class StartupTimer:
+    def __init__(self):
+        self.phases = {}
+        self.current = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        self.current = name
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.phases[name] = round(elapsed, 3)
+        print(f"  {name}: {elapsed:.2f}s")
+
+    def finish(self):
+        self.current = None
+        self.phases['total'] = round(time.perf_counter() - self._start, 3)
+        print(f"  startup total: {self.phases['total']:.2f}s")
+        return self.phases
+
+    def stats(self):
+        with self._lock:
+            return dict(self.phases)
+
+
+def warm_up(retriever, top_k=5):
+    """Encode, search and hydrate one query through the retriever's normal path.
+
+    A failure (say, the database is still starting) is reported but does not
+    stop startup; the first real request then pays for what was not warmed.
+    """
+    try:
+        distances, indices = retriever.encoder.search(WARMUP_QUERY, top_k)
+        return retriever.hydrate(distances, indices)
+    except Exception as e:
+        print(f"Warmup query failed: {e}")
+        return None
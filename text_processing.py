@@ -0,0 +1,153 @@
+"""Abstract cleaning and chunking shared by 04_text_preprocessing.py and
+the incremental updater.
+
+Chunks are sized in word-pieces of the embedding model's own tokenizer, so
+none of a chunk's text is cut off when the model truncates its input.
+chunk_batches() spreads batches of papers over worker processes, each with
+its own tokenizer and TokenCounter.
+"""
+import os
+import re
+from collections import deque
+from multiprocessing import Pool
+
+import pandas as pd
+from transformers import AutoTokenizer
+
+from config import EMBEDDING_MODEL, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_WORDS
+
+LATEX_WITH_ARGUMENT = re.compile(r'\\[a-zA-Z]+\{[^}]*\}')
+LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+')
+# Runs of whitespace and unsupported characters become a single space
+SEPARATORS = re.compile(r'[^a-zA-Z0-9.,!?;:\-]+')
+
+
+def clean_text(text):
+    """Clean abstract text"""
+    if pd.isna(text):
+        return ""
+
+    # Remove LaTeX commands
+    text = LATEX_WITH_ARGUMENT.sub('', text)
+    text = LATEX_COMMAND.sub('', text)
+
+    # Keep letters, digits and basic punctuation, with single spaces between words
+    return SEPARATORS.sub(' ', text).strip()
+
+
+def load_tokenizer(model_name=EMBEDDING_MODEL):
+    """The embedding model's tokenizer, resolved like SentenceTransformer resolves names"""
+    if not os.path.isdir(model_name) and '/' not in model_name:
+        model_name = 'sentence-transformers/' + model_name
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # Whole abstracts are tokenized; the saved tokenizer may truncate or pad
+    tokenizer.backend_tokenizer.no_truncation()
+    tokenizer.backend_tokenizer.no_padding()
+    return tokenizer
+
+
+def chunk_text(words, token_counts, max_tokens, overlap=CHUNK_OVERLAP_TOKENS):
+    """Split words into overlapping chunks of at most max_tokens word-pieces.
+
+    `token_counts` holds each word's number of tokens. A word longer than
+    max_tokens becomes a chunk of its own. Returns (chunk, token_count) pairs.
+    """
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = start
+        tokens = 0
+        while end < len(words) and (end == start or tokens + token_counts[end] <= max_tokens):
+            tokens += token_counts[end]
+            end += 1
+
+        if end - start > CHUNK_MIN_WORDS:
+            chunks.append((' '.join(words[start:end]), tokens))
+        if end == len(words):
+            break
+
+        # Step back over up to `overlap` tokens for the next chunk
+        next_start = end
+        carried = 0
+        while next_start - 1 > start and carried + token_counts[next_start - 1] <= overlap:
+            next_start -= 1
+            carried += token_counts[next_start]
+        start = next_start
+
+    return chunks
+
+
+class TokenCounter:
+    """Word-piece counts per word, memoized.
+
+    BERT-style tokenizers split on whitespace before word-piece
+    segmentation, so a text's token count is the sum over its words and
+    only words not seen before need tokenizing.
+    """
+
+    def __init__(self, tokenizer, max_cached=1000000):
+        self.tokenizer = tokenizer
+        self.max_cached = max_cached
+        self.cache = {}
+
+    def count(self, words):
+        missing = list({word for word in words if word not in self.cache})
+        if missing:
+            if len(self.cache) + len(missing) > self.max_cached:
+                self.cache.clear()
+            encodings = self.tokenizer.backend_tokenizer.encode_batch(missing, add_special_tokens=False)
+            self.cache.update(zip(missing, (len(encoding.ids) for encoding in encodings)))
+        return [self.cache[word] for word in words]
+
+
+def chunk_papers(document_ids, abstracts, counter, max_tokens=CHUNK_MAX_TOKENS):
+    """Chunk rows (document_id, chunk_text, chunk_index, token_count) for a batch of papers"""
+    papers = [clean_text(abstract).split() for abstract in abstracts]
+    counts = counter.count([word for words in papers for word in words])
+    # max_tokens counts the [CLS]/[SEP] tokens the model adds around each chunk
+    max_tokens -= counter.tokenizer.num_special_tokens_to_add()
+
+    rows = []
+    offset = 0
+    for document_id, words in zip(document_ids, papers):
+        token_counts = counts[offset:offset + len(words)]
+        offset += len(words)
+        for chunk_index, (chunk, token_count) in enumerate(chunk_text(words, token_counts, max_tokens)):
+            rows.append((document_id, chunk, chunk_index, token_count))
+    return rows
+
+
+_counter = None
+
+
+def _init_worker(model_name):
+    global _counter
+    _counter = TokenCounter(load_tokenizer(model_name))
+
+
+def _chunk_batch(batch):
+    document_ids, abstracts = batch
+    return chunk_papers(document_ids, abstracts, _counter)
+
+
+def chunk_batches(batches, workers, model_name=EMBEDDING_MODEL):
+    """Yield chunk rows for each (document_ids, abstracts) batch, in order.
+
+    With more than one worker, batches are processed in a process pool
+    with a couple of batches per worker in flight, so results are consumed
+    about as fast as they are produced.
+    """
+    if workers <= 1:
+        counter = TokenCounter(load_tokenizer(model_name))
+        for document_ids, abstracts in batches:
+            yield chunk_papers(document_ids, abstracts, counter)
+        return
+
+    with Pool(workers, initializer=_init_worker, initargs=(model_name,)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_chunk_batch, (batch,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
@@ -0,0 +1,595 @@
+"""Build, save and load FAISS indexes described by an index spec.
+
+An index spec is a dict with a 'type' (flat, ivf, hnsw, ivfpq), the
+'encoding' its vectors are stored in (float32, fp16, sq8, pq), its build
+parameters and the search-time knobs (nprobe, efSearch, rescore). The spec
+is saved next to the index so retrievers can apply the same knobs on load.
+
+Compressed encodings trade recall for memory. With 'rescore' set, the
+index returns rescore * k candidates and RescoredIndex re-ranks them with
+the float32 vectors of the memory-mapped embeddings.npy, so only the rows
+that are actually re-ranked are read from disk.
+
+Vectors are labelled with their row position in chunk_ids.pkl /
+embeddings.npy. Flat and HNSW indexes are wrapped in an IndexIDMap and IVF
+indexes store the labels themselves, so update_index() can remove and
+append vectors without renumbering: removed chunks stay in chunk_ids as
+tombstones that the index no longer returns.
+
+A sharded index splits the vectors over several index files (by chunk id
+hash, or by paper year or category). Each shard keeps the global row
+positions as labels, so ShardedIndex searches every shard on its own
+thread and merging their top-k lists gives the global top-k directly.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from config import (EMBEDDINGS_PATH, CHUNK_IDS_PATH, CHUNK_IDS_ARRAY_PATH, FAISS_INDEX_PATH,
+                    FAISS_INDEX_META_PATH, FAISS_SHARD_DIR, INDEX_MANIFEST_PATH)
+
+INDEX_TYPES = ['flat', 'ivf', 'hnsw', 'ivfpq']
+ENCODINGS = ['float32', 'fp16', 'sq8', 'pq']
+SHARD_KEYS = ['hash', 'year', 'category']
+
+SCALAR_QUANTIZERS = {
+    'fp16': faiss.ScalarQuantizer.QT_fp16,
+    'sq8': faiss.ScalarQuantizer.QT_8bit
+}
+
+DEFAULT_SPEC = {
+    'type': 'flat',
+    'nlist': 4096,
+    'pq_m': 48,
+    'pq_nbits': 8,
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'encoding': 'float32',
+    'nprobe': 32,
+    'ef_search': 64,
+    'rescore': 0
+}
+
+# Training on more than this many points per centroid buys little accuracy
+# (for PQ, per centroid of each sub-quantizer)
+TRAIN_POINTS_PER_CENTROID = 256
+
+
+def make_spec(index_type='flat', **params):
+    """Return a full index spec, filling unspecified parameters with defaults"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    spec = dict(DEFAULT_SPEC)
+    spec.update({k: v for k, v in params.items() if v is not None})
+    spec['type'] = index_type
+    if index_type == 'ivfpq':
+        spec['encoding'] = 'pq'
+    if spec['encoding'] not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{spec['encoding']}', expected one of {ENCODINGS}")
+    # The graph is walked on PQ distances, which misrank close neighbours:
+    # bench_ann measures recall@10 of 0.05-0.14 (0.11-0.32 rescored x4) at
+    # efSearch 16-256, while the graph links keep it at ~340 bytes/vector
+    if index_type == 'hnsw' and spec['encoding'] == 'pq':
+        raise ValueError("HNSW with pq vectors has too little recall to serve; use sq8 or fp16 "
+                         "vectors with hnsw, or pq with ivf and rescoring")
+    return spec
+
+
+def vector_encoding(spec):
+    """How the spec stores vectors; specs saved before encodings existed are float32"""
+    if spec['type'] == 'ivfpq':
+        return 'pq'
+    return spec.get('encoding', 'float32')
+
+
+def build_index(embeddings, spec, seed=42, ids=None):
+    """Build and populate an inner-product index for normalized embeddings.
+
+    Vectors are labelled with `ids`, by default their row positions.
+    """
+    dimension = embeddings.shape[1]
+    index_type = spec['type']
+    encoding = vector_encoding(spec)
+    metric = faiss.METRIC_INNER_PRODUCT
+    num_train = min(len(embeddings), 2 ** spec['pq_nbits'] * TRAIN_POINTS_PER_CENTROID)
+
+    if index_type == 'flat':
+        if encoding == 'float32':
+            index = faiss.IndexFlatIP(dimension)
+        elif encoding == 'pq':
+            index = faiss.IndexPQ(dimension, spec['pq_m'], spec['pq_nbits'], metric)
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZERS[encoding], metric)
+        index = faiss.IndexIDMap(index)
+    elif index_type == 'hnsw':
+        if encoding == 'float32':
+            hnsw = faiss.IndexHNSWFlat(dimension, spec['hnsw_m'], metric)
+        elif encoding == 'pq':
+            hnsw = faiss.IndexHNSWPQ(dimension, spec['pq_m'], spec['hnsw_m'], spec['pq_nbits'], metric)
+        else:
+            hnsw = faiss.IndexHNSWSQ(dimension, SCALAR_QUANTIZERS[encoding], spec['hnsw_m'], metric)
+        hnsw.hnsw.efConstruction = spec['ef_construction']
+        index = faiss.IndexIDMap(hnsw)
+    else:
+        nlist = min(spec['nlist'], len(embeddings))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if encoding == 'float32':
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        elif encoding == 'pq':
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, spec['pq_m'], spec['pq_nbits'], metric)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist,
+                                                  SCALAR_QUANTIZERS[encoding], metric)
+        num_train = min(len(embeddings), max(num_train, nlist * TRAIN_POINTS_PER_CENTROID))
+
+    # Train the centroids, PQ codebooks or scalar ranges on a random sample
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), num_train, replace=False))]
+        index.train(np.ascontiguousarray(sample, dtype='float32'))
+
+    if ids is None:
+        ids = np.arange(len(embeddings), dtype=np.int64)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    apply_search_params(index, spec)
+    return index
+
+
+def base_index(index):
+    """The index inside an IndexIDMap, or the index itself"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def apply_search_params(index, spec):
+    """Set nprobe / efSearch on an index according to its spec"""
+    if isinstance(index, ShardedIndex):
+        for shard in index.shards:
+            apply_search_params(shard, spec)
+    elif spec['type'] in ('ivf', 'ivfpq'):
+        faiss.extract_index_ivf(index).nprobe = spec['nprobe']
+    elif spec['type'] == 'hnsw':
+        base_index(index).hnsw.efSearch = spec['ef_search']
+
+
+def supports_updates(index):
+    """False for indexes built before vectors were labelled (positions implied by order)"""
+    if isinstance(index, ShardedIndex):
+        return False
+    index = faiss.downcast_index(index)
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF))
+
+
+def update_index(index, spec, chunk_ids, removed_chunk_ids, added_chunk_ids, added_embeddings):
+    """Remove and append vectors in place, keeping labels aligned with chunk_ids.
+
+    `added_embeddings` must be normalized. Removed chunks stay in chunk_ids
+    as tombstones; added chunks get new positions at the end. Labels past
+    the end of chunk_ids, left by an update that stopped before saving
+    chunk_ids, are dropped first. IVF centroids are not retrained, so a
+    periodic full rebuild keeps the lists balanced.
+    Returns the new chunk_ids list and the number of vectors removed.
+    """
+    if isinstance(index, ShardedIndex):
+        raise ValueError("Sharded indexes are not updated in place; rebuild with 06_build_faiss_index.py")
+    if not supports_updates(index):
+        raise ValueError("Index has no vector labels; rebuild it with 06_build_faiss_index.py")
+
+    positions = {chunk_id: pos for pos, chunk_id in enumerate(chunk_ids)}
+    removed = np.array([positions[c] for c in removed_chunk_ids if c in positions], dtype=np.int64)
+    end = len(chunk_ids)
+
+    num_removed = 0
+    if spec['type'] == 'hnsw':
+        if len(removed) or index.ntotal > end:
+            raise ValueError("HNSW indexes cannot remove vectors; rebuild with 06_build_faiss_index.py")
+    else:
+        index.remove_ids(faiss.IDSelectorRange(end, np.iinfo(np.int64).max))
+        if len(removed):
+            num_removed = index.remove_ids(removed)
+
+    added_ids = np.arange(end, end + len(added_chunk_ids), dtype=np.int64)
+    if len(added_ids):
+        index.add_with_ids(np.ascontiguousarray(added_embeddings, dtype='float32'), added_ids)
+
+    return list(chunk_ids) + [int(c) for c in added_chunk_ids], num_removed
+
+
+def open_embeddings(num_rows, path=EMBEDDINGS_PATH):
+    """Memory-map the float32 embeddings if they line up with the index positions, else None"""
+    if not os.path.exists(path):
+        return None
+    embeddings = np.load(path, mmap_mode='r')
+    if len(embeddings) != num_rows:
+        print("embeddings.npy does not match chunk_ids, exact re-scoring is disabled")
+        return None
+    return embeddings
+
+
+def rescore(embeddings, queries, labels, k):
+    """Re-rank candidate labels by exact cosine similarity; returns (distances, indices)"""
+    distances = np.full((len(queries), k), -np.inf, dtype='float32')
+    indices = np.full((len(queries), k), -1, dtype='int64')
+    for row in range(len(queries)):
+        candidates = labels[row][labels[row] >= 0]
+        if len(candidates) == 0:
+            continue
+        # Sorted reads are kinder to the page cache than hit order
+        candidates = np.sort(candidates)
+        vectors = np.asarray(embeddings[candidates], dtype='float32')
+        norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+        scores = (vectors @ queries[row]) / np.maximum(norms, 1e-12)
+        best = np.argsort(-scores)[:k]
+        distances[row, :len(best)] = scores[best]
+        indices[row, :len(best)] = candidates[best]
+    return distances, indices
+
+
+class RescoredIndex:
+    """Search a compressed index for rescore * k candidates and re-rank them exactly.
+
+    Wraps search() only; the underlying FAISS index is `self.index`.
+    """
+
+    def __init__(self, index, embeddings, factor):
+        self.index = index
+        self.embeddings = embeddings
+        self.factor = factor
+        self.d = index.d
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def search(self, queries, k, params=None):
+        _, labels = self.index.search(queries, k * self.factor, params=params)
+        return rescore(self.embeddings, queries, labels, k)
+
+
+def make_searcher(index, spec, embeddings):
+    """The index, wrapped in RescoredIndex if the spec asks for re-scoring and embeddings exist"""
+    if spec.get('rescore') and embeddings is not None:
+        return RescoredIndex(index, embeddings, spec['rescore'])
+    return index
+
+
+def shard_assignments(chunk_ids, num_shards, by='hash', attributes=None):
+    """Shard number per row position, and the years or categories each shard holds.
+
+    'hash' spreads chunks evenly by a hash of their chunk id. 'year' and
+    'category' keep every paper year or category within one shard, placing
+    the largest first on the emptiest shard, so filtered queries touch
+    related vectors together; they need the positions' ChunkAttributes. A
+    chunk whose paper lists several categories goes with the largest one.
+    """
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    if by == 'hash':
+        # Fibonacci hashing, so runs of consecutive ids land on different shards
+        hashed = (chunk_ids.astype(np.uint64) * np.uint64(11400714819323198485)) >> np.uint64(32)
+        return (hashed % np.uint64(num_shards)).astype(np.int32), [[] for _ in range(num_shards)]
+    if by not in SHARD_KEYS:
+        raise ValueError(f"Unknown shard key '{by}', expected one of {SHARD_KEYS}")
+    if attributes is None:
+        raise ValueError(f"Sharding by {by} needs the chunk attributes")
+
+    if by == 'year':
+        known = attributes.dates != np.iinfo(np.int32).min
+        years = (np.asarray(attributes.dates, dtype='datetime64[D]')
+                 .astype('datetime64[Y]').astype(np.int64) + 1970)
+        names = [str(year) for year in np.unique(years[known])]
+        codes = np.full(len(chunk_ids), len(names), dtype=np.int64)
+        codes[known] = np.searchsorted(np.unique(years[known]), years[known])
+        names.append('unknown')
+    else:
+        offsets = attributes.category_offsets
+        names = attributes.category_names + ['none']
+        codes = np.full(len(chunk_ids), len(names) - 1, dtype=np.int64)
+        assigned = np.zeros(len(chunk_ids), dtype=bool)
+        for i in np.argsort(-np.diff(offsets), kind='stable'):
+            positions = np.asarray(attributes.category_positions[offsets[i]:offsets[i + 1]])
+            positions = positions[~assigned[positions]]
+            codes[positions] = i
+            assigned[positions] = True
+
+    counts = np.bincount(codes, minlength=len(names))
+    if np.count_nonzero(counts) < num_shards:
+        raise ValueError(f"Only {np.count_nonzero(counts)} distinct values of {by} "
+                         f"for {num_shards} shards")
+    loads = np.zeros(num_shards, dtype=np.int64)
+    shard_of_key = np.zeros(len(names), dtype=np.int32)
+    keys = [[] for _ in range(num_shards)]
+    for key in np.argsort(-counts, kind='stable'):
+        if counts[key] == 0:
+            break
+        shard = int(np.argmin(loads))
+        shard_of_key[key] = shard
+        loads[shard] += counts[key]
+        keys[shard].append(names[key])
+    return shard_of_key[codes], keys
+
+
+def build_sharded_index(embeddings, spec, assignments, seed=42):
+    """One index per shard over its rows, labelled with their global positions.
+
+    IVF shards get nlist in proportion to their size, so their lists are
+    as long as in a single index; nprobe applies to each shard.
+    """
+    shards = []
+    for shard in range(int(assignments.max()) + 1):
+        positions = np.flatnonzero(assignments == shard)
+        shard_spec = dict(spec)
+        if spec['type'] in ('ivf', 'ivfpq'):
+            shard_spec['nlist'] = max(1, round(spec['nlist'] * len(positions) / len(embeddings)))
+        shards.append(build_index(np.ascontiguousarray(embeddings[positions], dtype='float32'),
+                                  shard_spec, seed, ids=positions))
+    return ShardedIndex(shards)
+
+
+def merge_results(results, k):
+    """Global top-k from per-shard (distances, labels), highest similarity first"""
+    distances = np.hstack([d for d, _ in results])
+    labels = np.hstack([l for _, l in results])
+    distances = np.where(labels >= 0, distances, -np.inf)
+    order = np.argsort(-distances, axis=1, kind='stable')[:, :k]
+    return (np.take_along_axis(distances, order, axis=1).astype('float32'),
+            np.take_along_axis(labels, order, axis=1))
+
+
+SEARCH_PARAMETER_FIELDS = ['sel', 'nprobe', 'max_codes', 'efSearch', 'check_relative_distance',
+                           'bounded_queue']
+
+
+def copy_search_params(params):
+    """A shallow copy of FAISS SearchParameters (IndexIDMap swaps `sel` during a search)"""
+    copy = type(params)()
+    for name in SEARCH_PARAMETER_FIELDS:
+        if hasattr(params, name):
+            setattr(copy, name, getattr(params, name))
+    return copy
+
+
+class ShardedIndex:
+    """Indexes over disjoint rows, searched in parallel and merged as one index.
+
+    Shards label their vectors with global row positions, so the merged
+    labels need no translation. Each shard is searched on its own pool
+    thread (FAISS releases the GIL). The pool is started on first use in
+    each process, so pre-forked workers do not inherit dead threads.
+    """
+
+    def __init__(self, shards, parallel=True):
+        self.shards = list(shards)
+        self.parallel = parallel and len(self.shards) > 1
+        self.d = self.shards[0].d
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards)
+
+    def _executor(self):
+        if self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(len(self.shards), thread_name_prefix='faiss-shard')
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def search(self, queries, k, params=None):
+        if self.parallel:
+            # Shards must not share a params object across threads
+            results = list(self._executor().map(
+                lambda shard: shard.search(queries, k, params=params and copy_search_params(params)),
+                self.shards))
+        else:
+            results = [shard.search(queries, k, params=params) for shard in self.shards]
+        return merge_results(results, k)
+
+
+def write_embeddings(path, start, embeddings):
+    """Replace the rows of an .npy file from `start` on, atomically"""
+    existing = np.load(path, mmap_mode='r')
+    tmp_path = path + '.tmp'
+    combined = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=existing.dtype,
+        shape=(start + len(embeddings), existing.shape[1]))
+
+    step = 100000
+    for row in range(0, start, step):
+        combined[row:min(row + step, start)] = existing[row:min(row + step, start)]
+    combined[start:] = embeddings
+    combined.flush()
+
+    del combined, existing
+    os.replace(tmp_path, path)
+
+
+def index_memory_bytes(index):
+    """Approximate in-memory size of an index from its serialized form"""
+    if isinstance(index, ShardedIndex):
+        return sum(index_memory_bytes(shard) for shard in index.shards)
+    return faiss.serialize_index(index).nbytes
+
+
+def index_report(index, spec, embeddings, num_queries=500, k=10, seed=0):
+    """Memory per vector, recall@k against exact search and single-query latency.
+
+    `embeddings` must be normalized and in RAM. Queries are perturbed
+    corpus vectors. With 'rescore' in the spec, the re-scored search is
+    reported as well.
+    """
+    rng = np.random.default_rng(seed)
+    num_queries = min(num_queries, len(embeddings))
+    queries = embeddings[rng.choice(len(embeddings), num_queries, replace=False)] + \
+        0.05 * rng.standard_normal((num_queries, embeddings.shape[1])).astype('float32')
+    faiss.normalize_L2(queries)
+    _, truth = faiss.knn(queries, embeddings, k, metric=faiss.METRIC_INNER_PRODUCT)
+
+    def measure(searcher):
+        latencies = []
+        recalls = []
+        for i in range(num_queries):
+            start = time.perf_counter()
+            _, labels = searcher.search(queries[i:i + 1], k)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(labels[0]) & set(truth[i])) / k)
+        latencies = np.array(latencies) * 1000
+        return {
+            'recall_at_k': round(float(np.mean(recalls)), 4),
+            'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'latency_p95_ms': round(float(np.percentile(latencies, 95)), 3)
+        }
+
+    report = {
+        'type': spec['type'],
+        'encoding': vector_encoding(spec),
+        'vectors': int(index.ntotal),
+        'bytes_per_vector': round(index_memory_bytes(index) / max(index.ntotal, 1), 1),
+        'float32_bytes_per_vector': 4 * embeddings.shape[1],
+        'k': k,
+        'queries': num_queries,
+        'search': measure(index)
+    }
+    if spec.get('rescore'):
+        report['rescore'] = spec['rescore']
+        report['rescored_search'] = measure(RescoredIndex(index, embeddings, spec['rescore']))
+    return report
+
+
+def save_index(index, spec, path=FAISS_INDEX_PATH, meta_path=FAISS_INDEX_META_PATH):
+    """Write the index and a JSON file recording which spec built it.
+
+    The index is written to a temporary file and renamed into place, so a
+    server that has the old file memory-mapped keeps reading the old one.
+    """
+    faiss.write_index(index, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    meta = dict(spec)
+    meta['ntotal'] = int(index.ntotal)
+    meta['dimension'] = int(index.d)
+    meta['built_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def save_sharded_index(index, spec, shard_by, shard_keys, shard_dir=FAISS_SHARD_DIR,
+                       meta_path=FAISS_INDEX_META_PATH):
+    """Write each shard to its own file and record them in the index spec.
+
+    Shard files are replaced atomically like save_index; files left over
+    from a build with more shards are removed.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    for i, (shard, keys) in enumerate(zip(index.shards, shard_keys)):
+        path = os.path.join(shard_dir, f"shard_{i:03d}.bin")
+        faiss.write_index(shard, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        shard_info = {'path': path, 'ntotal': int(shard.ntotal), 'keys': keys}
+        if spec['type'] in ('ivf', 'ivfpq'):
+            shard_info['nlist'] = int(faiss.extract_index_ivf(shard).nlist)
+        shards.append(shard_info)
+    current = {shard['path'] for shard in shards}
+    for name in os.listdir(shard_dir):
+        path = os.path.join(shard_dir, name)
+        if name.startswith('shard_') and name.endswith('.bin') and path not in current:
+            os.remove(path)
+
+    meta = dict(spec)
+    meta['ntotal'] = int(index.ntotal)
+    meta['dimension'] = int(index.d)
+    meta['shard_by'] = shard_by
+    meta['shards'] = shards
+    meta['built_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_index_file(path, mmap=False):
+    if mmap:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path)
+
+
+def load_index_meta(meta_path=FAISS_INDEX_META_PATH):
+    """Read the index spec, treating a missing file as a flat index"""
+    if not os.path.exists(meta_path):
+        return make_spec('flat')
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_index(path=FAISS_INDEX_PATH, meta_path=FAISS_INDEX_META_PATH, mmap=False, **overrides):
+    """Read an index and apply the search-time knobs recorded at build time.
+
+    With mmap=True the vectors (flat codes and IVF lists) are memory-mapped
+    read-only instead of read into RAM: loading is near-instant, pages are
+    read on first use and shared by all processes serving the same file.
+    A memory-mapped index cannot be updated. Keyword overrides
+    (nprobe=..., ef_search=...) take precedence over the saved values.
+    If the spec lists shards, they are loaded into a ShardedIndex.
+    """
+    meta = load_index_meta(meta_path)
+    meta.update({k: v for k, v in overrides.items() if v is not None})
+    if meta.get('shards'):
+        index = ShardedIndex([read_index_file(shard['path'], mmap) for shard in meta['shards']])
+    else:
+        index = read_index_file(path, mmap)
+    apply_search_params(index, meta)
+    return index, meta
+
+
+def save_manifest(manifest, path=INDEX_MANIFEST_PATH):
+    """Record which snapshot and chunk set the index reflects"""
+    manifest = dict(manifest)
+    manifest['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(path=INDEX_MANIFEST_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_chunk_ids_array(chunk_ids, path=CHUNK_IDS_ARRAY_PATH):
+    """Write chunk_ids.npy atomically, so memory-mapped readers are not cut short"""
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, np.asarray(chunk_ids, dtype=np.int64))
+    os.replace(path + '.tmp', path)
+
+
+def load_chunk_ids(mmap=True):
+    """FAISS row position -> chunk_id, as an int64 array.
+
+    Memory-maps chunk_ids.npy when the index manifest confirms it holds the
+    indexed chunk set. Otherwise (no manifest, or an update stopped between
+    the two files) chunk_ids.pkl, which 05 and 09 write as their commit
+    point, is unpickled.
+    """
+    manifest = load_manifest()
+    if mmap and manifest and os.path.exists(CHUNK_IDS_ARRAY_PATH):
+        chunk_ids = np.load(CHUNK_IDS_ARRAY_PATH, mmap_mode='r')
+        if len(chunk_ids) == manifest.get('chunk_ids'):
+            return chunk_ids
+        print("chunk_ids.npy does not match the index manifest, loading chunk_ids.pkl")
+
+    with open(CHUNK_IDS_PATH, 'rb') as f:
+        return np.asarray(pickle.load(f), dtype=np.int64)